@@ -0,0 +1,251 @@
+# air_index.py
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from agents.context_encoder import POLLUTANT_COLUMNS
+
+# Rata-rata bergulir dianggap sah jika minimal fraksi ini dari jendelanya berisi data
+# (EPA: 75%); jam awal seri yang belum cukup data -> sub-indeks NaN
+INDEX_MIN_COVERAGE = float(os.getenv("INDEX_MIN_COVERAGE", "0.75"))
+
+# Konversi ppm/ppb -> µg/m³ pada 25 °C, 1 atm (berat molekul / 24.45)
+_UG_PER_PPB = {"ozone": 1.963, "carbon_monoxide": 1.145, "sulphur_dioxide": 2.620, "nitrogen_dioxide": 1.882}
+
+
+@dataclass(frozen=True)
+class IndexScale:
+    """
+    Satu skala indeks: titik patah (konsentrasi µg/m³ -> nilai indeks) per polutan,
+    jam rata-rata per polutan, dan batas atas tiap kategori beserta label & warna.
+    Titik patah ditulis berpasangan (C_lo, I_lo), (C_hi, I_hi) per band; celah antar band
+    (mis. 9.0 -> 9.1 pada PM2.5 EPA) diinterpolasi linear sehingga tidak perlu pembulatan.
+    """
+    name: str
+    column: str
+    breakpoints: Dict[str, Tuple[Tuple[float, ...], Tuple[float, ...]]]
+    averaging_hours: Dict[str, int]
+    category_bounds: Tuple[float, ...]  # batas atas kategori (kecuali kategori terakhir)
+    categories: Tuple[str, ...]
+    colors: Tuple[str, ...]
+
+
+def _bands(concentration: List[Tuple[float, float]], index: List[Tuple[float, float]],
+           factor: float = 1.0) -> Tuple[Tuple[float, ...], Tuple[float, ...]]:
+    """Daftar band (lo, hi) -> titik patah datar untuk interpolasi; factor mengubah satuan ke µg/m³."""
+    xs, ys = [], []
+    for (c_lo, c_hi), (i_lo, i_hi) in zip(concentration, index):
+        if xs and c_lo * factor <= xs[-1]:
+            xs[-1], ys[-1] = c_lo * factor, i_lo  # band bersambung: titik yang sama
+        else:
+            xs.append(c_lo * factor)
+            ys.append(i_lo)
+        xs.append(c_hi * factor)
+        ys.append(i_hi)
+    return tuple(xs), tuple(ys)
+
+
+# ISPU — Permen LHK No. P.14/2020 (µg/m³; PM & SO2 24 jam, CO 8 jam, O3 & NO2 1 jam)
+_ISPU_LEVELS = [(0, 50), (50, 100), (100, 200), (200, 300), (300, 500)]
+ISPU = IndexScale(
+    name="ISPU",
+    column="ispu",
+    breakpoints={
+        "pm10": _bands([(0, 50), (50, 150), (150, 350), (350, 420), (420, 500)], _ISPU_LEVELS),
+        "pm2_5": _bands([(0, 15.5), (15.5, 55.4), (55.4, 150.4), (150.4, 250.4), (250.4, 500)], _ISPU_LEVELS),
+        "sulphur_dioxide": _bands([(0, 52), (52, 180), (180, 400), (400, 800), (800, 1200)], _ISPU_LEVELS),
+        "carbon_monoxide": _bands([(0, 4000), (4000, 8000), (8000, 15000), (15000, 30000), (30000, 45000)],
+                                  _ISPU_LEVELS),
+        "ozone": _bands([(0, 120), (120, 235), (235, 400), (400, 800), (800, 1000)], _ISPU_LEVELS),
+        "nitrogen_dioxide": _bands([(0, 80), (80, 200), (200, 1130), (1130, 2260), (2260, 3000)], _ISPU_LEVELS),
+    },
+    averaging_hours={"pm10": 24, "pm2_5": 24, "sulphur_dioxide": 24, "carbon_monoxide": 8,
+                     "ozone": 1, "nitrogen_dioxide": 1},
+    category_bounds=(50, 100, 200, 300),
+    categories=("Baik", "Sedang", "Tidak Sehat", "Sangat Tidak Sehat", "Berbahaya"),
+    colors=("#2e7d32", "#1e88e5", "#fdd835", "#e53935", "#212121"),
+)
+
+# US AQI — EPA (revisi PM2.5 2024); O3 & CO dalam ppm, SO2 & NO2 dalam ppb (dikonversi ke µg/m³)
+_AQI_LEVELS = [(0, 50), (51, 100), (101, 150), (151, 200), (201, 300), (301, 500)]
+US_AQI = IndexScale(
+    name="US AQI",
+    column="us_aqi",
+    breakpoints={
+        "pm2_5": _bands([(0, 9.0), (9.1, 35.4), (35.5, 55.4), (55.5, 125.4), (125.5, 225.4), (225.5, 325.4)],
+                        _AQI_LEVELS),
+        "pm10": _bands([(0, 54), (55, 154), (155, 254), (255, 354), (355, 424), (425, 604)], _AQI_LEVELS),
+        # O3 8 jam hanya terdefinisi s.d. 0.200 ppm; band terakhir memakai batas O3 1 jam
+        "ozone": _bands([(0, 0.054), (0.055, 0.070), (0.071, 0.085), (0.086, 0.105), (0.106, 0.200),
+                         (0.405, 0.604)], _AQI_LEVELS, 1000 * _UG_PER_PPB["ozone"]),
+        "carbon_monoxide": _bands([(0, 4.4), (4.5, 9.4), (9.5, 12.4), (12.5, 15.4), (15.5, 30.4), (30.5, 50.4)],
+                                  _AQI_LEVELS, 1000 * _UG_PER_PPB["carbon_monoxide"]),
+        "sulphur_dioxide": _bands([(0, 35), (36, 75), (76, 185), (186, 304), (305, 604), (605, 1004)],
+                                  _AQI_LEVELS, _UG_PER_PPB["sulphur_dioxide"]),
+        "nitrogen_dioxide": _bands([(0, 53), (54, 100), (101, 360), (361, 649), (650, 1249), (1250, 2049)],
+                                   _AQI_LEVELS, _UG_PER_PPB["nitrogen_dioxide"]),
+    },
+    averaging_hours={"pm10": 24, "pm2_5": 24, "sulphur_dioxide": 1, "carbon_monoxide": 8,
+                     "ozone": 8, "nitrogen_dioxide": 1},
+    category_bounds=(50, 100, 150, 200, 300),
+    categories=("Baik", "Sedang", "Tidak Sehat (Sensitif)", "Tidak Sehat", "Sangat Tidak Sehat", "Berbahaya"),
+    colors=("#00e400", "#ffff00", "#ff7e00", "#ff0000", "#8f3f97", "#7e0023"),
+)
+
+SCALES = (ISPU, US_AQI)
+NO_DATA = "Tidak ada data"
+NO_DATA_COLOR = "#9e9e9e"
+
+
+def rolling_means(values: np.ndarray, windows: np.ndarray, min_coverage: float = INDEX_MIN_COVERAGE) -> np.ndarray:
+    """
+    Rata-rata bergulir ke belakang sepanjang sumbu jam untuk array (..., jam, polutan)
+    dengan jendela berbeda per polutan, sekaligus lewat cumulative sum (NaN diabaikan).
+    """
+    valid = ~np.isnan(values)
+    zero = np.zeros(values.shape[:-2] + (1, values.shape[-1]))
+    sums = np.concatenate([zero, np.cumsum(np.where(valid, values, 0.0), axis=-2)], axis=-2)
+    counts = np.concatenate([zero, np.cumsum(valid, axis=-2)], axis=-2)
+
+    n_hours = values.shape[-2]
+    end = np.arange(1, n_hours + 1)[:, None]  # (jam, 1)
+    start = np.maximum(end - windows[None, :], 0)  # (jam, polutan)
+    shape = values.shape[:-2] + start.shape
+    window_sum = sums.take(end[:, 0], axis=-2) - np.take_along_axis(sums, np.broadcast_to(start, shape), axis=-2)
+    window_n = counts.take(end[:, 0], axis=-2) - np.take_along_axis(counts, np.broadcast_to(start, shape), axis=-2)
+    needed = np.maximum(1, np.ceil(windows * min_coverage))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_n >= needed, window_sum / window_n, np.nan)
+
+
+def sub_indices(values: np.ndarray, pollutants: List[str], scale: IndexScale = ISPU) -> np.ndarray:
+    """
+    Sub-indeks untuk array konsentrasi (..., jam, polutan) dalam µg/m³ — semua area,
+    jam, dan polutan dalam satu operasi (rata-rata bergulir lalu interpolasi titik patah).
+    Polutan tanpa titik patah di skala -> NaN.
+    """
+    values = np.asarray(values, dtype="float64")
+    windows = np.array([scale.averaging_hours.get(p, 1) for p in pollutants])
+    averaged = rolling_means(values, windows)
+
+    # Matriks titik patah (polutan x knot), dipad +inf agar panjang sama
+    knots = max(len(scale.breakpoints[p][0]) for p in pollutants if p in scale.breakpoints)
+    xp = np.full((len(pollutants), knots), np.inf)
+    fp = np.full((len(pollutants), knots), np.nan)
+    last = np.zeros(len(pollutants), dtype="int64")
+    for j, p in enumerate(pollutants):
+        if p in scale.breakpoints:
+            xs, ys = scale.breakpoints[p]
+            xp[j, :len(xs)], fp[j, :len(ys)] = xs, ys
+            fp[j, len(ys):] = ys[-1]
+            last[j] = len(xs) - 1
+
+    # Band tempat tiap nilai jatuh: jumlah knot <= nilai, dibatasi ke band terakhir polutannya
+    band = (averaged[..., None] >= xp).sum(axis=-1) - 1
+    band = np.clip(band, 0, np.maximum(last - 1, 0))
+    col = np.arange(len(pollutants))
+    x0, x1 = xp[col, band], xp[col, band + 1]
+    y0, y1 = fp[col, band], fp[col, band + 1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        index = y0 + (y1 - y0) * (averaged - x0) / (x1 - x0)
+    index = np.clip(index, 0, fp[col, last])  # di atas band tertinggi -> nilai maksimum skala
+    return np.where(last > 0, index, np.nan)
+
+
+def categorize(values, scale: IndexScale = ISPU) -> pd.DataFrame:
+    """Kategori & warna untuk nilai indeks (vektor). NaN -> 'Tidak ada data'."""
+    values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype="float64")
+    idx = np.searchsorted(scale.category_bounds, np.round(values), side="left")
+    missing = np.isnan(values)
+    idx = np.where(missing, 0, idx)
+    return pd.DataFrame({
+        "category": np.where(missing, NO_DATA, np.asarray(scale.categories, dtype=object)[idx]),
+        "color": np.where(missing, NO_DATA_COLOR, np.asarray(scale.colors, dtype=object)[idx]),
+    })
+
+
+def index_frames(frames: Dict[str, pd.DataFrame], scales=SCALES) -> Dict[str, pd.DataFrame]:
+    """
+    {area: DataFrame jam-an} -> {area: DataFrame kolom indeks (index sama dengan input)}:
+    <skala>, <skala>_category (categorical berurutan), <skala>_dominant (polutan penentu).
+
+    Semua area ditumpuk menjadi satu array (area, jam, polutan) dengan padding NaN,
+    sehingga tiap skala dihitung sekali untuk seluruh data.
+    """
+    frames = {area: df for area, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        return {}
+    pollutants = [p for p in POLLUTANT_COLUMNS if any(p in df.columns for df in frames.values())]
+    n_hours = max(len(df) for df in frames.values())
+    cube = np.full((len(frames), n_hours, len(pollutants)), np.nan)
+    for a, df in enumerate(frames.values()):
+        # Seri diasumsikan urut waktu per jam (format Open-Meteo)
+        cube[a, :len(df)] = df.reindex(columns=pollutants).to_numpy(dtype="float64")
+
+    columns: Dict[str, np.ndarray] = {}
+    for scale in scales:
+        sub = sub_indices(cube, pollutants, scale)
+        has_any = ~np.isnan(sub).all(axis=-1)
+        overall = np.where(has_any, np.nanmax(np.where(np.isnan(sub), -np.inf, sub), axis=-1), np.nan)
+        dominant = np.asarray(pollutants, dtype=object)[np.argmax(np.nan_to_num(sub, nan=-1.0), axis=-1)]
+        columns[scale.column] = np.round(overall)
+        columns[f"{scale.column}_dominant"] = np.where(has_any, dominant, None)
+
+    out = {}
+    for a, (area, df) in enumerate(frames.items()):
+        n = len(df)
+        parts = {}
+        for scale in scales:
+            values = columns[scale.column][a, :n]
+            parts[scale.column] = values
+            parts[f"{scale.column}_category"] = pd.Categorical(
+                categorize(values, scale)["category"], categories=list(scale.categories) + [NO_DATA], ordered=True
+            )
+            parts[f"{scale.column}_dominant"] = columns[f"{scale.column}_dominant"][a, :n]
+        out[area] = pd.DataFrame(parts, index=df.index)
+    return out
+
+
+def with_indices(frames: Dict[str, pd.DataFrame], scales=SCALES) -> Dict[str, pd.DataFrame]:
+    """Salinan tiap DataFrame + kolom indeks (attrs seperti timezone/stale tetap ikut)."""
+    indices = index_frames(frames, scales)
+    return {area: df.assign(**indices[area]) if area in indices else df for area, df in frames.items()}
+
+
+def latest_indices(frames: Dict[str, pd.DataFrame], scales=SCALES) -> pd.DataFrame:
+    """
+    Indeks terkini per area (baris terakhir dengan nilai indeks) dari frame hasil with_indices:
+    kolom area, time, lalu <skala>, <skala>_category, <skala>_dominant per skala.
+    """
+    rows = []
+    for area, df in frames.items():
+        row = {"area": area}
+        for scale in scales:
+            col = scale.column
+            valid = df[col].notna() if col in df.columns else pd.Series(False, index=df.index)
+            if valid.any():
+                last = df.loc[valid[::-1].idxmax()]
+                row.setdefault("time", last.get("time"))
+                row.update({col: last[col], f"{col}_category": last[f"{col}_category"],
+                            f"{col}_dominant": last[f"{col}_dominant"]})
+            else:
+                row.update({col: np.nan, f"{col}_category": NO_DATA, f"{col}_dominant": None})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def describe_latest(df: pd.DataFrame, scales=SCALES) -> Optional[str]:
+    """Satu baris ringkas indeks terkini untuk prompt LLM; None jika belum ada indeks."""
+    latest = latest_indices({"_": df}, scales).iloc[0]
+    parts = [
+        f"{scale.name} {latest[scale.column]:.0f} {latest[f'{scale.column}_category']} "
+        f"(dominan {latest[f'{scale.column}_dominant']})"
+        for scale in scales if pd.notna(latest[scale.column])
+    ]
+    if not parts:
+        return None
+    when = f" ({latest['time']:%Y-%m-%d %H:%M})" if pd.notna(latest.get("time")) else ""
+    return f"INDEKS TERKINI{when}: " + " | ".join(parts)
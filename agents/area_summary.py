@@ -0,0 +1,153 @@
+# area_summary.py
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from agents.context_encoder import POLLUTANT_COLUMNS, SHORT_NAMES
+from agents.guidelines import default_guideline_table
+
+# Jendela rata-rata "terkini" (jam terakhir per area)
+RECENT_WINDOW_HOURS = 24
+SUMMARY_STATS = ["latest", "mean_24h", "max", "exceed_hours"]
+STAT_LABELS = {
+    "latest": "Terkini",
+    "mean_24h": "Rata-rata 24 jam",
+    "max": "Maksimum",
+    "exceed_hours": "Jam > AQG",
+}
+
+
+def stack_area_frames(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Gabungkan DataFrame jam-an tiap area menjadi satu frame long-format:
+    kolom area | time | pollutant | value (NaN dibuang, area & pollutant categorical).
+    """
+    parts = []
+    for area, df in frames.items():
+        if df is None or df.empty or "time" not in df.columns:
+            continue
+        cols = [c for c in POLLUTANT_COLUMNS if c in df.columns]
+        parts.append(df[["time"] + cols].assign(area=area))
+    if not parts:
+        return pd.DataFrame(columns=["area", "time", "pollutant", "value"])
+
+    wide = pd.concat(parts, ignore_index=True)
+    if not pd.api.types.is_datetime64_any_dtype(wide["time"]):
+        wide["time"] = pd.to_datetime(wide["time"])
+    long = wide.melt(id_vars=["area", "time"], var_name="pollutant", value_name="value")
+    long = long.dropna(subset=["value"])
+    long["area"] = pd.Categorical(long["area"], categories=list(frames.keys()))
+    long["pollutant"] = pd.Categorical(long["pollutant"], categories=POLLUTANT_COLUMNS)
+    long["value"] = long["value"].astype("float64")
+    return long.sort_values(["area", "pollutant", "time"], kind="stable").reset_index(drop=True)
+
+
+def hourly_thresholds(table: Optional[Dict[str, Any]] = None) -> Dict[str, float]:
+    """
+    Ambang per jam untuk menghitung 'jam di atas AQG': pedoman 24 jam WHO
+    (ozon memakai pedoman 8 jam). Indikator kasar, bukan exceedance formal.
+    """
+    table = table or default_guideline_table()
+    thresholds = {}
+    for pollutant, periods in table["pollutants"].items():
+        entry = periods.get("24h") or periods.get("8h")
+        if entry and entry.get("aqg") is not None:
+            thresholds[pollutant] = float(entry["aqg"])
+    return thresholds
+
+
+def summarize_long(long: pd.DataFrame, table: Optional[Dict[str, Any]] = None,
+                   window_hours: int = RECENT_WINDOW_HOURS) -> pd.DataFrame:
+    """
+    Ringkasan per (area, pollutant) dalam satu groupby vektor:
+    latest (nilai valid terakhir), mean_24h (jam terakhir area), max, exceed_hours.
+    """
+    if long.empty:
+        return pd.DataFrame(columns=["area", "pollutant", "latest_time"] + SUMMARY_STATS)
+
+    # Jendela 24 jam dihitung dari jam terakhir tiap area (bukan jam global)
+    area_end = long.groupby("area", observed=True)["time"].transform("max")
+    recent = long["time"] > area_end - pd.Timedelta(hours=window_hours)
+
+    thresholds = long["pollutant"].map(hourly_thresholds(table)).astype("float64").to_numpy()
+    values = long["value"].to_numpy()
+    work = long.assign(
+        recent_value=np.where(recent.to_numpy(), values, np.nan),
+        exceed=(values > thresholds),  # NaN threshold -> False
+    )
+
+    summary = work.groupby(["area", "pollutant"], observed=True, sort=True).agg(
+        latest_time=("time", "last"),
+        latest=("value", "last"),
+        mean_24h=("recent_value", "mean"),
+        max=("value", "max"),
+        exceed_hours=("exceed", "sum"),
+    )
+    summary["exceed_hours"] = summary["exceed_hours"].astype("int64")
+    return summary.reset_index()
+
+
+def summarize_daily(long: pd.DataFrame, table: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """
+    Ringkasan harian per (area, date, pollutant) dalam satu groupby vektor:
+    mean, min, max, n_hours, exceed_hours, dan exceeds_aqg (rata-rata harian > AQG 24 jam).
+    Tanggal mengikuti jam lokal di kolom time.
+    """
+    columns = ["area", "date", "pollutant", "mean", "min", "max", "n_hours", "exceed_hours", "exceeds_aqg"]
+    if long.empty:
+        return pd.DataFrame(columns=columns)
+
+    limits = hourly_thresholds(table)
+    thresholds = long["pollutant"].map(limits).astype("float64")
+    work = long.assign(
+        date=long["time"].dt.normalize(),
+        exceed=(long["value"].to_numpy() > thresholds.to_numpy()),
+    )
+    daily = work.groupby(["area", "date", "pollutant"], observed=True, sort=True).agg(
+        mean=("value", "mean"),
+        min=("value", "min"),
+        max=("value", "max"),
+        n_hours=("value", "size"),
+        exceed_hours=("exceed", "sum"),
+    ).reset_index()
+    daily["n_hours"] = daily["n_hours"].astype("int64")
+    daily["exceed_hours"] = daily["exceed_hours"].astype("int64")
+    daily_thresholds = daily["pollutant"].map(limits).astype("float64")
+    daily["exceeds_aqg"] = daily["mean"].to_numpy() > daily_thresholds.to_numpy()
+    return daily[columns]
+
+
+def summarize_areas(frames: Dict[str, pd.DataFrame], table: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Shortcut: {area: DataFrame jam-an} -> ringkasan long (area, pollutant, stat...)."""
+    return summarize_long(stack_area_frames(frames), table)
+
+
+def summary_table(summary: pd.DataFrame, stat: str = "latest") -> pd.DataFrame:
+    """Tabel lebar area x polutan untuk satu statistik (untuk tabel & grafik)."""
+    if summary.empty:
+        return pd.DataFrame()
+    return summary.pivot(index="area", columns="pollutant", values=stat)
+
+
+def summary_records(summary: pd.DataFrame, stats: List[str] = None) -> List[Dict[str, Any]]:
+    """
+    List of dict per area untuk prompt LLM (encode_summaries), kolom:
+    city, lalu <polutan>[_<stat>] untuk tiap statistik (latest tanpa akhiran).
+    """
+    if summary.empty:
+        return []
+    stats = stats or SUMMARY_STATS
+    wide = summary.pivot(index="area", columns="pollutant", values=stats)
+
+    suffix = {"latest": "", "mean_24h": "_24h", "max": "_max", "exceed_hours": "_jam>aqg"}
+    columns = {}
+    for pollutant in wide.columns.get_level_values("pollutant").unique():
+        for stat in stats:
+            columns[(stat, pollutant)] = f"{SHORT_NAMES[pollutant]}{suffix.get(stat, '_' + stat)}"
+    wide = wide[list(columns.keys())]
+    wide.columns = list(columns.values())
+
+    records = wide.reset_index().rename(columns={"area": "city"})
+    records["city"] = records["city"].astype(str)
+    return records.to_dict(orient="records")
@@ -0,0 +1,63 @@
+# cache.py
+"""
+Cache JSON di disk bersama untuk semua agent: satu file `{name}.json` per entri
+berisi {"ts": waktu tulis, "data": isi}. Dipakai data_fetcher, geocoder,
+pollution_grid dan prefetch.
+"""
+import os
+import json
+import time
+import tempfile
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv("CACHE_DIR", "data/cache"))
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", "6"))
+
+
+def cache_write(name: str, data):
+    """
+    Tulis atomik: file sementara di direktori yang sama lalu os.replace, sehingga pembaca
+    (thread prefetch, pool chunk/grid) tidak pernah melihat file yang setengah tertulis.
+    """
+    path = CACHE_DIR / f"{name}.json"
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"ts": time.time(), "data": data}, f)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def cache_read_stale(name: str):
+    """Isi cache tanpa memedulikan TTL: (data, umur detik) atau (None, None). Fallback saat upstream down."""
+    path = CACHE_DIR / f"{name}.json"
+    if not path.exists():
+        return None, None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            obj = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    return obj.get("data"), time.time() - obj.get("ts", 0)
+
+
+def cache_read(name: str, ttl_hours: float = None):
+    """Isi cache jika umurnya < ttl_hours (default CACHE_TTL_HOURS), selain itu None (juga jika rusak)."""
+    path = CACHE_DIR / f"{name}.json"
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            obj = json.load(f)
+    except (OSError, ValueError):
+        return None
+    ts = obj.get("ts", 0)
+    if time.time() - ts > (CACHE_TTL_HOURS if ttl_hours is None else ttl_hours) * 3600:
+        return None
+    return obj.get("data")
@@ -0,0 +1,172 @@
+# circuit_breaker.py
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from urllib.parse import urlsplit
+
+import requests
+
+# Breaker terbuka jika >= BREAKER_ERROR_RATE dari BREAKER_WINDOW panggilan terakhir gagal
+# (minimal BREAKER_MIN_CALLS panggilan); selama terbuka panggilan langsung gagal tanpa menunggu timeout
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_PROBE_INTERVAL_S = float(os.getenv("BREAKER_PROBE_INTERVAL_S", "15"))
+BREAKER_PROBE_TIMEOUT_S = float(os.getenv("BREAKER_PROBE_TIMEOUT_S", "5"))
+
+CLOSED, OPEN = "closed", "open"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Host sedang dianggap down; subclass RequestException agar jalur error lama tetap berlaku."""
+
+
+class CircuitBreaker:
+    """
+    Breaker per host: menghitung hasil panggilan dalam jendela bergulir, membuka saat
+    rasio error melewati ambang, lalu thread probe di background mengecek host secara
+    berkala dan menutup breaker begitu host menjawab lagi (tanpa membebani request user).
+    """
+
+    def __init__(self, host: str, scheme: str = "https", probe: Optional[Callable[[], bool]] = None):
+        self.host = host
+        self.probe = probe or (lambda: _http_probe(host, scheme))
+        self.state = CLOSED
+        self._results: deque = deque(maxlen=BREAKER_WINDOW)
+        self._lock = threading.Lock()
+        self._probe_thread: Optional[threading.Thread] = None
+        self.opened_at: Optional[float] = None
+        self.counters = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0, "probes": 0}
+        self.last_error: Optional[str] = None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                self.counters["rejected"] += 1
+                return False
+            return True
+
+    def record(self, success: bool, error: Optional[BaseException] = None):
+        with self._lock:
+            self.counters["calls"] += 1
+            self._results.append(success)
+            if success:
+                return
+            self.counters["failures"] += 1
+            self.last_error = type(error).__name__ if error else "error"
+            failures = self._results.count(False)
+            if (self.state == CLOSED and len(self._results) >= BREAKER_MIN_CALLS
+                    and failures / len(self._results) >= BREAKER_ERROR_RATE):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.counters["opened"] += 1
+        print(f"[circuit_breaker] {self.host} OPEN ({self.last_error}); request gagal cepat sampai probe berhasil")
+        if self._probe_thread is None or not self._probe_thread.is_alive():
+            self._probe_thread = threading.Thread(target=self._probe_loop, name=f"probe-{self.host}", daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(BREAKER_PROBE_INTERVAL_S)
+            with self._lock:
+                self.counters["probes"] += 1
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            if healthy:
+                self.close()
+                return
+
+    def close(self):
+        with self._lock:
+            self.state = CLOSED
+            self.opened_at = None
+            self._results.clear()
+        print(f"[circuit_breaker] {self.host} CLOSED (probe berhasil)")
+
+    def call(self, fn: Callable, *args, failure_types: Tuple[Type[BaseException], ...] = (Exception,), **kwargs):
+        """Jalankan fn lewat breaker: CircuitOpenError jika terbuka, hasil dicatat otomatis."""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker terbuka untuk {self.host}")
+        try:
+            result = fn(*args, **kwargs)
+        except failure_types as e:
+            self.record(False, e)
+            raise
+        self.record(True)
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            window = len(self._results)
+            failures = self._results.count(False)
+            return {
+                "host": self.host,
+                "state": self.state,
+                "error_rate": round(failures / window, 3) if window else 0.0,
+                "window": window,
+                "open_for_s": round(time.time() - self.opened_at, 1) if self.opened_at else 0.0,
+                "last_error": self.last_error,
+                **self.counters,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc or url
+
+
+def get_breaker(url_or_host: str, scheme: str = "https") -> CircuitBreaker:
+    """Breaker untuk host dari URL (skema diambil dari URL) atau nama host langsung."""
+    if "://" in url_or_host:
+        scheme, host = urlsplit(url_or_host).scheme, host_of(url_or_host)
+    else:
+        host = url_or_host
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host, scheme)
+        return breaker
+
+
+def metrics() -> List[Dict[str, Any]]:
+    """State & counter semua breaker (untuk panel debug / scraping)."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.metrics() for b in breakers]
+
+
+def guarded_get(url: str, **kwargs) -> requests.Response:
+    """
+    requests.get lewat breaker host-nya. Error koneksi/timeout dan status 5xx/429
+    dihitung gagal; 4xx lain dianggap host sehat. Status tidak di-raise di sini.
+    """
+    breaker = get_breaker(url)
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit breaker terbuka untuk {breaker.host}")
+    try:
+        response = requests.get(url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        breaker.record(False, e)
+        raise
+    server_error = response.status_code >= 500 or response.status_code == 429
+    breaker.record(not server_error, requests.exceptions.HTTPError(response.status_code) if server_error else None)
+    return response
+
+
+def _http_probe(host: str, scheme: str) -> bool:
+    """Probe ringan: host dianggap pulih jika root URL menjawab tanpa 5xx."""
+    try:
+        response = requests.get(f"{scheme}://{host}/", timeout=BREAKER_PROBE_TIMEOUT_S)
+        return response.status_code < 500
+    except requests.exceptions.RequestException:
+        return False
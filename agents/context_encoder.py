@@ -0,0 +1,141 @@
+# context_encoder.py
+import os
+import math
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+# Anggaran token untuk blok data sensor dalam satu prompt
+DEFAULT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "1500"))
+# Heuristik kasar tokenizer Gemini/SentencePiece: ~4 karakter per token untuk teks campuran angka
+CHARS_PER_TOKEN = 4
+
+POLLUTANT_COLUMNS = ["pm2_5", "pm10", "nitrogen_dioxide", "sulphur_dioxide", "ozone", "carbon_monoxide"]
+SHORT_NAMES = {
+    "pm2_5": "pm2_5",
+    "pm10": "pm10",
+    "nitrogen_dioxide": "no2",
+    "sulphur_dioxide": "so2",
+    "ozone": "o3",
+    "carbon_monoxide": "co",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimasi jumlah token tanpa memanggil API (cukup untuk budgeting & monitoring)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _fmt(value) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "-"
+    return f"{value:.1f}"
+
+
+def _fmt_cell(value) -> str:
+    if value is None or isinstance(value, (int, float, np.floating)):
+        return _fmt(value)
+    return str(value)
+
+
+def _stats_block(df: pd.DataFrame, cols: List[str]) -> List[str]:
+    values = df[cols].to_numpy(dtype=float)
+    times = df["time"].to_numpy()
+    hours = df["time"].dt.hour.to_numpy()
+    valid = ~np.isnan(values)
+
+    lines = ["STATISTIK (µg/m³) polutan|min|mean|max|p95|waktu_puncak|jam_rawan"]
+    for j, col in enumerate(cols):
+        v = values[valid[:, j], j]
+        if v.size == 0:
+            continue
+        peak_idx = np.flatnonzero(valid[:, j])[np.argmax(v)]
+        # Jam rawan = jam dalam sehari dengan rata-rata tertinggi (profil diurnal)
+        hour_sums = np.bincount(hours[valid[:, j]], weights=v, minlength=24)
+        hour_counts = np.bincount(hours[valid[:, j]], minlength=24)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            worst_hour = int(np.nanargmax(np.where(hour_counts > 0, hour_sums / hour_counts, np.nan)))
+        lines.append(
+            f"{SHORT_NAMES[col]}|{_fmt(v.min())}|{_fmt(v.mean())}|{_fmt(v.max())}|"
+            f"{_fmt(np.percentile(v, 95))}|{pd.Timestamp(times[peak_idx]):%Y-%m-%d %H:%M}|{worst_hour:02d}:00"
+        )
+    return lines
+
+
+def _series_block(df: pd.DataFrame, cols: List[str], token_budget: int) -> List[str]:
+    """
+    Seri waktu dalam format kolom (header sekali, baris CSV) yang di-downsample
+    ke rata-rata per N jam sehingga muat di token_budget.
+    """
+    if token_budget <= 0 or df.empty:
+        return []
+
+    sample_row = ",".join(["12-31 23"] + ["999.9"] * len(cols))
+    tokens_per_row = estimate_tokens(sample_row) + 1
+    max_rows = token_budget // tokens_per_row
+    if max_rows < 2:
+        return []
+
+    step = max(1, math.ceil(len(df) / max_rows))
+    bucket = np.arange(len(df)) // step
+    grouped = df[cols].groupby(bucket).mean()
+    starts = df["time"].groupby(bucket).first()
+
+    header = f"SERI (rata-rata per {step} jam) waktu,{','.join(SHORT_NAMES[c] for c in cols)}"
+    rows = [
+        ",".join([f"{t:%m-%d %H}"] + [_fmt(v) for v in vals])
+        for t, vals in zip(starts, grouped.to_numpy())
+    ]
+    return [header] + rows
+
+
+def encode_series(df: pd.DataFrame, token_budget: Optional[int] = None) -> str:
+    """
+    Encode seri jam-an Open-Meteo menjadi representasi ringkas untuk prompt LLM:
+    - periode & jumlah jam
+    - statistik per polutan (min/mean/max/p95, waktu puncak, jam rawan)
+    - seri yang di-downsample agar total blok tetap di bawah token_budget
+    Menggantikan DataFrame.to_json(orient="records") yang mengulang semua key di setiap baris.
+    """
+    token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+    if df is None or df.empty or "time" not in df.columns:
+        return "Tidak ada data sensor."
+
+    if not pd.api.types.is_datetime64_any_dtype(df["time"]):
+        df = df.assign(time=pd.to_datetime(df["time"]))
+    if not df["time"].is_monotonic_increasing:
+        df = df.sort_values("time")
+    cols = [c for c in POLLUTANT_COLUMNS if c in df.columns]
+
+    lines = [
+        f"PERIODE: {df['time'].iloc[0]:%Y-%m-%d %H:%M} s.d {df['time'].iloc[-1]:%Y-%m-%d %H:%M} ({len(df)} jam)"
+    ]
+    lines += _stats_block(df, cols)
+
+    remaining = token_budget - estimate_tokens("\n".join(lines))
+    lines += _series_block(df, cols, remaining)
+    return "\n".join(lines)
+
+
+def encode_summaries(records: List[Dict[str, Any]], token_budget: Optional[int] = None) -> str:
+    """
+    Encode list ringkasan per area (list of dict) sebagai tabel kolom:
+    header sekali, lalu satu baris per area. Baris dipotong jika melewati token_budget.
+    """
+    token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+    if not records:
+        return "Tidak ada data ringkasan."
+
+    keys = list(dict.fromkeys(k for r in records for k in r.keys()))
+    lines = ["|".join(keys)]
+    used = estimate_tokens(lines[0])
+    for i, record in enumerate(records):
+        row = "|".join(_fmt_cell(record.get(k)) for k in keys)
+        cost = estimate_tokens(row) + 1
+        if used + cost > token_budget:
+            lines.append(f"... {len(records) - i} area lain dipotong (batas token)")
+            break
+        lines.append(row)
+        used += cost
+    return "\n".join(lines)
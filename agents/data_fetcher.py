@@ -1,66 +1,124 @@
 # data_fetcher.py
 import os
-import json
+import math
 import time
-from datetime import datetime, timedelta
+import sqlite3
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from pathlib import Path
 import requests
 import pandas as pd
 from dotenv import load_dotenv
 from math import radians, cos, sin, asin, sqrt
 from geopy.geocoders import Nominatim
+from geopy.exc import GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited
+from agents import tracing
+from agents.cache import CACHE_DIR, cache_read, cache_read_stale, cache_write
+from agents.circuit_breaker import get_breaker, guarded_get, CircuitOpenError
+from agents.observation_store import ObservationStore, POLLUTANTS
+
+# Error geopy yang menandakan Nominatim bermasalah (bukan query yang salah)
+GEOCODER_FAILURES = (GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited)
 
 load_dotenv()
 
-OPENAQ_API_BASE = "https://api.openaq.org/v3"
+# Endpoint upstream bisa diarahkan ke stub lokal (lihat utils/stub_servers.py & benchmark.py)
+OPENAQ_API_BASE = os.getenv("OPENAQ_API_BASE", "https://api.openaq.org/v3")
+OPEN_METEO_AQ_BASE = os.getenv("OPEN_METEO_AQ_BASE", "https://air-quality-api.open-meteo.com/v1")
+NOMINATIM_DOMAIN = os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.getenv("NOMINATIM_SCHEME", "https")
 OPENAQ_API_KEY = os.getenv("OPENAQ_API_KEY", "none")
 headers = {"X-API-Key": OPENAQ_API_KEY} if OPENAQ_API_KEY else {}
 
 
-# Cache config
-CACHE_DIR = Path(os.getenv("CACHE_DIR", "data/cache"))
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
-CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", "6"))
-
-
-def _cache_write(name: str, data):
-    path = CACHE_DIR / f"{name}.json"
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump({"ts": time.time(), "data": data}, f)
-
+# Batas request/detik ke Open-Meteo (0 = tanpa batas); free tier ~600 request/menit
+OPEN_METEO_MAX_RPS = float(os.getenv("OPEN_METEO_MAX_RPS", "0"))
+OPEN_METEO_HOURLY = ",".join(POLLUTANTS)
+# Semua data jam-an yang diambil juga disimpan ke SQLite lokal (per sel grid / stasiun);
+# rentang yang sudah lewat & lengkap di sana tidak diminta lagi ke upstream
+OBS_STORE_ENABLED = os.getenv("OBS_STORE_ENABLED", "1") == "1"
+OBS_DB_PATH = Path(os.getenv("OBS_DB_PATH", str(CACHE_DIR / "observations.sqlite")))
+# Rentang lebih panjang dari FETCH_CHUNK_DAYS dipecah per minggu kalender (Senin-Minggu)
+FETCH_CHUNK_DAYS = int(os.getenv("FETCH_CHUNK_DAYS", "7"))
+FETCH_CHUNK_CONCURRENCY = int(os.getenv("FETCH_CHUNK_CONCURRENCY", "4"))
+FETCH_CHUNK_RETRIES = int(os.getenv("FETCH_CHUNK_RETRIES", "2"))
+FORECAST_DAYS = 4  # Open-Meteo air quality: prakiraan s.d. ~4 hari ke depan
+# Rentang pendek (<= FETCH_CHUNK_DAYS, mis. "hari ini") dipakai ulang dari cache selama ini;
+# scheduler prefetch menyegarkan kota populer lebih sering dari TTL ini
+RECENT_CACHE_TTL_MIN = float(os.getenv("RECENT_CACHE_TTL_MIN", "60"))
+# Sel grid untuk cache titik -> stasiun terdekat (derajat) dan masa berlakunya
+NEAREST_CELL_DEG = float(os.getenv("NEAREST_CELL_DEG", "0.1"))
+NEAREST_CACHE_TTL_HOURS = int(os.getenv("NEAREST_CACHE_TTL_HOURS", "168"))
+_cells = {}
+_cells_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Token bucket thread-safe: rata-rata `rate` request/detik, burst maksimal `burst`.
+    rate <= 0 berarti tanpa batas. acquire() memblok thread pemanggil seperlunya.
+    """
 
-def _cache_read(name: str):
-    path = CACHE_DIR / f"{name}.json"
-    if not path.exists():
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        obj = json.load(f)
-    ts = obj.get("ts", 0)
-    if time.time() - ts > CACHE_TTL_HOURS * 3600:
-        return None
-    return obj.get("data")
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Ambil satu token; return lama menunggu (detik)."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Token boleh negatif: pemanggil berikutnya otomatis antre di belakang
+            self._tokens -= 1
+            wait = max(0.0, -self._tokens / self.rate)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+open_meteo_limiter = RateLimiter(OPEN_METEO_MAX_RPS)
+observations = ObservationStore(OBS_DB_PATH) if OBS_STORE_ENABLED else None
 
 
 def _request_json(url, params=None, use_cache=False, cache_name=None):
-    if use_cache and cache_name:
-        cached = _cache_read(cache_name)
-        if cached is not None:
-            return cached
-
-    headers = {}
-    if OPENAQ_API_KEY and OPENAQ_API_KEY.lower() != "none":
-        headers["x-api-key"] = OPENAQ_API_KEY
-
-    try:
-        resp = requests.get(url, params=params, headers=headers, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
+    with tracing.span("fetch.openaq", url=url) as sp:
         if use_cache and cache_name:
-            _cache_write(cache_name, data)
-        return data
-    except Exception as e:
-        print(f"[data_fetcher] Request error: {e} - URL: {url} - params: {params}")
-        return None
+            cached = cache_read(cache_name)
+            if cached is not None:
+                sp.set(cache_hit=True)
+                return cached
+        sp.set(cache_hit=False)
+
+        headers = {}
+        if OPENAQ_API_KEY and OPENAQ_API_KEY.lower() != "none":
+            headers["x-api-key"] = OPENAQ_API_KEY
+
+        try:
+            resp = guarded_get(url, params=params, headers=headers, timeout=15)
+            resp.raise_for_status()
+            sp.set(status=resp.status_code, bytes=len(resp.content))
+            data = resp.json()
+            if cache_name:
+                cache_write(cache_name, data)
+            return data
+        except Exception as e:
+            sp.set(error=type(e).__name__)
+            print(f"[data_fetcher] Request error: {e} - URL: {url} - params: {params}")
+            if cache_name:
+                stale, age = cache_read_stale(cache_name)
+                if stale is not None:
+                    sp.set(stale=True)
+                    print(f"[data_fetcher] Memakai cache lama ({age / 3600:.1f} jam) untuk {cache_name}")
+                    return stale
+            return None
 
 
 # ----------------------------
@@ -85,8 +143,10 @@ def get_locations(country_code="ID", limit=200):
     """Ambil daftar lokasi pemantauan udara dari OpenAQ v3 dan filter berdasarkan country code"""
     try:
         params = {"limit": limit}
-        res = requests.get(f"{OPENAQ_API_BASE}/locations", params=params, headers=headers, timeout=15)
-        res.raise_for_status()
+        with tracing.span("fetch.openaq", url=f"{OPENAQ_API_BASE}/locations", cache_hit=False) as sp:
+            res = guarded_get(f"{OPENAQ_API_BASE}/locations", params=params, headers=headers, timeout=15)
+            res.raise_for_status()
+            sp.set(status=res.status_code, bytes=len(res.content))
         data = res.json().get("results", [])
 
         if not data:
@@ -118,49 +178,401 @@ def get_locations(country_code="ID", limit=200):
         return None
 
 
-def get_air_quality_by_coords(lat, lon,start_date=None, end_date=None, radius_km=200):
+def _hourly_frame(data) -> pd.DataFrame:
+    df = pd.DataFrame(data["hourly"])
+    df["time"] = pd.to_datetime(df["time"])
+    # Jam dari Open-Meteo adalah jam lokal (timezone=auto) tanpa offset: simpan nama zonanya
+    df.attrs["timezone"] = data.get("timezone")
+    return df
+
+
+def _uncovered_ranges(times, start_date: str, end_date: str):
+    """Rentang tanggal [(awal, akhir)] dalam [start_date, end_date] yang tidak punya satu jam pun."""
+    have = set(pd.DatetimeIndex(times).normalize())
+    ranges = []
+    for day in pd.date_range(start_date, end_date, freq="D"):
+        if day in have:
+            continue
+        if ranges and ranges[-1][1] == day - pd.Timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [(str(lo.date()), str(hi.date())) for lo, hi in ranges]
+
+
+def _stale_frame(lat, lon, start_date, end_date):
+    """
+    Data lama untuk rentang yang diminta saat upstream gagal: cache JSON dengan key yang sama
+    (umur berapa pun), selain itu baris observation store di dalam rentang. Hasil dipotong ke
+    rentang; hari tanpa data di df.attrs["missing_ranges"]. None jika tidak ada yang tumpang tindih.
+    Tanpa start/end, rentangnya = default Open-Meteo (hari ini + FORECAST_DAYS).
+    """
+    start = start_date or str(date.today())
+    end = end_date or str(date.today() + timedelta(days=FORECAST_DAYS))
+    data, age = cache_read_stale(f"om_hourly_{lat:.4f}_{lon:.4f}_{start_date}_{end_date}")
+    df = _hourly_frame(data) if data is not None and "hourly" in data else None
+    if df is None and observations is not None:
+        try:
+            df = observations.query_range(_cell_name(lat, lon), start, end)
+        except sqlite3.Error as e:
+            print(f"[data_fetcher] Observation store tidak bisa dibaca: {e}")
+            df = None
+        if df is not None and not df.empty:
+            age = time.time() - df.attrs["fetched_at"]
+    if df is None:
+        return None
+
+    timezone = df.attrs.get("timezone")
+    window = (df["time"] >= pd.Timestamp(start)) & (df["time"] < pd.Timestamp(end) + pd.Timedelta(days=1))
+    df = df[window].reset_index(drop=True)
+    if df.empty:
+        return None
+    df.attrs = {"timezone": timezone, "cache_hit": False, "stale": True, "stale_age_s": age,
+                "missing_ranges": _uncovered_ranges(df["time"], start, end)}
+    return df
+
+
+def fetch_open_meteo_hourly(lat, lon, start_date=None, end_date=None, use_cache=False, ttl_hours=None,
+                            stale_fallback=True):
+    """
+    Data jam-an Open-Meteo untuk satu koordinat (DataFrame, atau None jika respons tanpa 'hourly').
+    Error HTTP/koneksi diteruskan sebagai requests.RequestException.
+    use_cache=True memakai cache JSON (ttl_hours, default CACHE_TTL_HOURS); df.attrs["cache_hit"]
+    menandai hasil cache.
+
+    Respons sukses selalu ditulis ke cache. Jika upstream gagal (atau circuit breaker
+    terbuka) dan stale_fallback=True, data lama yang tumpang tindih dengan rentang yang
+    diminta dipakai (lihat _stale_frame), ditandai df.attrs["stale"] + df.attrs["stale_age_s"];
+    tanpa data untuk rentang itu, error diteruskan. Pemanggil yang me-retry sendiri
+    (chunk, batch) memakai stale_fallback=False dan baru memakai _stale_frame setelah retry habis.
+    """
+    cache_name = f"om_hourly_{lat:.4f}_{lon:.4f}_{start_date}_{end_date}"
+    with tracing.span("fetch.open_meteo", lat=round(lat, 4), lon=round(lon, 4)) as sp:
+        data = cache_read(cache_name, ttl_hours) if use_cache else None
+        sp.set(cache_hit=data is not None)
+        if data is None:
+            params = {"latitude": lat, "longitude": lon, "hourly": OPEN_METEO_HOURLY, "timezone": "auto"}
+            if start_date and end_date:
+                params.update(start_date=start_date, end_date=end_date)
+            try:
+                open_meteo_limiter.acquire()
+                response = guarded_get(f"{OPEN_METEO_AQ_BASE}/air-quality", params=params, timeout=10)
+                response.raise_for_status()
+                sp.set(status=response.status_code, bytes=len(response.content))
+                data = response.json()
+                if "hourly" in data:
+                    cache_write(cache_name, data)
+            except requests.exceptions.RequestException:
+                stale = _stale_frame(lat, lon, start_date, end_date) if stale_fallback else None
+                if stale is None:
+                    raise
+                sp.set(stale=True, stale_age_s=round(stale.attrs["stale_age_s"]))
+                print(f"[data_fetcher] Open-Meteo gagal, memakai data cache "
+                      f"{stale.attrs['stale_age_s'] / 3600:.1f} jam lalu")
+                return stale
+
+    if "hourly" not in data:
+        return None
+    df = _hourly_frame(data)
+    df.attrs["cache_hit"] = sp.attributes["cache_hit"]
+    df.attrs["stale"] = False
+    df.attrs["stale_age_s"] = None
+    df.attrs["missing_ranges"] = []
+    if observations is not None and not df.attrs["cache_hit"]:
+        try:
+            observations.upsert(_cell_name(lat, lon), lat, lon, df, df.attrs["timezone"])
+        except sqlite3.Error as e:
+            print(f"[data_fetcher] Gagal menyimpan ke observation store: {e}")
+    return df
+
+
+def _from_store(lat, lon, start_date, end_date):
+    """
+    Rentang yang sudah lewat (end_date < hari ini) dan lengkap per jam di observation store,
+    dalam format yang sama dengan fetch_open_meteo_hourly; None jika harus ke upstream.
+    """
+    if observations is None or not (start_date and end_date) or end_date >= str(date.today()):
+        return None
+    location = _cell_name(lat, lon)
+    try:
+        if not observations.has_range(location, start_date, end_date):
+            return None
+        df = observations.query_range(location, start_date, end_date)
+    except sqlite3.Error as e:
+        print(f"[data_fetcher] Observation store tidak bisa dibaca: {e}")
+        return None
+    df.attrs.update(cache_hit=True, store_hit=True, stale=False, stale_age_s=None)
+    return df
+
+
+def calendar_chunks(start_date: str, end_date: str, days: int = FETCH_CHUNK_DAYS):
+    """
+    Pecah [start, end] menjadi chunk kalender tetap: minggu Senin-Minggu jika days=7,
+    selain itu blok `days` hari sejak 1970-01-05 (Senin). Batas chunk tidak bergantung
+    pada rentang yang diminta, sehingga rentang yang tumpang tindih memakai chunk (dan
+    cache) yang sama. Chunk dipotong ke batas prakiraan Open-Meteo.
+    """
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    horizon = date.today() + timedelta(days=FORECAST_DAYS)
+    epoch = date(1970, 1, 5)
+    chunk_start = start - timedelta(days=(start - epoch).days % days)
+    chunks = []
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=days - 1), horizon)
+        if chunk_end < chunk_start:
+            break
+        chunks.append((str(chunk_start), str(chunk_end)))
+        chunk_start += timedelta(days=days)
+    return chunks
+
+
+def _fetch_chunk(lat, lon, chunk_start, chunk_end, retries, use_cache=True):
+    """
+    Satu chunk dengan retry sendiri (backoff eksponensial); chunk lampau dari observation store.
+    Data lama (_stale_frame) baru dipakai setelah retry habis; tanpa data lama, error diteruskan.
+    """
+    # Chunk yang mencakup hari ini/prakiraan masih berubah: cache-nya sependek rentang pendek
+    ttl_hours = RECENT_CACHE_TTL_MIN / 60 if date.fromisoformat(chunk_end) >= date.today() else None
+    if use_cache:
+        df = _from_store(lat, lon, chunk_start, chunk_end)
+        if df is not None:
+            return df
+    for attempt in range(retries + 1):
+        try:
+            return fetch_open_meteo_hourly(lat, lon, chunk_start, chunk_end, use_cache=use_cache,
+                                           ttl_hours=ttl_hours, stale_fallback=False)
+        except requests.exceptions.RequestException as e:
+            # Breaker terbuka: jangan tidur & retry, chunk lain juga akan gagal cepat
+            if attempt == retries or isinstance(e, CircuitOpenError):
+                stale = _stale_frame(lat, lon, chunk_start, chunk_end)
+                if stale is None:
+                    raise
+                print(f"[data_fetcher] Chunk {chunk_start} s.d {chunk_end} gagal ({e}), memakai data lama")
+                return stale
+            print(f"[data_fetcher] Chunk {chunk_start} s.d {chunk_end} gagal ({e}), retry {attempt + 1}...")
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def _clip_ranges(ranges, start_date: str, end_date: str):
+    """Potong rentang tanggal [(awal, akhir)] ke [start_date, end_date]; yang di luar dibuang."""
+    return [(max(lo, start_date), min(hi, end_date)) for lo, hi in ranges if lo <= end_date and hi >= start_date]
+
+
+def fetch_open_meteo_range(lat, lon, start_date=None, end_date=None, refresh=False):
+    """
+    Seperti fetch_open_meteo_hourly, tetapi rentang panjang (> FETCH_CHUNK_DAYS) diambil
+    per chunk kalender secara paralel, di-cache per chunk, lalu disambung & dipotong ke
+    rentang yang diminta. Chunk yang gagal di-retry sendiri; jika tetap gagal, data lama
+    chunk itu dipakai bila ada, dan data chunk lain tetap dikembalikan (hari tanpa data
+    di df.attrs["missing_ranges"]).
+
+    Rentang pendek diambil dari cache jika umurnya < RECENT_CACHE_TTL_MIN. Rentang/chunk
+    yang sudah lewat dan lengkap di observation store tidak diminta ke upstream.
+    refresh=True selalu ke upstream (lalu menulis cache) — dipakai scheduler prefetch.
+    """
+    if not (start_date and end_date) or \
+            (date.fromisoformat(end_date) - date.fromisoformat(start_date)).days + 1 <= FETCH_CHUNK_DAYS:
+        stored = None if refresh else _from_store(lat, lon, start_date, end_date)
+        if stored is not None:
+            return stored
+        return fetch_open_meteo_hourly(lat, lon, start_date, end_date, use_cache=not refresh,
+                                       ttl_hours=RECENT_CACHE_TTL_MIN / 60)
+
+    chunks = calendar_chunks(start_date, end_date)
+    with tracing.span("fetch.open_meteo_chunked", chunks=len(chunks)) as sp:
+        with ThreadPoolExecutor(max_workers=min(FETCH_CHUNK_CONCURRENCY, len(chunks))) as pool:
+            # copy_context: span per chunk tetap masuk ke trace aktif
+            futures = [pool.submit(contextvars.copy_context().run, _fetch_chunk, lat, lon, cs, ce,
+                                   FETCH_CHUNK_RETRIES, not refresh) for cs, ce in chunks]
+            frames, missing, last_error = [], [], None
+            for (cs, ce), future in zip(chunks, futures):
+                try:
+                    df = future.result()
+                except requests.exceptions.RequestException as e:
+                    last_error = e
+                    missing.append((cs, ce))
+                    continue
+                if df is not None and not df.empty:
+                    frames.append(df)
+                    missing.extend(df.attrs.get("missing_ranges") or [])
+        missing = _clip_ranges(sorted(missing), start_date, end_date)
+        sp.set(failed=len(missing), cache_hits=sum(bool(df.attrs.get("cache_hit")) for df in frames),
+               store_hits=sum(bool(df.attrs.get("store_hit")) for df in frames),
+               stale=sum(bool(df.attrs.get("stale")) for df in frames))
+
+    if not frames:
+        if last_error is not None:
+            raise last_error
+        return None
+    if missing:
+        print(f"[data_fetcher] {len(missing)} rentang tanpa data setelah retry: {missing}")
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df.drop_duplicates(subset="time", keep="last").sort_values("time", kind="stable")
+    window = (df["time"] >= pd.Timestamp(start_date)) & (df["time"] < pd.Timestamp(end_date) + pd.Timedelta(days=1))
+    df = df[window].reset_index(drop=True)
+    df.attrs["timezone"] = frames[0].attrs.get("timezone")
+    df.attrs["cache_hit"] = all(frame.attrs.get("cache_hit") for frame in frames)
+    df.attrs["missing_ranges"] = missing
+    stale_ages = [frame.attrs["stale_age_s"] for frame in frames if frame.attrs.get("stale")]
+    df.attrs["stale"] = bool(stale_ages)
+    df.attrs["stale_age_s"] = max(stale_ages) if stale_ages else None
+    return df
+
+
+def fetch_open_meteo_points(lats, lons, hour: datetime, variable: str = "pm2_5") -> pd.DataFrame:
+    """
+    Satu request Open-Meteo untuk banyak titik sekaligus (koordinat dipisah koma) pada
+    satu jam UTC. Return DataFrame latitude, longitude, value (NaN jika titik tanpa data).
+    Error HTTP/koneksi diteruskan sebagai requests.RequestException.
+    """
+    hour_str = hour.strftime("%Y-%m-%dT%H:00")
+    params = {
+        "latitude": ",".join(f"{v:.4f}" for v in lats),
+        "longitude": ",".join(f"{v:.4f}" for v in lons),
+        "hourly": variable,
+        "timezone": "GMT",
+        "start_hour": hour_str,
+        "end_hour": hour_str,
+    }
+    with tracing.span("fetch.open_meteo_grid", points=len(lats), hour=hour_str) as sp:
+        open_meteo_limiter.acquire()
+        response = guarded_get(f"{OPEN_METEO_AQ_BASE}/air-quality", params=params, timeout=20)
+        response.raise_for_status()
+        sp.set(status=response.status_code, bytes=len(response.content))
+        data = response.json()
+
+    # Satu titik -> objek, banyak titik -> list (urutan sama dengan input)
+    results = data if isinstance(data, list) else [data]
+    values = []
+    for item in results:
+        series = (item.get("hourly") or {}).get(variable) or [None]
+        values.append(series[0])
+    return pd.DataFrame({
+        "latitude": list(lats),
+        "longitude": list(lons),
+        "value": pd.to_numeric(pd.Series(values, dtype="object"), errors="coerce").astype("float64"),
+    })
+
+
+# ----------------------------
+# Cache titik -> stasiun terdekat per sel grid
+# ----------------------------
+def _cell_name(lat, lon):
+    # round() dulu: 106.5 / 0.1 = 1064.999... harus tetap masuk sel 1065
+    i = math.floor(round(lat / NEAREST_CELL_DEG, 6))
+    j = math.floor(round(lon / NEAREST_CELL_DEG, 6))
+    return f"cell_{NEAREST_CELL_DEG:g}_{i}_{j}"
+
+
+def _cell_get(lat, lon):
+    """Info sel: direct_empty (bool), station (dict), name (hasil reverse geocoding)."""
+    name = _cell_name(lat, lon)
+    with _cells_lock:
+        if name in _cells:
+            return dict(_cells[name])
+    entry = cache_read(name, ttl_hours=NEAREST_CACHE_TTL_HOURS) or {}
+    with _cells_lock:
+        _cells[name] = entry
+    return dict(entry)
+
+
+def _cell_update(lat, lon, **fields):
+    name = _cell_name(lat, lon)
+    with _cells_lock:
+        entry = {**_cells.get(name, {}), **fields}
+        _cells[name] = entry
+    cache_write(name, entry)
+
+
+def _nearest_station(lat, lon, radius_km):
+    """Lookup /v1/locations: dict name/latitude/longitude, atau None jika tidak ada."""
+    nearby_url = (
+        f"{OPEN_METEO_AQ_BASE}/locations?"
+        f"latitude={lat}&longitude={lon}&radius={radius_km}"
+    )
+    with tracing.span("fetch.open_meteo_locations", radius_km=radius_km) as sp:
+        nearby_res = guarded_get(nearby_url, timeout=10)
+        nearby_res.raise_for_status()
+        sp.set(status=nearby_res.status_code, bytes=len(nearby_res.content))
+    nearby_data = nearby_res.json()
+    if "results" in nearby_data and len(nearby_data["results"]) > 0:
+        nearest = nearby_data["results"][0]
+        return {
+            "name": nearest.get("name", "Unknown Station"),
+            "latitude": nearest["latitude"],
+            "longitude": nearest["longitude"],
+        }
+    return None
+
+
+def get_air_quality_by_coords(lat, lon,start_date=None, end_date=None, radius_km=200, refresh=False):
     """
     Ambil data kualitas udara berdasarkan latitude dan longitude.
     Jika lokasi utama tidak memiliki data, otomatis mencari stasiun terdekat.
 
+    Hasil resolusi disimpan per sel grid (NEAREST_CELL_DEG): titik yang diketahui kosong
+    langsung diambil dari stasiunnya (1 request, bukan 3), dan nama lokasi hasil reverse
+    geocoding dipakai ulang. Lookup /v1/locations hanya dilakukan jika fetch langsung
+    kosong atau gagal.
+
+    refresh=True melewati cache data jam-an (tetapi tetap menulisnya) untuk prefetch.
+
     Sumber data: Open-Meteo Air Quality API
     """
-    base_url = "https://air-quality-api.open-meteo.com/v1/air-quality"
-
     def fetch_data(latitude, longitude):
         """Helper function untuk request data dari koordinat tertentu"""
-        url = (
-            f"{base_url}?latitude={latitude}&longitude={longitude}"
-            "&hourly=pm10,pm2_5,carbon_monoxide,nitrogen_dioxide,sulphur_dioxide,ozone"
-            "&timezone=auto"
-        )
         if start_date and end_date:
-            url += f"&start_date={start_date}&end_date={end_date}"
             print(f"[data_fetcher] Mengambil data tanggal: {start_date} s.d {end_date}")
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        return fetch_open_meteo_range(latitude, longitude, start_date, end_date, refresh=refresh)
 
-        if "hourly" not in data:
+    def station_result(station):
+        print(f"[data_fetcher] Using nearest station: {station['name']} "
+              f"({station['latitude']:.4f}, {station['longitude']:.4f})")
+        df_nearest = fetch_data(station["latitude"], station["longitude"])
+        if df_nearest is None:
             return None
-
-        df = pd.DataFrame(data["hourly"])
-        df["time"] = pd.to_datetime(df["time"])
-        return df
+        return {
+            "data": df_nearest,
+            "location_name": f"Stasiun {station['name']}",
+            "latitude": station["latitude"],
+            "longitude": station["longitude"],
+            "source": "Open-Meteo Air Quality API (Nearest Station)"
+        }
+
+    cell = _cell_get(lat, lon)
+
+    # 🟦 0️⃣ Sel sudah diketahui tanpa data langsung → langsung ke stasiun terdekat
+    if cell.get("direct_empty") and cell.get("station"):
+        try:
+            result = station_result(cell["station"])
+            if result:
+                return result
+        except requests.exceptions.RequestException as e:
+            print(f"[data_fetcher] Error fetching cached nearest station: {e}")
 
     # 🟩 1️⃣ Coba ambil data langsung dari lokasi user
     try:
         df = fetch_data(lat, lon)
         if df is not None:
-            # Dapatkan nama lokasi via reverse geocoding
-            geolocator = Nominatim(user_agent="environpolicy_insight")
-            try:
-                location = geolocator.reverse((lat, lon), language="id")
-                city_name = location.raw["address"].get("city") or \
-                            location.raw["address"].get("town") or \
-                            location.raw["address"].get("state") or "Tidak diketahui"
-            except Exception:
-                city_name = "Tidak diketahui"
+            city_name = cell.get("name")
+            if not city_name:
+                # Dapatkan nama lokasi via reverse geocoding
+                geolocator = Nominatim(user_agent="environpolicy_insight", domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME)
+                try:
+                    with tracing.span("fetch.nominatim_reverse"):
+                        location = get_breaker(NOMINATIM_DOMAIN, NOMINATIM_SCHEME).call(
+                            geolocator.reverse, (lat, lon), language="id", failure_types=GEOCODER_FAILURES
+                        )
+                    city_name = location.raw["address"].get("city") or \
+                                location.raw["address"].get("town") or \
+                                location.raw["address"].get("state") or "Tidak diketahui"
+                except Exception:
+                    city_name = "Tidak diketahui"
+            fields = {"direct_empty": False}
+            if city_name != "Tidak diketahui":
+                fields["name"] = city_name
+            _cell_update(lat, lon, **fields)
 
             print(f"[data_fetcher] Found direct data for {city_name} ({lat:.4f}, {lon:.4f})")
 
@@ -173,40 +585,20 @@ def get_air_quality_by_coords(lat, lon,start_date=None, end_date=None, radius_km
             }
 
         else:
+            _cell_update(lat, lon, direct_empty=True)
             print(f"[data_fetcher] No data found for ({lat:.4f}, {lon:.4f}). Trying nearest station...")
 
     except requests.exceptions.RequestException as e:
         print(f"[data_fetcher] Error fetching main location data: {e}")
-        df = None
 
     # 🟨 2️⃣ Jika gagal → cari stasiun terdekat
     try:
-        nearby_url = (
-            f"https://air-quality-api.open-meteo.com/v1/locations?"
-            f"latitude={lat}&longitude={lon}&radius={radius_km}"
-        )
-        nearby_res = requests.get(nearby_url, timeout=10)
-        nearby_res.raise_for_status()
-        nearby_data = nearby_res.json()
-
-        if "results" in nearby_data and len(nearby_data["results"]) > 0:
-            nearest = nearby_data["results"][0]
-            nearest_lat = nearest["latitude"]
-            nearest_lon = nearest["longitude"]
-            nearest_name = nearest.get("name", "Unknown Station")
-
-            print(f"[data_fetcher] Using nearest station: {nearest_name} "
-                  f"({nearest_lat:.4f}, {nearest_lon:.4f})")
-
-            df_nearest = fetch_data(nearest_lat, nearest_lon)
-            if df_nearest is not None:
-                return {
-                    "data": df_nearest,
-                    "location_name": f"Stasiun {nearest_name}",
-                    "latitude": nearest_lat,
-                    "longitude": nearest_lon,
-                    "source": "Open-Meteo Air Quality API (Nearest Station)"
-                }
+        station = _nearest_station(lat, lon, radius_km)
+        if station:
+            _cell_update(lat, lon, station=station)
+            result = station_result(station)
+            if result:
+                return result
 
         print("[data_fetcher] No nearby station found.")
         return None
@@ -0,0 +1,199 @@
+# embeddings.py
+import os
+import time
+import resource
+from pathlib import Path
+from typing import List, Dict, Any
+
+import numpy as np
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Backend embedding: "torch" (HuggingFaceEmbeddings / PyTorch) atau "onnx" (ONNX Runtime, int8)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR", "models/all-MiniLM-L6-v2-onnx"))
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+# Batas minimum cosine similarity antar backend agar vektor dianggap kompatibel
+PARITY_MIN_COSINE = 0.98
+
+SAMPLE_TEXTS = [
+    "Batas PM2.5 rata-rata 24 jam menurut WHO adalah 15 µg/m³.",
+    "AQG level for annual NO2 exposure is 10 µg/m3.",
+    "Long-term exposure to fine particulate matter increases cardiovascular mortality.",
+    "Kualitas udara di Jakarta hari ini tidak sehat bagi kelompok sensitif.",
+    "Interim targets are intended to promote a gradual shift to lower concentrations.",
+    "Ozone peak season guideline is expressed as the average of daily maximum 8-hour mean.",
+    "Indeks Standar Pencemar Udara (ISPU) dihitung dari konsentrasi parameter tertinggi.",
+    "Household air pollution from solid fuel use remains a major health risk.",
+]
+
+
+class OnnxEmbeddings:
+    """
+    Embedder all-MiniLM-L6-v2 di atas ONNX Runtime (CPU) dengan bobot int8.
+    Interface sama dengan LangChain Embeddings (embed_documents / embed_query),
+    dan pooling-nya meniru sentence-transformers (mean pooling + L2 normalize)
+    sehingga vektor kompatibel dengan index yang dibangun backend PyTorch.
+    """
+
+    def __init__(self, model_dir: Path = ONNX_MODEL_DIR, quantized: bool = True,
+                 batch_size: int = 64, max_length: int = 256, model_name: str = EMBEDDING_MODEL_NAME):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        model_file = model_dir / (ONNX_INT8_FILE if quantized else ONNX_FP32_FILE)
+        if not model_file.exists():
+            raise FileNotFoundError(
+                f"Model ONNX tidak ditemukan di {model_file}. Jalankan: python -m agents.embeddings export"
+            )
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype="int64")
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype="int64")
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype="int64")
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype("float32")
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = [self._embed_batch(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        return np.vstack(vectors).tolist() if vectors else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+def get_embedding_model(backend: str = None):
+    """
+    Kembalikan embedder sesuai backend. Import dilakukan di dalam fungsi agar
+    backend "onnx" tidak ikut memuat PyTorch.
+    Jika model ONNX belum diekspor, otomatis fallback ke PyTorch.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        try:
+            return OnnxEmbeddings()
+        except Exception as e:
+            print(f"⚠️ Backend ONNX tidak tersedia ({e}), memakai PyTorch.")
+    elif backend != "torch":
+        raise ValueError(f"EMBEDDING_BACKEND harus 'torch' atau 'onnx', bukan '{backend}'")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+# ----------------------------
+# Export, parity check & benchmark
+# ----------------------------
+def export_onnx(model_dir: Path = ONNX_MODEL_DIR, model_name: str = EMBEDDING_MODEL_NAME):
+    """Ekspor model HF ke ONNX lalu kuantisasi dinamis bobotnya ke int8 (butuh torch, sekali saja)."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(model_dir)
+
+    dummy = tokenizer(["contoh kalimat"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(dummy[name] for name in input_names),
+            str(model_dir / ONNX_FP32_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    quantize_dynamic(str(model_dir / ONNX_FP32_FILE), str(model_dir / ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+    print(f"✅ Model ONNX (fp32 + int8) disimpan di {model_dir}")
+
+
+def parity_check(reference, candidate, texts: List[str] = None) -> Dict[str, Any]:
+    """
+    Bandingkan vektor dua backend pada teks yang sama: cosine per teks dan
+    kesamaan top-1 retrieval (setiap teks sebagai query terhadap semua teks).
+    """
+    texts = texts or SAMPLE_TEXTS
+    ref = np.asarray(reference.embed_documents(texts), dtype="float32")
+    cand = np.asarray(candidate.embed_documents(texts), dtype="float32")
+    ref /= np.linalg.norm(ref, axis=1, keepdims=True)
+    cand /= np.linalg.norm(cand, axis=1, keepdims=True)
+
+    cosine = (ref * cand).sum(axis=1)
+    # Query dari kandidat terhadap index referensi: top-1 harus teks yang sama
+    top1 = np.argmax(cand @ ref.T, axis=1)
+    result = {
+        "n_texts": len(texts),
+        "cosine_min": float(cosine.min()),
+        "cosine_mean": float(cosine.mean()),
+        "top1_agreement": float((top1 == np.arange(len(texts))).mean()),
+    }
+    result["passed"] = result["cosine_min"] >= PARITY_MIN_COSINE and result["top1_agreement"] == 1.0
+    return result
+
+
+def benchmark(model, texts: List[str] = None, repeats: int = 5) -> Dict[str, Any]:
+    """Ukur throughput (teks/detik) dan puncak RSS proses untuk satu backend."""
+    texts = (texts or SAMPLE_TEXTS) * 16
+    model.embed_documents(texts[:8])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    return {
+        "backend": type(model).__name__,
+        "texts": len(texts) * repeats,
+        "seconds": round(elapsed, 3),
+        "texts_per_sec": round(len(texts) * repeats / elapsed, 1),
+        # ru_maxrss dalam KB di Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+# ----------------------------
+# CLI: python -m agents.embeddings [export|check|bench]
+# ----------------------------
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "export":
+        export_onnx()
+    elif command == "check":
+        report = parity_check(get_embedding_model("torch"), OnnxEmbeddings())
+        print(report)
+        sys.exit(0 if report["passed"] else 1)
+    elif command == "bench":
+        # Jalankan per backend di proses terpisah agar angka RSS tidak tercampur
+        backend = sys.argv[2] if len(sys.argv) > 2 else EMBEDDING_BACKEND
+        model = OnnxEmbeddings() if backend == "onnx" else get_embedding_model("torch")
+        print(benchmark(model))
+    else:
+        print("Usage: python -m agents.embeddings [export|check|bench [torch|onnx]]")
@@ -1,100 +1,139 @@
 import os
 import google.generativeai as genai
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import json
-import re 
+from agents.knowledge_base import KnowledgeBase
+from agents.embeddings import get_embedding_model
+from agents.guidelines import default_guideline_table, exceedance_facts
+from agents.context_encoder import encode_summaries, estimate_tokens
+from agents.llm_scheduler import PRIORITY_ANALYSIS, DeadlineExceeded
+from agents.llm_client import AsyncLLMClient, make_transport
+from agents import tracing
 
 class AirQualityAgent:
-    def __init__(self, api_key, pdf_path):
+    def __init__(self, api_key, pdf_path, documents=None, corpus_dir=None, index_type=None):
+        """
+        pdf_path    : PDF WHO Guidelines (namespace "who")
+        documents   : dict opsional {namespace: [path, ...]} untuk dokumen tambahan
+        corpus_dir  : folder korpus, tiap sub-folder = namespace (default: data/corpus)
+        index_type  : "flat" | "hnsw" | "ivfpq" (default: env KB_INDEX_TYPE atau "flat")
+        """
         self.api_key = api_key
         self.pdf_path = pdf_path
+        self.documents = documents or {}
+        self.corpus_dir = corpus_dir or os.getenv("KB_CORPUS_DIR", "data/corpus")
+        self.index_type = index_type or os.getenv("KB_INDEX_TYPE", "flat")
         self.index_path = "faiss_index_store"  # Folder untuk menyimpan memori otak
-        self.vector_store = None
+        self.knowledge_base = None
+        self.guidelines = None  # tabel WHO terstruktur (diekstrak saat ingest)
+        self.last_token_report = {}  # estimasi token request terakhir (untuk monitoring)
         
         # Konfigurasi Gemini
         genai.configure(api_key=self.api_key)
         self.model = genai.GenerativeModel("gemini-2.5-flash")
+        # Client async: timeout per panggilan, retry + backoff, hedging opsional
+        self.llm = AsyncLLMClient(make_transport(self.model, self.api_key))
 
     def initialize_knowledge_base(self):
         """
-        Cek apakah index lokal sudah ada?
+        Cek apakah index lokal sudah ada dan masih cocok dengan daftar dokumen?
         - Jika YA: Load langsung (Cepat, < 2 detik)
-        - Jika TIDAK: Baca PDF -> Embed -> Simpan (Lama, butuh CPU)
-        """
-        # Setup model embedding
-        # Model ini akan didownload otomatis jika belum ada di cache
-        embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-        # 1. Cek apakah kita sudah pernah memproses PDF ini sebelumnya
-        if os.path.exists(self.index_path):
-            try:
-                print("📂 Memuat Knowledge Base dari disk (Cepat)...")
-                # allow_dangerous_deserialization=True diperlukan untuk memuat file lokal pickle
-                self.vector_store = FAISS.load_local(
-                    self.index_path, 
-                    embedding_model, 
-                    allow_dangerous_deserialization=True
-                )
-                return True, "Knowledge base dimuat dari penyimpanan lokal."
-            except Exception as e:
-                print(f"⚠️ Gagal memuat index lama, membuat ulang: {e}")
-
-        # 2. Jika belum ada atau gagal load, buat dari awal (Proses Berat)
-        if not os.path.exists(self.pdf_path):
-            return False, "File PDF tidak ditemukan."
+        - Jika TIDAK: Baca dokumen -> Embed -> Simpan (Lama, butuh CPU)
+        """
+        # Setup model embedding (backend dipilih lewat env EMBEDDING_BACKEND: torch | onnx)
+        # Model PyTorch akan didownload otomatis jika belum ada di cache
+        embedding_model = get_embedding_model()
 
-        try:
-            print("⚙️ Memproses PDF dari awal (Mungkin butuh waktu)...")
-            
-            # Load PDF
-            loader = PyPDFLoader(self.pdf_path)
-            pages = loader.load()
-
-            # Split Text
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            docs = text_splitter.split_documents(pages)
-
-            # Create Embeddings & Store
-            self.vector_store = FAISS.from_documents(docs, embedding_model)
-            
-            # 3. SIMPAN KE DISK agar besok tidak perlu proses ulang
-            self.vector_store.save_local(self.index_path)
-            print("✅ Knowledge Base berhasil disimpan ke disk.")
-            
-            return True, "Knowledge base berhasil dibangun dan disimpan."
-            
-        except Exception as e:
-            return False, f"Error membangun knowledge base: {str(e)}"
+        kb = KnowledgeBase(self.index_path, embedding_model, index_type=self.index_type)
+        kb.add_document(self.pdf_path, namespace="who")
+        for namespace, paths in self.documents.items():
+            for path in paths:
+                kb.add_document(path, namespace=namespace)
+        kb.add_directory(self.corpus_dir)
+
+        success, msg = kb.load_or_build()
+        if success:
+            self.knowledge_base = kb
+            self.guidelines = kb.guidelines or default_guideline_table()
+        return success, msg
+
+    def get_relevant_context(self, query, k=3, namespaces=None):
+        """
+        Retrieval hybrid (FAISS + BM25, digabung dengan RRF).
+        k default 3: fusi leksikal membuat konteks lebih tepat sasaran,
+        jadi prompt bisa lebih pendek dibanding k=4 vector-only.
 
-    def get_relevant_context(self, query, k=4):
-        if not self.vector_store:
+        namespaces: list namespace opsional untuk membatasi pencarian (misal ["who"]).
+        None = cari di semua dokumen.
+        """
+        if not self.knowledge_base:
             return []
-        docs = self.vector_store.similarity_search(query, k=k)
+        with tracing.span("retrieval", k=k, mode="hybrid", namespaces=namespaces) as sp:
+            docs = self.knowledge_base.search(query, k=k, namespaces=namespaces, mode="hybrid")
+            sp.set(n_docs=len(docs), context_tokens=sum(estimate_tokens(d.page_content) for d in docs))
         return docs
 
-    def analyze_air_quality(self, user_query, air_quality_json):
-        if not self.vector_store:
-            return "Maaf, knowledge base belum siap. Silakan restart aplikasi."
+    def get_exceedance_facts(self, series):
+        """
+        series: dict {nama_lokasi: DataFrame jam-an}. Exceedance terhadap tabel WHO
+        dihitung lokal, hasilnya baris fakta ringkas untuk prompt ("" jika tidak ada).
+        """
+        if not series or not self.guidelines:
+            return ""
+        return exceedance_facts(series, self.guidelines)
+
+    def _generate(self, prompt, label):
+        """
+        Panggil Gemini lewat AsyncLLMClient (scheduler process-wide + timeout/retry/hedging).
+        Error tidak dikembalikan mentah ke user: detail dicetak ke log, user menerima pesan ramah.
+        """
+        try:
+            with tracing.span("generation", label=label, prompt_tokens=estimate_tokens(prompt)) as sp:
+                text = self.llm.generate_sync(prompt, priority=PRIORITY_ANALYSIS, label=label)
+                sp.set(response_tokens=estimate_tokens(text))
+            return text
+        except DeadlineExceeded as e:
+            print(f"[AirQualityAgent] {label} deadline habis: {e}")
+            return "Maaf, layanan AI sedang sibuk sehingga analisis belum bisa dibuat. Silakan coba beberapa saat lagi."
+        except Exception as e:
+            print(f"[AirQualityAgent] {label} gagal: {type(e).__name__}: {e}")
+            return "Maaf, analisis AI gagal dibuat karena gangguan koneksi ke Gemini. Silakan coba lagi."
+
+    def _report_tokens(self, label, prompt, **parts):
+        """Catat estimasi token prompt dan tiap bagiannya untuk request ini."""
+        report = {"prompt": estimate_tokens(prompt)}
+        report.update({name: estimate_tokens(text) for name, text in parts.items()})
+        self.last_token_report = report
+        detail = ", ".join(f"{k}={v}" for k, v in report.items())
+        print(f"[AirQualityAgent] {label} estimasi token: {detail}")
+        return report
+
+    def _exceedance_section(self, facts):
+        if not facts:
+            return ""
+        return f"""
+        --- FAKTA EXCEEDANCE vs WHO AQG 2021 (dihitung lokal, µg/m³) ---
+        {facts}
+        """
+
+    def analyze_air_quality(self, user_query, air_quality_json, series=None):
+        """
+        series (opsional): dict {nama_lokasi: DataFrame} untuk menghitung exceedance lokal.
+        Jika ada, angka batas WHO sudah masuk sebagai fakta sehingga retrieval cukup
+        mengambil konteks dampak kesehatan dengan k lebih kecil.
+        """
+        if not self.knowledge_base:
+            # Sama seperti multi-area: tetap analisis dari data, hanya tanpa referensi WHO
+            print("[AirQualityAgent] Knowledge base belum siap, analisis tanpa referensi dokumen.")
+
+        facts = self.get_exceedance_facts(series)
 
         # 1. Cari konteks
-        search_query = f"{user_query} PM2.5 PM10 NO2 SO2 Ozone guidelines limits health effects"
-        relevant_docs = self.get_relevant_context(search_query)
-        # === PERBAIKAN 1: BERSIHKAN TEKS DARI ARTEFAK PDF ===
-        raw_context = "\n\n".join([doc.page_content for doc in relevant_docs])
-        
-        # Bersihkan karakter aneh seperti /uni0037 (biasanya simbol %)
-        clean_context = raw_context.replace("/uni0037", "%").replace("uni0037", "%")
-        # Hapus karakter kontrol non-ascii jika perlu (opsional)
-        clean_context = clean_context.replace('\x00', '')
-        clean_context = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', clean_context)
-        clean_context = re.sub(r'\s+', ' ', clean_context).strip() 
-        # ====================================================
+        if facts:
+            relevant_docs = self.get_relevant_context(f"{user_query} health effects recommendations", k=2)
+        else:
+            search_query = f"{user_query} PM2.5 PM10 NO2 SO2 Ozone guidelines limits health effects"
+            relevant_docs = self.get_relevant_context(search_query)
+        # Teks chunk sudah dinormalisasi saat ingest (lihat knowledge_base.normalize_text)
+        clean_context = "\n\n".join([doc.page_content for doc in relevant_docs])
         # 2. Prompt untuk Gemini
         prompt = f"""
         Kamu adalah Ahli Analisis Kualitas Udara.
@@ -103,7 +142,7 @@ class AirQualityAgent:
         
         --- DATA OBSERVASI DAN PREDIKSI UDARA ---
         {air_quality_json}
-        
+        {self._exceedance_section(facts)}
         --- REFERENSI WHO (Konteks) ---
         {clean_context}
         
@@ -114,32 +153,36 @@ class AirQualityAgent:
         1. LOKASI: Jika data JSON di atas memiliki koordinat yang valid, ASUMSIKAN ITU ADALAH LOKASI YANG DIMINTA USER (misal: Makassar), meskipun nama kotanya tidak tertulis eksplisit di JSON. Jangan ragu.
         2. KONTEKS: Jika ada teks referensi yang sulit dibaca (artefak PDF), abaikan bagian yang rusak dan fokus pada angka pedoman WHO yang bisa dibaca.
         3. Berikan analisis risiko kesehatan singkat dan rekomendasi konkret.
+        4. KATEGORI: Jika ada baris INDEKS TERKINI, pakai nilai & kategori ISPU/US AQI itu apa adanya (jangan menilai ulang dari µg/m³).
         """
+        self._report_tokens("analyze", prompt, data=str(air_quality_json), facts=facts, context=clean_context)
 
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            return f"Maaf, terjadi kesalahan koneksi ke Gemini: {str(e)}"
+        return self._generate(prompt, "analyze")
         
-    def compare_multi_area_quality(self, area_name, aggregated_data, user_query):
+    def compare_multi_area_quality(self, area_name, aggregated_data, user_query, series=None):
         """
         Analisis perbandingan untuk banyak lokasi (Multi-Area).
         aggregated_data adalah list of dict berisi ringkasan data tiap kota.
+        series (opsional): dict {nama_kota: DataFrame} untuk fakta exceedance lokal.
         """
+        facts = self.get_exceedance_facts(series)
+
         # Mengambil konteks umum tentang standar polusi
-        relevant_docs = self.get_relevant_context("PM2.5 PM10 comparison dangerous levels NO2 SO2 Ozone guidelines limits health effects")
+        if facts:
+            relevant_docs = self.get_relevant_context("air pollution health effects policy recommendations", k=2)
+        else:
+            relevant_docs = self.get_relevant_context("PM2.5 PM10 comparison dangerous levels NO2 SO2 Ozone guidelines limits health effects")
         context_text = "\n\n".join([doc.page_content for doc in relevant_docs])
         
-        # Convert data to readable string json
-        data_str = json.dumps(aggregated_data, indent=2)
+        # Encode ringkasan sebagai tabel kolom (header sekali) agar prompt ringkas
+        data_str = encode_summaries(aggregated_data)
 
         prompt = f"""
         Kamu adalah Konsultan Kebijakan Lingkungan. User menanyakan tentang wilayah luas: "{area_name}".
         
         --- DATA RINGKASAN MULTI-LOKASI ---
         {data_str}
-        
+        {self._exceedance_section(facts)}
         --- CONTEXT (WHO) ---
         {context_text}
         
@@ -148,13 +191,10 @@ class AirQualityAgent:
         
         Tugas:
         1. Bandingkan kualitas udara antar lokasi tersebut. Mana yang paling bersih dan paling kotor?
-        2. Identifikasi pola umum (misal: rata-rata wilayah ini sedang buruk/baik).
+        2. Identifikasi pola umum (misal: rata-rata wilayah ini sedang buruk/baik). Pakai kolom ispu/ispu_kategori yang sudah dihitung sebagai kategori resmi tiap lokasi.
         3. Berikan rekomendasi kebijakan atau saran kesehatan umum untuk warga di area "{area_name}".
         """
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            return f"Error Gemini Multi-Area: {str(e)}"
+        self._report_tokens("multi-area", prompt, data=data_str, facts=facts, context=context_text)
+        return self._generate(prompt, "multi-area")
         
     
\ No newline at end of file
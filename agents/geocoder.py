@@ -2,6 +2,18 @@ import google.generativeai as genai
 from geopy.geocoders import Nominatim
 from typing import List, Tuple, Optional, Dict, Any
 import json
+import hashlib
+from collections import namedtuple
+from agents.llm_scheduler import PRIORITY_INTENT, PRIORITY_DECOMPOSITION
+from agents.llm_client import AsyncLLMClient, make_transport
+from agents.context_encoder import estimate_tokens
+from agents import tracing
+from agents import cache
+from agents.data_fetcher import NOMINATIM_DOMAIN, NOMINATIM_SCHEME, GEOCODER_FAILURES
+from agents.circuit_breaker import get_breaker, CircuitOpenError
+
+# Hasil geocoding dari cache (atribut sama dengan geopy Location yang dipakai di sini)
+CachedLocation = namedtuple("CachedLocation", ["address", "latitude", "longitude"])
 
 class GeocoderAgent:
     """
@@ -16,11 +28,16 @@ class GeocoderAgent:
         genai.configure(api_key=self.api_key)
         
         # PENTING: Gunakan gemini-2.5-flash yang support JSON Mode native
+        generation_config = {"response_mime_type": "application/json"}
         self.model = genai.GenerativeModel(
             "gemini-2.5-flash",
-            generation_config={"response_mime_type": "application/json"}
+            generation_config=generation_config
+        )
+        # Client async: timeout per panggilan, retry + backoff, hedging opsional
+        self.llm = AsyncLLMClient(make_transport(self.model, self.api_key, generation_config))
+        self.geolocator = Nominatim(
+            user_agent="environpolicy_insight_geocoder", domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME
         )
-        self.geolocator = Nominatim(user_agent="environpolicy_insight_geocoder")
         
     def extract_location_from_query(self, user_query: str, current_date:str) -> Optional[str]:
         """
@@ -100,8 +117,11 @@ class GeocoderAgent:
         """
 
         try:
-            response = self.model.generate_content(prompt)
-            data = json.loads(response.text)
+            # Intent extraction didahulukan di antrean LLM: semua langkah lain menunggu hasilnya
+            with tracing.span("intent", prompt_tokens=estimate_tokens(prompt)) as sp:
+                response_text = self.llm.generate_sync(prompt, priority=PRIORITY_INTENT, label="intent")
+                data = json.loads(response_text)
+                sp.set(response_tokens=estimate_tokens(response_text), intent=data.get("intent"))
             return data
         except Exception as e:
             print(f"[Geocoder] Error extract location: {e}")
@@ -163,9 +183,11 @@ class GeocoderAgent:
         """
 
         try:
-            response = self.model.generate_content(prompt)
-            data = json.loads(response.text)
-            sub_areas = data.get("sub_areas", [])
+            with tracing.span("decomposition", prompt_tokens=estimate_tokens(prompt)) as sp:
+                response_text = self.llm.generate_sync(prompt, priority=PRIORITY_DECOMPOSITION, label="decomposition")
+                data = json.loads(response_text)
+                sub_areas = data.get("sub_areas", [])
+                sp.set(response_tokens=estimate_tokens(response_text), n_sub_areas=len(sub_areas))
             
             # Filter: Hapus jika hanya berisi kata level (bukan nama sebenarnya)
             filtered = []
@@ -182,6 +204,39 @@ class GeocoderAgent:
         except Exception as e:
             print(f"[Geocoder] Error AI decomposition: {e}")
             return []
+
+    def _geocode(self, query: str):
+        """
+        Satu panggilan Nominatim lewat circuit breaker, dicatat sebagai span upstream.
+        Hasil disimpan ke cache; saat Nominatim down/breaker terbuka, hasil cache terakhir dipakai.
+        """
+        cache_name = "geocode_" + hashlib.sha1(query.strip().lower().encode("utf-8")).hexdigest()[:16]
+        with tracing.span("fetch.nominatim", query=query) as sp:
+            try:
+                location = get_breaker(NOMINATIM_DOMAIN, NOMINATIM_SCHEME).call(
+                    self.geolocator.geocode, query, failure_types=GEOCODER_FAILURES
+                )
+            except (CircuitOpenError,) + GEOCODER_FAILURES:
+                cached, _ = cache.cache_read_stale(cache_name)
+                if not cached:
+                    raise
+                sp.set(stale=True, found=True)
+                return CachedLocation(**cached)
+            sp.set(found=location is not None)
+            if location:
+                cache.cache_write(cache_name, {"address": location.address, "latitude": location.latitude,
+                                               "longitude": location.longitude})
+            return location
+
+    def geocode_point(self, query: str) -> Optional[Tuple[float, float]]:
+        """(lat, lon) satu nama tempat — sama persis dengan jalur chat single-area, None jika gagal."""
+        try:
+            location = self._geocode(query)
+        except Exception as e:
+            print(f"[Geocoder] Gagal geocode '{query}': {e}")
+            return None
+        return (location.latitude, location.longitude) if location else None
+
     def get_coordinates_for_area(
     self,
     user_query: str,
@@ -221,7 +276,7 @@ class GeocoderAgent:
         # 2. Coba geocode area induk untuk single atau fallback
         # ---------------------------
         try:
-            single_loc = self.geolocator.geocode(area_name)
+            single_loc = self._geocode(area_name)
         except:
             single_loc = None
 
@@ -242,7 +297,7 @@ class GeocoderAgent:
         for name in sub_regions:
             try:
                 query_geo = f"{name}, {area_name}"
-                location = self.geolocator.geocode(query_geo)
+                location = self._geocode(query_geo)
 
                 if location:
                     disp_name = name.title()
@@ -250,7 +305,7 @@ class GeocoderAgent:
                     continue
 
                 # fallback: geocode nama sub-area saja
-                location = self.geolocator.geocode(name)
+                location = self._geocode(name)
                 if location:
                     disp_name = name.title()
                     results.append((disp_name, location.latitude, location.longitude))
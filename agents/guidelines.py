@@ -0,0 +1,273 @@
+# guidelines.py
+import re
+import json
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+# Nama polutan mengikuti kolom Open-Meteo agar bisa langsung dipakai ke DataFrame data_fetcher
+POLLUTANT_LABELS = {
+    "pm2_5": "PM2.5",
+    "pm10": "PM10",
+    "nitrogen_dioxide": "NO2",
+    "sulphur_dioxide": "SO2",
+    "ozone": "O3",
+    "carbon_monoxide": "CO",
+}
+PERIOD_LABELS = {"annual": "tahunan", "24h": "24 jam", "8h": "8 jam", "peak_season": "musim puncak"}
+
+# WHO Global Air Quality Guidelines 2021 (Tabel ringkasan, semua dalam µg/m³).
+# Dipakai sebagai fallback jika ekstraksi dari PDF gagal / tidak lengkap.
+# "interim" = [IT-1, IT-2, IT-3, IT-4], None jika tidak ada.
+WHO_AQG_2021: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "pm2_5": {
+        "annual": {"aqg": 5, "interim": [35, 25, 15, 10]},
+        "24h": {"aqg": 15, "interim": [75, 50, 37.5, 25]},
+    },
+    "pm10": {
+        "annual": {"aqg": 15, "interim": [70, 50, 30, 20]},
+        "24h": {"aqg": 45, "interim": [150, 100, 75, 50]},
+    },
+    "ozone": {
+        "peak_season": {"aqg": 60, "interim": [100, 70, None, None]},
+        "8h": {"aqg": 100, "interim": [160, 120, None, None]},
+    },
+    "nitrogen_dioxide": {
+        "annual": {"aqg": 10, "interim": [40, 30, 20, None]},
+        "24h": {"aqg": 25, "interim": [120, 50, None, None]},
+    },
+    "sulphur_dioxide": {
+        "24h": {"aqg": 40, "interim": [125, 50, None, None]},
+    },
+    "carbon_monoxide": {
+        "24h": {"aqg": 4000, "interim": [7000, None, None, None]},
+    },
+}
+
+GUIDELINES_FILE = "guidelines.json"
+
+_PDF_POLLUTANTS = {"PM2.5": "pm2_5", "PM10": "pm10", "O3": "ozone", "NO2": "nitrogen_dioxide",
+                   "SO2": "sulphur_dioxide", "CO": "carbon_monoxide"}
+_PDF_PERIODS = {"annual": "annual", "24-hour": "24h", "8-hour": "8h", "peak season": "peak_season"}
+
+# Header baris polutan di tabel WHO, contoh: "PM2.5, μg/m3" atau "CO, mg/m3"
+_POLLUTANT_HEADER = re.compile(r"\b(PM2\.5|PM10|O3|NO2|SO2|CO),?\s*([μµm]g)/m3")
+# Baris periode: label + 4 kolom interim target + 1 kolom AQG ("–" jika kosong)
+_VALUE = r"(?:\d+(?:\.\d+)?|[–—-])"
+_PERIOD_ROW = re.compile(
+    rf"(Annual|24-hour|8-hour|Peak season)[a-z]?(?:\s[a-z](?=\s))?\s+((?:{_VALUE}\s+){{4}}\d+(?:\.\d+)?)",
+    re.IGNORECASE,
+)
+
+
+def _parse_value(token: str) -> Optional[float]:
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+def extract_guideline_table(texts: List[str]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Ekstrak tabel pollutant -> averaging period -> {aqg, interim} dari teks PDF WHO
+    (teks sudah dinormalisasi). Hanya baris yang lolos validasi yang diambil.
+    """
+    text = " ".join(texts)
+    headers = list(_POLLUTANT_HEADER.finditer(text))
+    table: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    for i, header in enumerate(headers):
+        pollutant = _PDF_POLLUTANTS[header.group(1)]
+        factor = 1000.0 if header.group(2) == "mg" else 1.0
+        segment_end = headers[i + 1].start() if i + 1 < len(headers) else min(len(text), header.end() + 200)
+        segment = text[header.end():segment_end]
+
+        for row in _PERIOD_ROW.finditer(segment):
+            period = _PDF_PERIODS[row.group(1).lower()]
+            values = [_parse_value(v) for v in row.group(2).split()]
+            aqg, interim = values[-1], values[:-1]
+            present = [v for v in interim if v is not None]
+            # Validasi: interim target harus menurun dan semuanya di atas AQG
+            if not aqg or any(a <= b for a, b in zip(present, present[1:])) or any(v <= aqg for v in present):
+                continue
+            table.setdefault(pollutant, {}).setdefault(period, {
+                "aqg": aqg * factor,
+                "interim": [v * factor if v is not None else None for v in interim],
+            })
+    return table
+
+
+def build_guideline_table(texts: List[str]) -> Dict[str, Any]:
+    """
+    Gabungkan hasil ekstraksi PDF dengan tabel default WHO 2021.
+    Setiap entri diberi "source": "pdf" atau "default" agar mudah diaudit.
+    """
+    extracted = extract_guideline_table(texts)
+    table: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for pollutant, periods in WHO_AQG_2021.items():
+        for period, default in periods.items():
+            entry = extracted.get(pollutant, {}).get(period)
+            source = "pdf" if entry else "default"
+            table.setdefault(pollutant, {})[period] = {**(entry or default), "source": source}
+    if texts:
+        n_pdf = sum(e["source"] == "pdf" for p in table.values() for e in p.values())
+        n_total = sum(len(p) for p in table.values())
+        print(f"📏 Tabel pedoman WHO: {n_pdf}/{n_total} entri diekstrak dari PDF, sisanya default.")
+    return {"unit": "µg/m³", "reference": "WHO Global Air Quality Guidelines 2021", "pollutants": table}
+
+
+def save_guideline_table(table: Dict[str, Any], index_path: Path):
+    with open(Path(index_path) / GUIDELINES_FILE, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+
+
+def load_guideline_table(index_path: Path) -> Optional[Dict[str, Any]]:
+    path = Path(index_path) / GUIDELINES_FILE
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+_DEFAULT_TABLE = build_guideline_table([])
+
+
+def default_guideline_table() -> Dict[str, Any]:
+    """Tabel WHO 2021 tanpa PDF (dibangun sekali saat import; jangan dimodifikasi)."""
+    return _DEFAULT_TABLE
+
+
+# ----------------------------
+# Perhitungan exceedance (vectorized NumPy)
+# ----------------------------
+def _daily_means(days_idx: np.ndarray, n_days: int, values: np.ndarray) -> np.ndarray:
+    """Rata-rata harian untuk matriks (jam x polutan), NaN diabaikan."""
+    valid = ~np.isnan(values)
+    sums = np.zeros((n_days, values.shape[1]))
+    counts = np.zeros((n_days, values.shape[1]))
+    np.add.at(sums, days_idx, np.where(valid, values, 0.0))
+    np.add.at(counts, days_idx, valid)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def _daily_max_8h(days_idx: np.ndarray, n_days: int, values: np.ndarray) -> np.ndarray:
+    """Maksimum harian dari rata-rata bergerak 8 jam (MDA8), untuk satu kolom."""
+    result = np.full(n_days, np.nan)
+    if len(values) < 8:
+        return result
+    windows = np.lib.stride_tricks.sliding_window_view(values, 8)
+    valid_counts = (~np.isnan(windows)).sum(axis=1)
+    sums = np.where(np.isnan(windows), 0.0, windows).sum(axis=1)
+    # Minimal 6 dari 8 jam valid, seperti aturan kelengkapan data umum
+    rolling = np.where(valid_counts >= 6, sums / np.maximum(valid_counts, 1), np.nan)
+    # Rata-rata 8 jam dicatat pada hari jam terakhir window
+    end_days = days_idx[7:]
+    ok = ~np.isnan(rolling)
+    np.fmax.at(result, end_days[ok], rolling[ok])
+    return result
+
+
+def _interim_level(values: np.ndarray, entry: Dict[str, Any]) -> np.ndarray:
+    """
+    Untuk setiap nilai, kembalikan indeks interim target paling ketat yang masih terpenuhi:
+    0 = memenuhi AQG, k = memenuhi IT-k (tapi tidak IT-(k+1)/AQG), -1 = di atas IT-1.
+    """
+    levels = [(k + 1, v) for k, v in enumerate(entry["interim"]) if v is not None]
+    result = np.full(values.shape, -1, dtype=int)
+    # Iterasi dari target paling longgar ke paling ketat; yang terakhir terpenuhi menang
+    for it, level in levels:
+        result = np.where(values <= level, it, result)
+    return np.where(values <= entry["aqg"], 0, result)
+
+
+def compute_exceedances(df: pd.DataFrame, table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Bandingkan satu seri jam-an Open-Meteo dengan tabel pedoman.
+    Semua polutan & jam dihitung sekaligus dengan operasi array, hasilnya
+    satu ringkasan per (polutan, periode).
+    """
+    if df is None or df.empty or "time" not in df.columns:
+        return []
+    pollutants = [p for p in POLLUTANT_LABELS if p in df.columns and p in table["pollutants"]]
+    if not pollutants:
+        return []
+
+    df = df.sort_values("time")
+    days = pd.to_datetime(df["time"]).to_numpy().astype("datetime64[D]")
+    unique_days, days_idx = np.unique(days, return_inverse=True)
+    values = df[pollutants].to_numpy(dtype=float)
+    daily = _daily_means(days_idx, len(unique_days), values)
+
+    facts = []
+    for j, pollutant in enumerate(pollutants):
+        for period, entry in table["pollutants"][pollutant].items():
+            if period == "24h":
+                series = daily[:, j]
+            elif period == "8h":
+                series = _daily_max_8h(days_idx, len(unique_days), values[:, j])
+            elif period in ("annual", "peak_season"):
+                # Periode data jauh lebih pendek dari setahun: hanya indikatif
+                series = np.array([np.nanmean(values[:, j])]) if np.isfinite(values[:, j]).any() else np.array([np.nan])
+            else:
+                continue
+
+            ok = ~np.isnan(series)
+            if not ok.any():
+                continue
+            indicative = period in ("annual", "peak_season")
+            series_ok = series[ok]
+            levels = _interim_level(series_ok, entry)
+            peak = int(np.argmax(series_ok))
+            facts.append({
+                "pollutant": pollutant,
+                "period": period,
+                "aqg": entry["aqg"],
+                "n_days": int(len(series_ok)),
+                "days_above_aqg": int((series_ok > entry["aqg"]).sum()),
+                "peak_value": round(float(series_ok[peak]), 1),
+                "peak_date": None if indicative else str(unique_days[ok][peak]),
+                "peak_ratio": round(float(series_ok[peak] / entry["aqg"]), 2),
+                "peak_level": int(levels[peak]),
+                "indicative": indicative,
+            })
+    return facts
+
+
+def _format_level(level: int) -> str:
+    if level == 0:
+        return "memenuhi AQG"
+    if level < 0:
+        return "di atas IT-1"
+    return f"setara IT-{level}"
+
+
+def exceedance_facts(series: Dict[str, pd.DataFrame], table: Dict[str, Any]) -> str:
+    """
+    Ringkas exceedance semua area menjadi baris fakta pendek untuk prompt LLM, misal:
+    "- Jakarta · PM2.5 24 jam (AQG 15): 3/3 hari > AQG; puncak 42.1 (2.81× AQG, setara IT-2) pada 2025-12-05"
+    Polutan yang seluruhnya memenuhi AQG digabung dalam satu baris per area agar prompt tetap ringkas.
+    """
+    lines = []
+    for name, df in series.items():
+        compliant = []
+        for f in compute_exceedances(df, table):
+            label = f"{POLLUTANT_LABELS[f['pollutant']]} {PERIOD_LABELS[f['period']]}"
+            if f["days_above_aqg"] == 0:
+                compliant.append(label)
+            elif f["indicative"]:
+                lines.append(
+                    f"- {name} · {label} (AQG {f['aqg']:g}, indikatif dari rata-rata periode data): "
+                    f"{f['peak_value']} ({f['peak_ratio']}× AQG, {_format_level(f['peak_level'])})"
+                )
+            else:
+                lines.append(
+                    f"- {name} · {label} (AQG {f['aqg']:g}): {f['days_above_aqg']}/{f['n_days']} hari > AQG; "
+                    f"puncak {f['peak_value']} ({f['peak_ratio']}× AQG, {_format_level(f['peak_level'])}) "
+                    f"pada {f['peak_date']}"
+                )
+        if compliant:
+            lines.append(f"- {name} · memenuhi AQG: {', '.join(compliant)}")
+    return "\n".join(lines)
@@ -0,0 +1,388 @@
+# knowledge_base.py
+import os
+import re
+import json
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Iterable, Any, Tuple
+
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from agents.lexical_index import BM25Index
+from agents.guidelines import build_guideline_table, save_guideline_table, load_guideline_table
+
+# Jenis index yang didukung:
+# - flat  : exact search, cocok untuk korpus kecil (< ~5rb chunk)
+# - hnsw  : graph ANN, latensi rendah tanpa training
+# - ivfpq : inverted file + product quantization, memori paling hemat untuk korpus besar
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = int(os.getenv("KB_HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("KB_IVF_NPROBE", "16"))
+# PQ 8-bit butuh ~40 titik per centroid (256 centroid) agar training stabil
+IVFPQ_MIN_CHUNKS = 10000
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.json"
+BM25_FILE = "bm25.json"
+MANIFEST_FILE = "manifest.json"
+EMBED_BATCH_SIZE = 256
+
+# Mode pencarian: vector (FAISS), lexical (BM25), hybrid (fusi RRF keduanya)
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+RRF_K = 60  # konstanta Reciprocal Rank Fusion
+HYBRID_CANDIDATES = 4  # tiap retriever mengambil k * HYBRID_CANDIDATES kandidat sebelum fusi
+
+# Naikkan versi ini setiap kali aturan normalisasi berubah agar index lama dibangun ulang
+NORMALIZER_VERSION = 1
+
+_PDF_GLYPH_ARTIFACTS = re.compile(r"/?uni0037")  # biasanya simbol % dari font PDF WHO
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Bersihkan teks chunk SEKALI saat ingest, sehingga hasil retrieval langsung siap
+    dipakai di prompt tanpa pembersihan ulang per query.
+    - artefak glyph PDF (/uni0037 -> %)
+    - karakter kontrol
+    - NFKC: subscript/superscript & ligatur jadi karakter biasa (NO₂ -> NO2, m³ -> m3)
+    - whitespace berlebih
+    """
+    text = _PDF_GLYPH_ARTIFACTS.sub("%", text)
+    text = _CONTROL_CHARS.sub("", text)
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class KnowledgeBase:
+    """
+    Corpus manager untuk banyak dokumen (WHO, ISPU, KLHK, studi regional, dll).
+
+    Setiap dokumen didaftarkan di bawah sebuah namespace, sehingga pencarian bisa
+    difilter per namespace saat query. Semua chunk disimpan dalam satu index FAISS
+    (flat / HNSW / IVF-PQ) dengan ID = posisi chunk, dan filter namespace memakai
+    IDSelector sehingga tidak perlu index terpisah per namespace.
+    """
+
+    def __init__(self, index_path: str, embedding_model, index_type: str = "flat",
+                 chunk_size: int = 1000, chunk_overlap: int = 200,
+                 guideline_namespace: Optional[str] = "who"):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"index_type harus salah satu dari {INDEX_TYPES}, bukan '{index_type}'")
+
+        self.index_path = Path(index_path)
+        self.embedding_model = embedding_model
+        self.index_type = index_type
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # Namespace dokumen WHO yang tabel pedomannya diekstrak saat ingest
+        self.guideline_namespace = guideline_namespace
+
+        self.documents: Dict[str, str] = {}  # path dokumen -> namespace
+        self.chunks: List[Dict[str, Any]] = []  # {"text", "namespace", "source", "page"}
+        self.index = None
+        self.lexical_index: Optional[BM25Index] = None
+        self.guidelines: Optional[Dict[str, Any]] = None
+        self.built_index_type = None  # bisa berbeda dari index_type jika fallback
+        self._namespace_ids: Dict[str, np.ndarray] = {}
+
+    # ----------------------------
+    # Registrasi dokumen
+    # ----------------------------
+    def add_document(self, path: str, namespace: str = "default"):
+        """Daftarkan satu dokumen ke namespace tertentu."""
+        self.documents[str(path)] = namespace
+
+    def add_directory(self, root: str):
+        """
+        Daftarkan semua dokumen di dalam folder korpus.
+        Setiap sub-folder menjadi namespace, misal:
+            data/corpus/ispu/PermenLHK_14_2020.pdf  -> namespace "ispu"
+            data/corpus/klhk/laporan_2023.pdf       -> namespace "klhk"
+        File di root folder masuk namespace "default".
+        """
+        root = Path(root)
+        if not root.is_dir():
+            return
+        for path in sorted(root.rglob("*")):
+            if path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            rel = path.relative_to(root)
+            namespace = rel.parts[0] if len(rel.parts) > 1 else "default"
+            self.add_document(str(path), namespace)
+
+    @property
+    def namespaces(self) -> List[str]:
+        return sorted(self._namespace_ids.keys())
+
+    # ----------------------------
+    # Build / load
+    # ----------------------------
+    def load_or_build(self) -> Tuple[bool, str]:
+        """
+        - Jika index di disk masih cocok dengan daftar dokumen: load langsung (cepat)
+        - Jika tidak: baca dokumen -> embed -> simpan (lama, butuh CPU)
+        """
+        manifest = self._current_manifest()
+        if not manifest["documents"]:
+            return False, "File PDF tidak ditemukan."
+
+        if self.load(expected_manifest=manifest):
+            return True, "Knowledge base dimuat dari penyimpanan lokal."
+
+        try:
+            self.build(manifest)
+            self.save(manifest)
+            return True, "Knowledge base berhasil dibangun dan disimpan."
+        except Exception as e:
+            return False, f"Error membangun knowledge base: {str(e)}"
+
+    def build(self, manifest: Optional[Dict[str, Any]] = None):
+        manifest = manifest or self._current_manifest()
+        print(f"⚙️ Memproses {len(manifest['documents'])} dokumen dari awal (Mungkin butuh waktu)...")
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap
+        )
+
+        chunks = []
+        guideline_texts = []
+        for doc_info in manifest["documents"]:
+            pages = self._load_pages(doc_info["path"])
+            if doc_info["namespace"] == self.guideline_namespace:
+                # Pakai teks per halaman (bukan chunk) agar tabel tidak terpotong batas chunk
+                guideline_texts.extend(normalize_text(p.page_content) for p in pages)
+            for doc in text_splitter.split_documents(pages):
+                text = normalize_text(doc.page_content)
+                if not text:
+                    continue
+                chunks.append({
+                    "text": text,
+                    "namespace": doc_info["namespace"],
+                    "source": doc_info["path"],
+                    "page": doc.metadata.get("page"),
+                })
+            print(f"   📄 [{doc_info['namespace']}] {doc_info['path']}: {len(pages)} halaman")
+
+        if not chunks:
+            raise ValueError("Tidak ada teks yang bisa diindeks dari dokumen.")
+
+        vectors = self._embed([c["text"] for c in chunks])
+        self.chunks = chunks
+        self.index = self._create_index(vectors)
+        self.lexical_index = BM25Index()
+        self.lexical_index.build([c["text"] for c in chunks])
+        self.guidelines = build_guideline_table(guideline_texts) if self.guideline_namespace else None
+        self._rebuild_namespace_ids()
+        print(f"✅ Index {self.built_index_type} dibangun: {len(chunks)} chunk, {len(self.namespaces)} namespace.")
+
+    def save(self, manifest: Optional[Dict[str, Any]] = None):
+        manifest = dict(manifest or self._current_manifest())
+        manifest["built_index_type"] = self.built_index_type
+        manifest["built_at"] = time.time()
+
+        self.index_path.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(self.index, str(self.index_path / INDEX_FILE))
+        self.lexical_index.save(self.index_path / BM25_FILE)
+        if self.guidelines:
+            save_guideline_table(self.guidelines, self.index_path)
+        with open(self.index_path / CHUNKS_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f, ensure_ascii=False)
+        with open(self.index_path / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        print("✅ Knowledge Base berhasil disimpan ke disk.")
+
+    def load(self, expected_manifest: Optional[Dict[str, Any]] = None) -> bool:
+        manifest_path = self.index_path / MANIFEST_FILE
+        if not manifest_path.exists():
+            return False
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            if expected_manifest is not None and not self._manifest_matches(stored, expected_manifest):
+                print("♻️ Daftar dokumen/konfigurasi berubah, index akan dibangun ulang.")
+                return False
+
+            print("📂 Memuat Knowledge Base dari disk (Cepat)...")
+            self.index = faiss.read_index(str(self.index_path / INDEX_FILE))
+            self.lexical_index = BM25Index.load(self.index_path / BM25_FILE)
+            self.guidelines = load_guideline_table(self.index_path)
+            with open(self.index_path / CHUNKS_FILE, "r", encoding="utf-8") as f:
+                self.chunks = json.load(f)
+            self.built_index_type = stored.get("built_index_type", self.index_type)
+            self._rebuild_namespace_ids()
+            return True
+        except Exception as e:
+            print(f"⚠️ Gagal memuat index lama, membuat ulang: {e}")
+            self.index = None
+            self.lexical_index = None
+            self.chunks = []
+            return False
+
+    # ----------------------------
+    # Query
+    # ----------------------------
+    def search(self, query: str, k: int = 4, namespaces: Optional[Iterable[str]] = None,
+               mode: str = "hybrid") -> List[Document]:
+        """
+        Cari k chunk paling relevan. `namespaces` (opsional) membatasi pencarian
+        ke namespace tertentu, misal ["who", "ispu"].
+
+        mode="hybrid" menggabungkan peringkat FAISS dan BM25 dengan Reciprocal Rank
+        Fusion, sehingga query berisi angka/istilah spesifik ("batas PM2.5 24 jam",
+        "AQG level NO2") tetap kena walau similarity embedding-nya lemah.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode harus salah satu dari {SEARCH_MODES}, bukan '{mode}'")
+        if self.index is None or not self.chunks:
+            return []
+
+        allowed_ids = None
+        if namespaces is not None:
+            ids = [self._namespace_ids[ns] for ns in namespaces if ns in self._namespace_ids]
+            if not ids:
+                return []
+            allowed_ids = np.concatenate(ids)
+
+        n_candidates = k if mode != "hybrid" else k * HYBRID_CANDIDATES
+        rankings = []
+        if mode in ("hybrid", "vector"):
+            rankings.append(self._vector_search(query, n_candidates, allowed_ids))
+        if mode in ("hybrid", "lexical") and self.lexical_index is not None:
+            allowed_mask = None
+            if allowed_ids is not None:
+                allowed_mask = np.zeros(len(self.chunks), dtype=bool)
+                allowed_mask[allowed_ids] = True
+            rankings.append(self.lexical_index.search(query, n_candidates, allowed=allowed_mask))
+
+        if len(rankings) == 1:
+            ranked = rankings[0][:k]
+        else:
+            ranked = self._fuse(rankings)[:k]
+
+        results = []
+        for idx, score in ranked:
+            chunk = self.chunks[idx]
+            results.append(Document(
+                page_content=chunk["text"],
+                metadata={
+                    "namespace": chunk["namespace"],
+                    "source": chunk["source"],
+                    "page": chunk["page"],
+                    "score": float(score),
+                }
+            ))
+        return results
+
+    def _vector_search(self, query: str, k: int, allowed_ids: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        selector = faiss.IDSelectorBatch(allowed_ids) if allowed_ids is not None else None
+        query_vec = np.asarray([self.embedding_model.embed_query(query)], dtype="float32")
+        faiss.normalize_L2(query_vec)
+        scores, ids = self.index.search(query_vec, k, params=self._search_params(selector, k))
+        return [(int(i), float(s)) for s, i in zip(scores[0], ids[0]) if i >= 0]
+
+    @staticmethod
+    def _fuse(rankings: List[List[Tuple[int, float]]]) -> List[Tuple[int, float]]:
+        """Reciprocal Rank Fusion: skor = sum(1 / (RRF_K + rank)) dari tiap retriever."""
+        fused: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, (idx, _) in enumerate(ranking, start=1):
+                fused[idx] = fused.get(idx, 0.0) + 1.0 / (RRF_K + rank)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+    # ----------------------------
+    # Internal helpers
+    # ----------------------------
+    def _current_manifest(self) -> Dict[str, Any]:
+        documents = []
+        for path, namespace in sorted(self.documents.items()):
+            if not os.path.exists(path):
+                print(f"⚠️ Dokumen tidak ditemukan, dilewati: {path}")
+                continue
+            stat = os.stat(path)
+            documents.append({
+                "path": path,
+                "namespace": namespace,
+                "size": stat.st_size,
+                "mtime": int(stat.st_mtime),
+            })
+        return {
+            "documents": documents,
+            "index_type": self.index_type,
+            "embedding_model": getattr(self.embedding_model, "model_name", type(self.embedding_model).__name__),
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "normalizer_version": NORMALIZER_VERSION,
+            "lexical_index": "bm25",
+            "guideline_namespace": self.guideline_namespace,
+        }
+
+    @staticmethod
+    def _manifest_matches(stored: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+        return all(stored.get(key) == value for key, value in expected.items())
+
+    @staticmethod
+    def _load_pages(path: str) -> List[Document]:
+        if path.lower().endswith(".pdf"):
+            return PyPDFLoader(path).load()
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return [Document(page_content=f.read(), metadata={"source": path, "page": 0})]
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            batch = texts[start:start + EMBED_BATCH_SIZE]
+            batches.append(np.asarray(self.embedding_model.embed_documents(batch), dtype="float32"))
+            print(f"   🔢 Embedding {min(start + EMBED_BATCH_SIZE, len(texts))}/{len(texts)} chunk")
+        vectors = np.vstack(batches)
+        # Normalisasi agar inner product == cosine similarity
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _create_index(self, vectors: np.ndarray):
+        n, dim = vectors.shape
+        index_type = self.index_type
+
+        if index_type == "ivfpq" and n < IVFPQ_MIN_CHUNKS:
+            print(f"⚠️ Korpus terlalu kecil untuk IVF-PQ ({n} < {IVFPQ_MIN_CHUNKS} chunk), memakai HNSW.")
+            index_type = "hnsw"
+
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        elif index_type == "ivfpq":
+            nlist = int(min(4 * np.sqrt(n), n // 39))
+            pq_m = next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0)
+            index = faiss.index_factory(dim, f"IVF{nlist},PQ{pq_m}x8", faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+        else:
+            index = faiss.IndexFlatIP(dim)
+
+        index.add(vectors)
+        self.built_index_type = index_type
+        return index
+
+    def _search_params(self, selector, k: int):
+        if self.built_index_type == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=max(HNSW_EF_SEARCH, k))
+        if self.built_index_type == "ivfpq":
+            return faiss.SearchParametersIVF(sel=selector, nprobe=IVF_NPROBE)
+        return faiss.SearchParameters(sel=selector)
+
+    def _rebuild_namespace_ids(self):
+        grouped: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(self.chunks):
+            grouped.setdefault(chunk["namespace"], []).append(i)
+        self._namespace_ids = {ns: np.asarray(ids, dtype="int64") for ns, ids in grouped.items()}
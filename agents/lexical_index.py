@@ -0,0 +1,105 @@
+# lexical_index.py
+import re
+import json
+import math
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Token mempertahankan angka desimal & nama polutan utuh: "pm2.5", "no2", "37.5", "24-jam" -> "24", "jam"
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+# Stopword minimal (EN + ID); angka & nama polutan sengaja TIDAK masuk daftar ini
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it of on or that the this to was were with
+dan di ke dari yang untuk pada dengan atau ini itu adalah dalam
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted index BM25 yang dibangun saat ingest, berdampingan dengan index FAISS.
+
+    Bobot BM25 per (term, dokumen) dihitung di depan dan disimpan di postings,
+    sehingga query hanya menjumlahkan bobot dari postings term query (tanpa
+    menghitung ulang tf/idf). ID dokumen = posisi chunk, sama dengan ID di FAISS.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.num_docs = 0
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # term -> (doc_ids, weights)
+
+    def build(self, texts: List[str]):
+        tokenized = [tokenize(t) for t in texts]
+        self.num_docs = len(tokenized)
+        doc_len = np.asarray([len(toks) for toks in tokenized], dtype="float32")
+        avgdl = float(doc_len.mean()) if self.num_docs else 0.0
+
+        term_freqs: Dict[str, Dict[int, int]] = {}
+        for doc_id, toks in enumerate(tokenized):
+            for tok in toks:
+                tf = term_freqs.setdefault(tok, {})
+                tf[doc_id] = tf.get(doc_id, 0) + 1
+
+        self.postings = {}
+        for term, tf_map in term_freqs.items():
+            ids = np.fromiter(tf_map.keys(), dtype="int64", count=len(tf_map))
+            tf = np.fromiter(tf_map.values(), dtype="float32", count=len(tf_map))
+            df = len(tf_map)
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_len[ids] / (avgdl or 1.0))
+            weights = idf * tf * (self.k1 + 1) / (tf + norm)
+            self.postings[term] = (ids, weights.astype("float32"))
+
+    def search(self, query: str, k: int = 10, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Kembalikan list (doc_id, skor) terurut. `allowed` adalah mask boolean
+        sepanjang num_docs untuk filter namespace (opsional).
+        """
+        if not self.num_docs:
+            return []
+        scores = np.zeros(self.num_docs, dtype="float32")
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                ids, weights = posting
+                scores[ids] += weights
+        if allowed is not None:
+            scores[~allowed] = 0.0
+
+        k = min(k, self.num_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path: Path):
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "num_docs": self.num_docs,
+            "postings": {
+                term: [ids.tolist(), np.round(weights, 5).tolist()]
+                for term, (ids, weights) in self.postings.items()
+            },
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.num_docs = data["num_docs"]
+        index.postings = {
+            term: (np.asarray(ids, dtype="int64"), np.asarray(weights, dtype="float32"))
+            for term, (ids, weights) in data["postings"].items()
+        }
+        return index
@@ -0,0 +1,249 @@
+# llm_client.py
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Coroutine, Dict, Optional
+
+import aiohttp
+
+from agents.llm_scheduler import get_scheduler, LLMScheduler, PRIORITY_ANALYSIS
+
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Kirim request kedua jika request pertama lebih lambat dari persentil latensi ini (0 = nonaktif)
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_SAMPLES = 200
+
+# Jika diisi (misal http://127.0.0.1:8765), panggilan memakai REST API Gemini ke endpoint ini.
+# Dipakai untuk fake model server lokal (utils/fake_gemini_server.py).
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+TRANSIENT_HTTP_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Panggilan LLM gagal permanen (setelah retry habis atau error non-transient)."""
+
+
+class TransientLLMError(LLMError):
+    """Error sementara yang layak di-retry (timeout, 429, 5xx)."""
+
+
+# ----------------------------
+# Transports: async callable (prompt, timeout) -> teks
+# ----------------------------
+class GeminiTransport:
+    """Transport via SDK google-generativeai (generate_content_async)."""
+
+    def __init__(self, model):
+        from google.api_core import exceptions as gexc
+        self.model = model
+        self._transient = (
+            gexc.ServiceUnavailable, gexc.TooManyRequests, gexc.InternalServerError,
+            gexc.DeadlineExceeded, gexc.GatewayTimeout,
+        )
+
+    async def __call__(self, prompt: str, timeout: float) -> str:
+        try:
+            response = await self.model.generate_content_async(prompt, request_options={"timeout": timeout})
+            return response.text
+        except self._transient as e:
+            raise TransientLLMError(str(e)) from e
+
+
+class RestTransport:
+    """
+    Transport via REST API Gemini (`/v1beta/models/{model}:generateContent`).
+    Endpoint bisa diarahkan ke fake server lokal untuk pengujian/benchmark.
+    """
+
+    def __init__(self, endpoint: str, api_key: str, model_name: str,
+                 generation_config: Optional[Dict[str, Any]] = None):
+        self.url = f"{endpoint.rstrip('/')}/v1beta/models/{model_name}:generateContent"
+        self.api_key = api_key
+        self.generation_config = generation_config or {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def __call__(self, prompt: str, timeout: float) -> str:
+        # Session aiohttp terikat ke event loop pembuatnya
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession()
+            self._session_loop = loop
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if self.generation_config:
+            # REST memakai camelCase: response_mime_type -> responseMimeType
+            body["generationConfig"] = {
+                "".join(w.capitalize() if i else w for i, w in enumerate(k.split("_"))): v
+                for k, v in self.generation_config.items()
+            }
+        try:
+            async with self._session.post(
+                self.url, params={"key": self.api_key}, json=body,
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as resp:
+                if resp.status in TRANSIENT_HTTP_STATUS:
+                    raise TransientLLMError(f"HTTP {resp.status}")
+                if resp.status >= 400:
+                    raise LLMError(f"HTTP {resp.status}: {await resp.text()}")
+                data = await resp.json()
+        except aiohttp.ClientConnectionError as e:
+            raise TransientLLMError(str(e)) from e
+        try:
+            return data["candidates"][0]["content"]["parts"][0]["text"]
+        except (KeyError, IndexError) as e:
+            raise LLMError(f"Respons Gemini tidak valid: {data}") from e
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+def make_transport(model, api_key: str, generation_config: Optional[Dict[str, Any]] = None):
+    """Pilih transport: REST ke GEMINI_API_ENDPOINT jika di-set, selain itu SDK Gemini."""
+    if GEMINI_API_ENDPOINT:
+        model_name = model.model_name.split("/")[-1]
+        return RestTransport(GEMINI_API_ENDPOINT, api_key, model_name, generation_config)
+    return GeminiTransport(model)
+
+
+# ----------------------------
+# Client
+# ----------------------------
+class AsyncLLMClient:
+    """
+    Client asyncio untuk Gemini:
+    - timeout per attempt
+    - retry dengan exponential backoff + jitter untuk error transient
+    - hedging opsional: jika attempt lebih lambat dari persentil latensi historis,
+      kirim request kedua dan pakai yang selesai lebih dulu
+    - admission lewat LLMScheduler (prioritas, batas in-flight, deadline total)
+    """
+
+    def __init__(self, transport, timeout: float = LLM_TIMEOUT_S, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+                 scheduler: Optional[LLMScheduler] = None):
+        self.transport = transport
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.scheduler = scheduler or get_scheduler()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {"calls": 0, "attempts": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "errors": 0}
+
+    async def generate(self, prompt: str, priority: int = PRIORITY_ANALYSIS, label: str = "",
+                       deadline: Optional[float] = None) -> str:
+        self.stats["calls"] += 1
+        try:
+            return await self.scheduler.run_async(
+                lambda timeout: self._generate_with_retries(prompt, timeout, label),
+                priority=priority, deadline=deadline, label=label
+            )
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+    def generate_sync(self, prompt: str, priority: int = PRIORITY_ANALYSIS, label: str = "",
+                      deadline: Optional[float] = None) -> str:
+        """Jembatan untuk kode sinkron (script Streamlit)."""
+        return run_sync(self.generate(prompt, priority=priority, label=label, deadline=deadline))
+
+    def close(self):
+        """Tutup koneksi transport (session aiohttp) di event loop latar belakang."""
+        if hasattr(self.transport, "close"):
+            run_sync(self.transport.close())
+
+    async def _generate_with_retries(self, prompt: str, budget: float, label: str) -> str:
+        expires = time.monotonic() + budget
+        for attempt in range(self.max_retries + 1):
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                return await self._attempt(prompt, min(self.timeout, remaining))
+            except TransientLLMError as e:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                if attempt == self.max_retries or time.monotonic() + delay >= expires:
+                    raise LLMError(f"{label}: gagal setelah {attempt + 1} percobaan ({e})") from e
+                print(f"[LLMClient] {label}: error transient ({e}), retry dalam {delay:.1f}s")
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+        raise LLMError(f"{label}: deadline habis")
+
+    async def _attempt(self, prompt: str, timeout: float) -> str:
+        self.stats["attempts"] += 1
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self.transport(prompt, timeout))
+        pending = {primary}
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    self.stats["hedged"] += 1
+                    pending.add(asyncio.ensure_future(self.transport(prompt, timeout - hedge_delay)))
+                else:
+                    pending = done
+
+            last_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, start + timeout - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise TransientLLMError(f"timeout {timeout:.1f}s")
+                for task in done:
+                    if task.exception() is None:
+                        self._latencies.append(time.monotonic() - start)
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    last_error = task.exception()
+            if isinstance(last_error, asyncio.TimeoutError):
+                raise TransientLLMError(f"timeout {timeout:.1f}s") from last_error
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+                # Ambil hasil/exception task yang kalah agar tidak muncul "exception was never retrieved"
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_percentile or len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        idx = min(len(ordered) - 1, int(self.hedge_percentile / 100 * len(ordered)))
+        return ordered[idx]
+
+
+# ----------------------------
+# Event loop latar belakang untuk pemanggil sinkron
+# ----------------------------
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Satu event loop per proses di thread daemon, sehingga session aiohttp/gRPC
+    dipakai ulang antar panggilan dan antar sesi Streamlit.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-client-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro: Coroutine) -> Any:
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
@@ -0,0 +1,184 @@
+# llm_scheduler.py
+import os
+import time
+import asyncio
+import heapq
+import itertools
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Dict, Any, Optional
+
+# Prioritas (angka kecil = didahulukan). Intent extraction paling depan karena
+# semua langkah lain dalam satu chat turn menunggu hasilnya.
+PRIORITY_INTENT = 0
+PRIORITY_DECOMPOSITION = 1
+PRIORITY_ANALYSIS = 2
+
+# Deadline default per prioritas (detik), dihitung sejak masuk antrean
+DEFAULT_DEADLINES = {
+    PRIORITY_INTENT: 20.0,
+    PRIORITY_DECOMPOSITION: 30.0,
+    PRIORITY_ANALYSIS: 60.0,
+}
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+WAIT_SAMPLES = 500  # jumlah sampel waktu tunggu terakhir untuk p50/p95
+
+
+class DeadlineExceeded(Exception):
+    """Panggilan LLM melewati deadline (saat menunggu antrean atau saat dieksekusi)."""
+
+
+class _Waiter:
+    """Satu panggilan yang antre: future di event loop pemanggil, diselesaikan saat mendapat slot."""
+    __slots__ = ("loop", "future", "granted")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMScheduler:
+    """
+    Scheduler process-wide untuk semua panggilan Gemini.
+
+    - Membatasi jumlah panggilan yang berjalan bersamaan (max_in_flight)
+    - Antrean berprioritas (FIFO di dalam prioritas yang sama)
+    - Deadline per panggilan: sisa waktu diteruskan ke fungsi sebagai `timeout`
+    - Metrik: kedalaman antrean, in-flight, waktu tunggu p50/p95
+
+    Yang antre hanyalah asyncio.Future di heap (tanpa thread per penunggu), sehingga
+    antrean sepanjang apa pun tetap diurutkan prioritas. Slot diserahkan langsung oleh
+    _release ke kepala antrean lewat call_soon_threadsafe (aman lintas event loop).
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._queue = []  # heap of (priority, seq, _Waiter)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._wait_times: Dict[int, deque] = {}
+        self._counters = {"completed": 0, "failed": 0, "deadline_exceeded": 0}
+
+    async def run_async(self, coro_fn: Callable[..., Awaitable[Any]], priority: int = PRIORITY_ANALYSIS,
+                        deadline: Optional[float] = None, label: str = "") -> Any:
+        """
+        Tunggu slot tanpa memblokir event loop, lalu await coro_fn(timeout=<sisa detik>).
+        deadline: batas waktu total (detik) termasuk antre; default sesuai prioritas.
+        """
+        deadline = deadline or DEFAULT_DEADLINES.get(priority, DEFAULT_DEADLINES[PRIORITY_ANALYSIS])
+        enqueued = time.monotonic()
+        expires = enqueued + deadline
+
+        await self._acquire(priority, expires, label)
+        waited = time.monotonic() - enqueued
+        self._record_wait(priority, waited)
+        try:
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"Deadline habis saat antre ({label}, {waited:.1f}s)")
+            result = await coro_fn(timeout=remaining)
+            self._count("completed")
+            return result
+        except DeadlineExceeded:
+            self._count("deadline_exceeded")
+            raise
+        except Exception:
+            self._count("failed")
+            raise
+        finally:
+            self._release()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            depth_by_priority: Dict[int, int] = {}
+            for priority, _, waiter in self._queue:
+                if not waiter.granted:
+                    depth_by_priority[priority] = depth_by_priority.get(priority, 0) + 1
+            waits = {p: list(samples) for p, samples in self._wait_times.items()}
+            metrics = {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queue_depth": sum(depth_by_priority.values()),
+                "queue_depth_by_priority": depth_by_priority,
+                **self._counters,
+            }
+
+        all_waits = sorted(w for samples in waits.values() for w in samples)
+        metrics["wait_p50_s"] = _percentile(all_waits, 50)
+        metrics["wait_p95_s"] = _percentile(all_waits, 95)
+        metrics["wait_p95_by_priority_s"] = {p: _percentile(sorted(s), 95) for p, s in waits.items()}
+        return metrics
+
+    # ----------------------------
+    # Internal helpers
+    # ----------------------------
+    async def _acquire(self, priority: int, expires: float, label: str):
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._queue:
+                self._in_flight += 1
+                return
+            waiter = _Waiter(asyncio.get_running_loop())
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max(0.0, expires - time.monotonic()))
+        except BaseException as e:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._queue = [item for item in self._queue if item[2] is not waiter]
+                    heapq.heapify(self._queue)
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._counters["deadline_exceeded"] += 1
+            if granted:
+                # Slot diserahkan bersamaan dengan timeout/cancel: kembalikan ke antrean
+                self._release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded(f"Deadline habis saat antre ({label})") from None
+            raise
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            # Serahkan slot kosong ke kepala antrean (prioritas terkecil, lalu FIFO)
+            while self._queue and self._in_flight < self.max_in_flight:
+                _, _, waiter = heapq.heappop(self._queue)
+                waiter.granted = True
+                self._in_flight += 1
+                waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+
+    def _record_wait(self, priority: int, waited: float):
+        with self._lock:
+            self._wait_times.setdefault(priority, deque(maxlen=WAIT_SAMPLES)).append(waited)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+
+def _percentile(sorted_values, pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[idx], 4)
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Singleton per proses (dibagi semua sesi Streamlit)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
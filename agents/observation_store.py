@@ -0,0 +1,204 @@
+# observation_store.py
+import time
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import pandas as pd
+
+from agents import tracing
+
+# Kolom jam-an Open-Meteo yang disimpan (urutan = urutan kolom tabel)
+POLLUTANTS = ["pm10", "pm2_5", "carbon_monoxide", "nitrogen_dioxide", "sulphur_dioxide", "ozone"]
+TIME_FORMAT = "%Y-%m-%dT%H:%M"  # jam lokal lokasi, sama dengan kolom time Open-Meteo (timezone=auto)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS locations (
+    location TEXT PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    timezone TEXT
+);
+CREATE TABLE IF NOT EXISTS observations (
+    location TEXT NOT NULL,
+    time TEXT NOT NULL,
+    {", ".join(f"{col} REAL" for col in POLLUTANTS)},
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (location, time)
+) WITHOUT ROWID;
+"""
+
+
+class ObservationStore:
+    """
+    Database time-series lokal (SQLite) untuk semua data jam-an yang pernah diambil.
+
+    Satu baris per (lokasi, jam); lokasi = sel grid / stasiun (lihat data_fetcher._cell_name).
+    Primary key (location, time) sekaligus menjadi index untuk query rentang.
+    Data terakhir menimpa yang lama (upsert), sehingga prakiraan yang sudah lewat
+    tergantikan nilai terbarunya. Koneksi per thread; mode WAL agar baca tidak
+    terblokir saat ada penulisan dari thread fetch lain.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def upsert(self, location: str, latitude: float, longitude: float, df: pd.DataFrame,
+               timezone: Optional[str] = None) -> int:
+        """Simpan/timpa baris jam-an df (kolom time + POLLUTANTS yang ada). Return jumlah baris."""
+        if df is None or df.empty:
+            return 0
+        values = df.reindex(columns=POLLUTANTS).astype("float64")
+        values = values.astype(object).where(values.notna(), None)
+        times = pd.to_datetime(df["time"]).dt.strftime(TIME_FORMAT)
+        now = time.time()
+        rows = [(location, t, *vals, now) for t, vals in zip(times, values.itertuples(index=False, name=None))]
+
+        columns = ", ".join(POLLUTANTS)
+        updates = ", ".join(f"{col} = excluded.{col}" for col in POLLUTANTS + ["fetched_at"])
+        with tracing.span("store.upsert", rows=len(rows)):
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT INTO locations (location, latitude, longitude, timezone) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(location) DO UPDATE SET latitude = excluded.latitude, "
+                    "longitude = excluded.longitude, timezone = COALESCE(excluded.timezone, timezone)",
+                    (location, float(latitude), float(longitude), timezone),
+                )
+                conn.executemany(
+                    f"INSERT INTO observations (location, time, {columns}, fetched_at) "
+                    f"VALUES (?, ?, {', '.join('?' * len(POLLUTANTS))}, ?) "
+                    f"ON CONFLICT(location, time) DO UPDATE SET {updates}",
+                    rows,
+                )
+        return len(rows)
+
+    @staticmethod
+    def _bounds(start_date: str, end_date: str):
+        # [awal start_date, awal hari setelah end_date) dalam format teks yang bisa dibandingkan
+        end = date.fromisoformat(end_date) + timedelta(days=1)
+        return f"{start_date}T00:00", f"{end.isoformat()}T00:00"
+
+    def timezone(self, location: str) -> Optional[str]:
+        row = self._conn().execute("SELECT timezone FROM locations WHERE location = ?", (location,)).fetchone()
+        return row[0] if row else None
+
+    def count_hours(self, location: str, start_date: str, end_date: str) -> int:
+        lo, hi = self._bounds(start_date, end_date)
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM observations WHERE location = ? AND time >= ? AND time < ?",
+            (location, lo, hi),
+        ).fetchone()[0]
+
+    def _min_utc_offset_s(self, location: str, start_date: str, end_date: str) -> int:
+        """Offset UTC terkecil (paling barat) di awal/akhir rentang; tanpa timezone dianggap UTC-12."""
+        try:
+            zone = ZoneInfo(self.timezone(location) or "")
+        except (ValueError, ZoneInfoNotFoundError):
+            return -12 * 3600
+        return min(int(datetime.fromisoformat(d).replace(tzinfo=zone).utcoffset().total_seconds())
+                   for d in (start_date, end_date))
+
+    def count_final_hours(self, location: str, start_date: str, end_date: str) -> int:
+        """Jumlah jam pada rentang yang diambil SETELAH jam tersebut berakhir (bukan prakiraan)."""
+        lo, hi = self._bounds(start_date, end_date)
+        # time = jam lokal; epoch akhir jam = strftime('%s', time) + 3600 - offset. Offset terkecil
+        # membuat batasnya paling lambat, sehingga ragu-ragu selalu dianggap belum final.
+        offset = self._min_utc_offset_s(location, start_date, end_date)
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM observations WHERE location = ? AND time >= ? AND time < ? "
+            "AND fetched_at >= CAST(strftime('%s', time) AS INTEGER) + 3600 - ?",
+            (location, lo, hi, offset),
+        ).fetchone()[0]
+
+    def has_range(self, location: str, start_date: str, end_date: str) -> bool:
+        """
+        True jika setiap jam pada rentang tanggal (jam lokal) sudah tersimpan sebagai data final:
+        baris yang disimpan saat jamnya belum lewat (prakiraan) tidak dihitung.
+        """
+        days = (date.fromisoformat(end_date) - date.fromisoformat(start_date)).days + 1
+        # Hari pergantian DST tidak pernah tepat 24 jam -> dianggap belum lengkap, ambil dari upstream
+        return days > 0 and self.count_final_hours(location, start_date, end_date) == days * 24
+
+    def query_range(self, location: str, start_date: str, end_date: str,
+                    columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Baris jam-an pada rentang tanggal, format sama dengan data_fetcher (time = datetime).
+        df.attrs["fetched_at"] = waktu fetch terbaru di antara baris tersebut (None jika kosong).
+        """
+        columns = columns or POLLUTANTS
+        unknown = set(columns) - set(POLLUTANTS)
+        if unknown:
+            raise ValueError(f"Kolom tidak dikenal: {sorted(unknown)}")
+        lo, hi = self._bounds(start_date, end_date)
+        with tracing.span("store.query_range") as sp:
+            df = pd.read_sql_query(
+                f"SELECT time, {', '.join(columns)}, fetched_at FROM observations "
+                "WHERE location = ? AND time >= ? AND time < ? ORDER BY time",
+                self._conn(), params=(location, lo, hi),
+            )
+            sp.set(rows=len(df))
+        fetched_at = df.pop("fetched_at").max() if not df.empty else None
+        df["time"] = pd.to_datetime(df["time"], format=TIME_FORMAT)
+        df.attrs.update(timezone=self.timezone(location), fetched_at=fetched_at)
+        return df
+
+    def aggregate(self, location: str, start_date: str, end_date: str, freq: str = "day",
+                  columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Agregat per hari ("day") atau bulan ("month"): mean/min/max/n per polutan,
+        dihitung di SQLite (tanpa memuat data jam-an ke pandas).
+        """
+        width = {"day": 10, "month": 7}[freq]
+        columns = columns or POLLUTANTS
+        unknown = set(columns) - set(POLLUTANTS)
+        if unknown:
+            raise ValueError(f"Kolom tidak dikenal: {sorted(unknown)}")
+        selects = ", ".join(
+            f"AVG({col}) AS {col}_mean, MIN({col}) AS {col}_min, MAX({col}) AS {col}_max, COUNT({col}) AS {col}_n"
+            for col in columns
+        )
+        lo, hi = self._bounds(start_date, end_date)
+        with tracing.span("store.aggregate", freq=freq):
+            return pd.read_sql_query(
+                f"SELECT substr(time, 1, {width}) AS period, {selects} FROM observations "
+                "WHERE location = ? AND time >= ? AND time < ? GROUP BY period ORDER BY period",
+                self._conn(), params=(location, lo, hi),
+            )
+
+    def locations(self) -> pd.DataFrame:
+        """Semua lokasi tersimpan + rentang waktu & jumlah jam."""
+        return pd.read_sql_query(
+            "SELECT l.location, l.latitude, l.longitude, l.timezone, MIN(o.time) AS first_time, "
+            "MAX(o.time) AS last_time, COUNT(o.time) AS hours "
+            "FROM locations l LEFT JOIN observations o ON o.location = l.location GROUP BY l.location",
+            self._conn(),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        return {
+            "locations": conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0],
+            "rows": conn.execute("SELECT COUNT(*) FROM observations").fetchone()[0],
+            "bytes": self.path.stat().st_size if self.path.exists() else 0,
+        }
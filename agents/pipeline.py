@@ -0,0 +1,334 @@
+# pipeline.py
+import os
+import asyncio
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from datetime import date
+from functools import cached_property
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from agents import data_fetcher, area_summary, tracing, prefetch, air_index
+from agents.context_encoder import encode_series, encode_summaries
+from agents.series_store import SeriesStore
+from agents.table_pages import fingerprint
+
+# Batas fetch upstream paralel per chat turn (Open-Meteo + reverse geocoding per lokasi)
+PIPELINE_FETCH_CONCURRENCY = int(os.getenv("PIPELINE_FETCH_CONCURRENCY", "4"))
+DEFAULT_CENTER = (-2.5, 118.0)
+# Statistik ringkasan multi-area yang dikirim ke LLM (exceedance sudah dikirim sebagai fakta terpisah)
+PROMPT_SUMMARY_STATS = ["latest", "mean_24h", "max"]
+
+
+@dataclass
+class LocationResult:
+    """Data jam-an satu lokasi hasil fetch."""
+    name: str
+    latitude: float
+    longitude: float
+    data: pd.DataFrame
+    source: str = "Open-Meteo Air Quality API"
+    # Koordinat yang diminta (berbeda dari latitude/longitude jika memakai stasiun terdekat)
+    requested: Optional[Tuple[float, float]] = None
+    # Umur data (detik) jika diambil dari cache lama karena upstream gangguan; None = data baru
+    stale_age_s: Optional[float] = None
+
+    @cached_property
+    def series(self) -> SeriesStore:
+        return SeriesStore(self.data)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """Hash isi data (dihitung sekali); key cache tampilan tabel dsb."""
+        return fingerprint(self.data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Format dict lama data_fetcher (dipakai map_utils)."""
+        return {
+            "data": self.data,
+            "location_name": self.name,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "source": self.source,
+        }
+
+
+def _unique_names(locations: List[LocationResult]) -> List[LocationResult]:
+    """
+    Nama tampilan unik per lokasi: ringkasan, indeks, tabel, dan peta memakai nama sebagai
+    kunci, jadi hasil geocoder yang kembar diberi koordinat (lalu nomor jika masih sama).
+    """
+    counts = Counter(loc.name for loc in locations)
+    seen = set()
+    result = []
+    for loc in locations:
+        name = loc.name
+        if counts[name] > 1:
+            name = f"{loc.name} ({loc.latitude:.2f}, {loc.longitude:.2f})"
+        base, n = name, 2
+        while name in seen or (name != loc.name and name in counts):
+            name = f"{base} #{n}"
+            n += 1
+        seen.add(name)
+        result.append(loc if name == loc.name else replace(loc, name=name))
+    return result
+
+
+@dataclass
+class ConversationState:
+    """Data yang sedang tampil (konteks untuk pertanyaan lanjutan)."""
+    locations: List[LocationResult] = field(default_factory=list)
+    summary: Optional[pd.DataFrame] = None  # ringkasan long-format (area_summary)
+    center: Tuple[float, float] = DEFAULT_CENTER
+    indices: Optional[pd.DataFrame] = None  # ISPU/US AQI terkini per area (air_index.latest_indices)
+
+    @classmethod
+    def from_locations(cls, locations: List[LocationResult], guidelines: Optional[Dict[str, Any]] = None,
+                       center: Optional[Tuple[float, float]] = None) -> "ConversationState":
+        """
+        State baru dari hasil fetch; ringkasan semua lokasi dihitung sekali di sini.
+        Kolom ISPU/US AQI (nilai, kategori, polutan dominan) ditambahkan ke data tiap lokasi
+        dalam satu perhitungan untuk semua lokasi, lalu dipakai tabel, peta, dan prompt.
+        Nama lokasi yang kembar dibuat unik dulu (lihat _unique_names).
+        """
+        if not locations:
+            return cls(center=center or DEFAULT_CENTER)
+        locations = _unique_names(locations)
+        indexed = air_index.with_indices({i: loc.data for i, loc in enumerate(locations)})
+        locations = [replace(loc, data=indexed[i]) for i, loc in enumerate(locations)]
+        first = locations[0]
+        return cls(
+            locations=locations,
+            summary=area_summary.summarize_areas({loc.name: loc.data for loc in locations}, guidelines),
+            center=center or first.requested or (first.latitude, first.longitude),
+            indices=air_index.latest_indices({loc.name: loc.data for loc in locations}),
+        )
+
+    def summary_records(self) -> List[Dict[str, Any]]:
+        """Ringkasan per area untuk prompt LLM + indeks & kategori ISPU terkini yang sudah dihitung."""
+        records = area_summary.summary_records(self.summary, PROMPT_SUMMARY_STATS)
+        if self.indices is not None and not self.indices.empty:
+            by_area = self.indices.set_index("area")
+            for record in records:
+                if record["city"] in by_area.index:
+                    row = by_area.loc[record["city"]]
+                    record.update(ispu=row["ispu"], ispu_kategori=row["ispu_category"],
+                                  ispu_dominan=row["ispu_dominant"])
+        return records
+
+    @property
+    def single(self) -> Optional[LocationResult]:
+        return self.locations[0] if len(self.locations) == 1 else None
+
+    @property
+    def is_multi(self) -> bool:
+        return len(self.locations) > 1
+
+
+@dataclass
+class TurnResult:
+    """Hasil satu chat turn."""
+    response_text: str
+    state: ConversationState
+    intent: Dict[str, Any]
+    date_start: Optional[str] = None
+    date_end: Optional[str] = None
+    fetched: bool = False  # True jika data baru diambil pada turn ini
+    trace_id: Optional[str] = None
+
+
+class AirQualityPipeline:
+    """
+    Orkestrasi satu chat turn tanpa ketergantungan UI:
+    intent -> koordinat -> fetch (paralel) -> ringkasan -> analisis LLM.
+
+    Dipakai app.py (Streamlit), benchmark.py, dan job batch. `progress` opsional
+    menerima pesan status (dipanggil dari thread pemanggil).
+    """
+
+    def __init__(self, aq_agent, geo_agent, fetch_concurrency: int = PIPELINE_FETCH_CONCURRENCY):
+        self.aq_agent = aq_agent
+        self.geo_agent = geo_agent
+        self.fetch_concurrency = fetch_concurrency
+
+    def run_turn_sync(self, user_query: str, state: Optional[ConversationState] = None,
+                      today: Optional[str] = None, progress: Optional[Callable[[str], None]] = None) -> TurnResult:
+        return asyncio.run(self.run_turn(user_query, state, today, progress))
+
+    async def run_turn(self, user_query: str, state: Optional[ConversationState] = None,
+                       today: Optional[str] = None, progress: Optional[Callable[[str], None]] = None) -> TurnResult:
+        state = state or ConversationState()
+        today = today or str(date.today())
+        notify = progress or (lambda message: None)
+
+        with tracing.trace("chat_turn", prompt_chars=len(user_query)) as tr:
+            notify("Menganalisis maksud pertanyaan...")
+            intent = await asyncio.to_thread(self.geo_agent.extract_location_from_query, user_query, today)
+            intent = intent or {"intent": "none"}
+            date_range = intent.get("date_range") or {}
+            req_start = date_range.get("start") or today
+            req_end = date_range.get("end") or req_start
+            if req_start == req_end:
+                notify(f"📅 Menampilkan data untuk tanggal: **{req_start}**")
+            else:
+                notify(f"📅 Menampilkan data periode: **{req_start}** s.d **{req_end}**")
+
+            result = TurnResult("", state, intent, req_start, req_end, trace_id=tr.trace_id)
+            coords = await self._resolve_coordinates(user_query, intent, state, req_start, today, notify)
+            if coords is None:
+                # Pertanyaan lanjutan tentang data yang sedang tampil
+                result.response_text = await self._answer_context(user_query, state, req_start)
+                return result
+
+            if not coords:
+                result.response_text = f"Maaf, tidak ditemukan data lokasi untuk '{self._area_label(intent)}'."
+                return result
+            # Frekuensi query per lokasi mengisi hot list scheduler prefetch
+            for name, lat, lon in coords:
+                prefetch.record_query(name, lat, lon)
+
+            locations = await self.fetch_locations(coords, req_start, req_end, notify)
+            result.fetched = True
+            stale = [loc for loc in locations if loc.stale_age_s is not None]
+            if stale:
+                notify(f"⚠️ Server data sedang gangguan: {len(stale)} lokasi memakai data cache terakhir.")
+            if not locations:
+                result.state = ConversationState(center=state.center)
+                result.response_text = self._no_data_message(self._area_label(intent, "lokasi ini"))
+                return result
+
+            new_state = ConversationState.from_locations(locations, self.aq_agent.guidelines)
+            result.state = new_state
+            if new_state.single:
+                notify("Menganalisis satu lokasi...")
+                result.response_text = await self._analyze_single(user_query, new_state.single, req_start)
+            else:
+                notify("Membandingkan antar lokasi...")
+                records = new_state.summary_records()
+                result.response_text = await asyncio.to_thread(
+                    self.aq_agent.compare_multi_area_quality,
+                    self._area_label(intent), records, user_query,
+                    {loc.name: loc.data for loc in locations},
+                )
+            return result
+
+    # ----------------------------
+    # Tahapan
+    # ----------------------------
+    async def _resolve_coordinates(self, user_query, intent, state, req_start, today, notify):
+        """
+        list (nama, lat, lon) untuk di-fetch, [] jika lokasi tidak ditemukan,
+        None jika turn ini tidak perlu fetch (pertanyaan konteks).
+        """
+        if intent.get("intent") in ("single", "subareas", "multi"):
+            area_label = self._area_label(intent)
+            notify(f"🔍 Mencari data wilayah: {area_label}...")
+            with tracing.span("geocoding", area=area_label, intent=intent.get("intent")) as sp:
+                coords = await asyncio.to_thread(
+                    self.geo_agent.get_coordinates_for_area,
+                    user_query=user_query, area_name=area_label, intent_data=intent,
+                )
+                sp.set(n_locations=len(coords))
+            return coords
+
+        # Ganti tanggal untuk lokasi yang sama: pakai koordinat & nama lama (tanpa geocoder)
+        if state.single and req_start != today:
+            loc = state.single
+            notify(f"🔄 Mengambil data {req_start} untuk **{loc.name}**...")
+            return [(loc.name, *(loc.requested or (loc.latitude, loc.longitude)))]
+        return None
+
+    async def fetch_locations(self, coords: List[Tuple[str, float, float]], start_date: Optional[str],
+                              end_date: Optional[str], notify: Optional[Callable[[str], None]] = None
+                              ) -> List[LocationResult]:
+        """Fetch semua lokasi paralel (dibatasi semaphore), urutan hasil mengikuti coords."""
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
+        done = 0
+
+        async def fetch_one(name, lat, lon):
+            nonlocal done
+            async with semaphore:
+                loc = await asyncio.to_thread(fetch_location, name, lat, lon, start_date, end_date)
+            done += 1
+            if notify and len(coords) > 1:
+                notify(f"Mengambil data {done}/{len(coords)} lokasi...")
+            return loc
+
+        results = await asyncio.gather(*(fetch_one(*c) for c in coords))
+        return [loc for loc in results if loc is not None]
+
+    async def _analyze_single(self, user_query: str, loc: LocationResult, req_start: str) -> str:
+        encoded = encode_series(loc.series.day_or_tail(req_start))
+        context = (
+            f"LOKASI: {loc.name}\n"
+            f"TANGGAL TARGET: {req_start}\n"
+            f"DATA SENSOR:\n{encoded}"
+        )
+        index_line = air_index.describe_latest(loc.data)
+        if index_line:
+            context += f"\n{index_line}"
+        if loc.stale_age_s is not None:
+            context += f"\nCATATAN: data dari cache {loc.stale_age_s / 3600:.1f} jam lalu (server data sedang gangguan)."
+        return await asyncio.to_thread(self.aq_agent.analyze_air_quality, user_query, context, {loc.name: loc.data})
+
+    async def _answer_context(self, user_query: str, state: ConversationState, req_start: str) -> str:
+        if state.single:
+            loc = state.single
+            # Potong data sesuai tanggal request lewat binary search; fallback 24 jam terakhir
+            relevant = loc.series.day_or_tail(req_start)
+            context = (
+                f"LOKASI: {loc.name}\n"
+                f"TANGGAL DATA: {req_start}\n"
+                f"DATA SENSOR:\n{encode_series(relevant)}"
+            )
+            index_line = air_index.describe_latest(relevant)
+            if index_line:
+                context += f"\n{index_line}"
+            series = {loc.name: relevant}
+        elif state.is_multi:
+            encoded = encode_summaries(state.summary_records())
+            context = f"LOKASI: Perbandingan Multi-Area\nTANGGAL: {req_start}\nDATA:\n{encoded}"
+            series = {loc.name: loc.data for loc in state.locations}
+        else:
+            context, series = "Tidak ada data real-time.", None
+        return await asyncio.to_thread(self.aq_agent.analyze_air_quality, user_query, context, series)
+
+    @staticmethod
+    def _area_label(intent: Dict[str, Any], default: str = "Area") -> str:
+        return intent.get("parent_area") or (intent.get("areas") or [default])[0]
+
+    @staticmethod
+    def _no_data_message(area_name: str) -> str:
+        return (
+            f"⚠️ **Data Tidak Ditemukan:**\n"
+            f"Sistem berhasil menemukan lokasi **{area_name}**, namun gagal mengambil data kualitas udara terkini dari server.\n\n"
+            f"Kemungkinan penyebab:\n"
+            f"- Gangguan koneksi ke API Open-Meteo.\n"
+            f"- Data sensor PM2.5 tidak tersedia untuk koordinat tersebut saat ini."
+        )
+
+
+def fetch_location(name: Optional[str], lat: float, lon: float, start_date: Optional[str] = None,
+                   end_date: Optional[str] = None) -> Optional[LocationResult]:
+    """
+    Fetch satu titik (blocking). name=None memakai nama hasil reverse geocoding.
+    Baris tanpa PM2.5 dibuang; None jika tidak ada data sama sekali.
+    """
+    res = data_fetcher.get_air_quality_by_coords(lat, lon, start_date=start_date, end_date=end_date)
+    if not res or "data" not in res:
+        print(f"⚠️ Gagal mengambil data untuk {name or (lat, lon)}, skipping...")
+        return None
+    df = res["data"].dropna(subset=["pm2_5"])
+    if df.empty:
+        return None
+    stale = res["data"].attrs.get("stale")
+    return LocationResult(
+        name=name or res.get("location_name", "Koordinat Baru"),
+        latitude=res["latitude"],
+        longitude=res["longitude"],
+        data=df,
+        source=res.get("source", "Open-Meteo Air Quality API"),
+        requested=(lat, lon),
+        stale_age_s=res["data"].attrs.get("stale_age_s") if stale else None,
+    )
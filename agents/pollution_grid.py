@@ -0,0 +1,198 @@
+# pollution_grid.py
+import os
+import math
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+from agents import cache, data_fetcher, tracing
+
+# Grid global tetap (selaras ke kelipatan derajat) agar tile yang sama dipakai ulang
+# lintas viewport: tile GRID_TILE_DEG° berisi titik sampel tiap GRID_STEP_DEG°
+GRID_TILE_DEG = float(os.getenv("GRID_TILE_DEG", "1.0"))
+GRID_STEP_DEG = float(os.getenv("GRID_STEP_DEG", "0.25"))
+GRID_MAX_TILES = int(os.getenv("GRID_MAX_TILES", "48"))  # viewport lebih besar -> minta zoom in
+GRID_BATCH_POINTS = int(os.getenv("GRID_BATCH_POINTS", "100"))  # titik per request Open-Meteo
+GRID_FETCH_CONCURRENCY = int(os.getenv("GRID_FETCH_CONCURRENCY", "4"))
+GRID_MEMORY_TILES = int(os.getenv("GRID_MEMORY_TILES", "2048"))
+
+Tile = Tuple[int, int]  # (indeks baris lintang, indeks kolom bujur)
+Bounds = Tuple[float, float, float, float]  # south, west, north, east
+
+# Cache in-memory (LRU) di depan cache JSON data_fetcher: key (variable, tile, jam UTC)
+_memory: "OrderedDict[Tuple[str, Tile, str], List[float]]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+@dataclass
+class GridSample:
+    """Titik-titik sampel untuk sekumpulan tile pada satu jam + asal datanya."""
+    points: pd.DataFrame  # latitude, longitude, value
+    tiles: List[Tile]
+    bounds: Bounds  # gabungan batas tile (bukan viewport)
+    hour: str
+    stats: Dict[str, int] = field(default_factory=dict)  # memory / disk / fetched / failed
+
+
+def current_hour() -> datetime:
+    """Jam UTC saat ini (dibulatkan ke bawah), naive."""
+    return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def tiles_for_bounds(bounds: Bounds) -> List[Tile]:
+    """Semua tile yang beririsan dengan viewport (south, west, north, east)."""
+    south, west, north, east = bounds
+    rows = range(math.floor(south / GRID_TILE_DEG), math.floor(north / GRID_TILE_DEG) + 1)
+    cols = range(math.floor(west / GRID_TILE_DEG), math.floor(east / GRID_TILE_DEG) + 1)
+    return [(i, j) for i in rows for j in cols]
+
+
+def tile_bounds(tiles: List[Tile]) -> Bounds:
+    rows = [i for i, _ in tiles]
+    cols = [j for _, j in tiles]
+    return (min(rows) * GRID_TILE_DEG, min(cols) * GRID_TILE_DEG,
+            (max(rows) + 1) * GRID_TILE_DEG, (max(cols) + 1) * GRID_TILE_DEG)
+
+
+def tile_points(tile: Tile) -> Tuple[np.ndarray, np.ndarray]:
+    """Koordinat titik sampel (tengah sel) dalam satu tile, urutan baris-major."""
+    n = max(1, int(round(GRID_TILE_DEG / GRID_STEP_DEG)))
+    offsets = (np.arange(n) + 0.5) * (GRID_TILE_DEG / n)
+    lat, lon = np.meshgrid(tile[0] * GRID_TILE_DEG + offsets, tile[1] * GRID_TILE_DEG + offsets, indexing="ij")
+    return lat.ravel().round(4), lon.ravel().round(4)
+
+
+def _cache_name(variable: str, tile: Tile, hour: str) -> str:
+    return f"grid_{variable}_{tile[0]}_{tile[1]}_{hour.replace(':', '')}"
+
+
+def _remember(key, values: List[float]):
+    with _memory_lock:
+        _memory[key] = values
+        _memory.move_to_end(key)
+        while len(_memory) > GRID_MEMORY_TILES:
+            _memory.popitem(last=False)
+
+
+def _fetch_batch(tiles: List[Tile], hour: datetime, variable: str) -> Dict[Tile, List[float]]:
+    """Satu request Open-Meteo untuk beberapa tile sekaligus, hasil dipecah lagi per tile."""
+    coords = [tile_points(tile) for tile in tiles]
+    lats = np.concatenate([lat for lat, _ in coords])
+    lons = np.concatenate([lon for _, lon in coords])
+    values = data_fetcher.fetch_open_meteo_points(lats, lons, hour, variable)["value"].tolist()
+    out, pos = {}, 0
+    for tile, (lat, _) in zip(tiles, coords):
+        out[tile] = values[pos:pos + len(lat)]
+        pos += len(lat)
+    return out
+
+
+def sample_grid(bounds: Bounds, hour: Optional[datetime] = None, variable: str = "pm2_5") -> Optional[GridSample]:
+    """
+    Sampel polutan pada grid yang menutupi viewport.
+    None jika viewport melebihi GRID_MAX_TILES (terlalu jauh zoom out).
+    """
+    tiles = tiles_for_bounds(bounds)
+    if len(tiles) > GRID_MAX_TILES:
+        return None
+    return sample_tiles(tiles, hour, variable)
+
+
+def sample_tiles(tiles: List[Tile], hour: Optional[datetime] = None, variable: str = "pm2_5") -> GridSample:
+    """
+    Sampel untuk daftar tile. Tiap tile dicari di cache memori, lalu cache JSON (disk);
+    sisanya diambil dalam request batch paralel (GRID_BATCH_POINTS titik per request).
+    """
+    hour = hour or current_hour()
+    hour_str = hour.strftime("%Y-%m-%dT%H:00")
+    stats = {"memory": 0, "disk": 0, "fetched": 0, "failed": 0}
+
+    with tracing.span("grid.sample", tiles=len(tiles), hour=hour_str) as sp:
+        found: Dict[Tile, List[float]] = {}
+        missing = []
+        for tile in tiles:
+            key = (variable, tile, hour_str)
+            with _memory_lock:
+                values = _memory.get(key)
+                if values is not None:
+                    _memory.move_to_end(key)
+            if values is not None:
+                stats["memory"] += 1
+            else:
+                values = cache.cache_read(_cache_name(variable, tile, hour_str))
+                if values is not None:
+                    stats["disk"] += 1
+                    _remember(key, values)
+            if values is None:
+                missing.append(tile)
+            else:
+                found[tile] = values
+
+        per_tile = max(1, len(tile_points(tiles[0])[0]))
+        size = max(1, GRID_BATCH_POINTS // per_tile)
+        batches = [missing[k:k + size] for k in range(0, len(missing), size)]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(GRID_FETCH_CONCURRENCY, len(batches))) as pool:
+                # copy_context: span fetch di thread pool tetap masuk ke trace aktif
+                futures = [pool.submit(contextvars.copy_context().run, _fetch_batch, batch, hour, variable)
+                           for batch in batches]
+                for batch, future in zip(batches, futures):
+                    try:
+                        fetched = future.result()
+                    except (requests.RequestException, ValueError) as e:
+                        print(f"[pollution_grid] Gagal mengambil {len(batch)} tile: {e}")
+                        stats["failed"] += len(batch)
+                        continue
+                    for tile, values in fetched.items():
+                        found[tile] = values
+                        stats["fetched"] += 1
+                        _remember((variable, tile, hour_str), values)
+                        cache.cache_write(_cache_name(variable, tile, hour_str), values)
+        sp.set(requests=len(batches), **stats)
+
+    parts = []
+    for tile in tiles:
+        if tile in found:
+            lat, lon = tile_points(tile)
+            parts.append(pd.DataFrame({"latitude": lat, "longitude": lon,
+                                       "value": np.asarray(found[tile], dtype="float64")}))
+    points = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["latitude", "longitude", "value"])
+    return GridSample(points=points, tiles=tiles, bounds=tile_bounds(tiles), hour=hour_str, stats=stats)
+
+
+def idw_raster(points: pd.DataFrame, bounds: Bounds, size: int = 256, power: float = 2.0,
+               chunk: int = 2048) -> np.ndarray:
+    """
+    Interpolasi Inverse Distance Weighting ke raster (baris 0 = utara) berukuran maksimal
+    size piksel di sisi terpanjang. Piksel diproses per chunk agar matriks jarak tetap kecil.
+    """
+    south, west, north, east = bounds
+    valid = points.dropna(subset=["value"])
+    aspect = (north - south) / max(east - west, 1e-9)
+    height = max(2, int(round(size * min(1.0, aspect))))
+    width = max(2, int(round(size * min(1.0, 1 / aspect))))
+    if valid.empty:
+        return np.full((height, width), np.nan)
+
+    lat = np.linspace(north, south, height, dtype="float32")
+    lon = np.linspace(west, east, width, dtype="float32")
+    grid_lat, grid_lon = np.meshgrid(lat, lon, indexing="ij")
+    targets = np.column_stack([grid_lat.ravel(), grid_lon.ravel()])
+    sources = valid[["latitude", "longitude"]].to_numpy(dtype="float32")
+    values = valid["value"].to_numpy(dtype="float32")
+
+    out = np.empty(len(targets), dtype="float32")
+    for start in range(0, len(targets), chunk):
+        block = targets[start:start + chunk]
+        dist2 = ((block[:, None, :] - sources[None, :, :]) ** 2).sum(axis=2)
+        weights = 1.0 / np.maximum(dist2, 1e-12) ** (power / 2)
+        out[start:start + chunk] = (weights @ values) / weights.sum(axis=1)
+    return out.reshape(height, width)
@@ -0,0 +1,167 @@
+# prefetch.py
+import os
+import time
+import threading
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from agents import cache, data_fetcher
+from agents.circuit_breaker import get_breaker, OPEN
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+# Kota awal hot list; selanjutnya hot list diisi otomatis dari frekuensi query
+PREFETCH_CITIES = [c.strip() for c in os.getenv(
+    "PREFETCH_CITIES", "Jakarta,Surabaya,Bandung,Medan,Semarang,Makassar,Yogyakarta,Denpasar"
+).split(",") if c.strip()]
+PREFETCH_INTERVAL_MIN = float(os.getenv("PREFETCH_INTERVAL_MIN", "30"))  # < RECENT_CACHE_TTL_MIN
+PREFETCH_HOT_SIZE = int(os.getenv("PREFETCH_HOT_SIZE", "10"))
+PREFETCH_SPACING_S = float(os.getenv("PREFETCH_SPACING_S", "2"))  # jeda antar lokasi (rate limit upstream)
+PREFETCH_HALF_LIFE_HOURS = float(os.getenv("PREFETCH_HALF_LIFE_HOURS", "72"))  # peluruhan skor popularitas
+PREFETCH_MAX_TRACKED = 500
+STATS_CACHE_NAME = "prefetch_stats"
+
+# Skor popularitas per sel grid lokasi (sama dengan sel cache stasiun terdekat):
+# {sel: {"name", "lat", "lon", "score", "ts"}}; skor meluruh eksponensial, +1 per query
+_stats: Dict[str, Dict[str, Any]] = {}
+_stats_lock = threading.Lock()
+_stats_loaded = False
+
+
+def _load_stats():
+    global _stats_loaded
+    if _stats_loaded:
+        return
+    saved, _ = cache.cache_read_stale(STATS_CACHE_NAME)
+    for key, entry in (saved or {}).items():
+        _stats.setdefault(key, entry)
+    _stats_loaded = True
+
+
+def _decayed(entry: Dict[str, Any], now: float) -> float:
+    return entry["score"] * 0.5 ** ((now - entry["ts"]) / (PREFETCH_HALF_LIFE_HOURS * 3600))
+
+
+def record_query(name: str, lat: float, lon: float, weight: float = 1.0):
+    """Catat satu permintaan lokasi dari chat (murah: hanya di memori, disimpan oleh scheduler)."""
+    now = time.time()
+    key = data_fetcher._cell_name(lat, lon)
+    with _stats_lock:
+        _load_stats()
+        entry = _stats.get(key)
+        score = _decayed(entry, now) if entry else 0.0
+        _stats[key] = {"name": name, "lat": lat, "lon": lon, "score": score + weight, "ts": now}
+        if len(_stats) > PREFETCH_MAX_TRACKED:
+            coldest = min(_stats, key=lambda k: _decayed(_stats[k], now))
+            del _stats[coldest]
+
+
+def hot_list(size: int = PREFETCH_HOT_SIZE) -> List[Dict[str, Any]]:
+    """Lokasi terpopuler (skor setelah peluruhan), tertinggi dulu."""
+    now = time.time()
+    with _stats_lock:
+        _load_stats()
+        ranked = sorted(({**entry, "score": _decayed(entry, now)} for entry in _stats.values()),
+                        key=lambda entry: entry["score"], reverse=True)
+    return ranked[:size]
+
+
+def save_stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    cache.cache_write(STATS_CACHE_NAME, snapshot)
+
+
+class PrefetchScheduler:
+    """
+    Thread daemon yang menjaga cache kota populer tetap segar sebelum ada yang bertanya:
+    tiap PREFETCH_INTERVAL_MIN, data jam-an hari ini + pemetaan stasiun terdekat untuk
+    hot list diambil ulang satu per satu (jeda PREFETCH_SPACING_S, berhenti jika breaker
+    Open-Meteo terbuka). Kota awal (PREFETCH_CITIES) hanya diberi skor awal kecil sehingga
+    lama-lama tergeser oleh lokasi yang benar-benar sering ditanyakan.
+    """
+
+    def __init__(self, geocode: Callable[[str], Optional[Tuple[float, float]]],
+                 seeds: Optional[List[str]] = None, interval_min: float = PREFETCH_INTERVAL_MIN,
+                 size: int = PREFETCH_HOT_SIZE, spacing_s: float = PREFETCH_SPACING_S):
+        self.geocode = geocode
+        self.seeds = PREFETCH_CITIES if seeds is None else seeds
+        self.interval_s = interval_min * 60
+        self.size = size
+        self.spacing_s = spacing_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._seeded = set()
+        self.last_run: Optional[float] = None
+        self.last_hot: List[Dict[str, Any]] = []
+        self.counters = {"cycles": 0, "fetched": 0, "failed": 0, "skipped": 0}
+
+    def start(self) -> "PrefetchScheduler":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[prefetch] Siklus gagal: {e}")
+            self._stop.wait(self.interval_s)
+
+    def _seed(self):
+        """Geocode kota awal sekali per proses; sel yang sudah punya skor tidak ditambah lagi."""
+        for name in self.seeds:
+            if name in self._seeded or self._stop.is_set():
+                continue
+            point = self.geocode(name)
+            if point is None:
+                continue
+            self._seeded.add(name)
+            key = data_fetcher._cell_name(*point)
+            with _stats_lock:
+                _load_stats()
+                if key not in _stats:
+                    _stats[key] = {"name": name, "lat": point[0], "lon": point[1], "score": 0.5, "ts": time.time()}
+
+    def run_once(self, today: Optional[str] = None):
+        """Satu siklus prefetch (blocking); dipanggil thread atau manual."""
+        today = today or str(date.today())
+        self._seed()
+        hot = hot_list(self.size)
+        breaker = get_breaker(data_fetcher.OPEN_METEO_AQ_BASE)
+        for i, entry in enumerate(hot):
+            if self._stop.is_set():
+                break
+            if breaker.state == OPEN:
+                self.counters["skipped"] += len(hot) - i
+                print("[prefetch] Open-Meteo sedang down, siklus dihentikan")
+                break
+            if i:
+                self._stop.wait(self.spacing_s)
+            try:
+                res = data_fetcher.get_air_quality_by_coords(entry["lat"], entry["lon"], start_date=today,
+                                                            end_date=today, refresh=True)
+            except requests.exceptions.RequestException as e:
+                res = None
+                print(f"[prefetch] {entry['name']}: {e}")
+            self.counters["fetched" if res else "failed"] += 1
+        save_stats()
+        self.counters["cycles"] += 1
+        self.last_run = time.time()
+        self.last_hot = hot
+
+    def status(self) -> Dict[str, Any]:
+        """Ringkasan untuk panel debug."""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "last_run_age_s": round(time.time() - self.last_run) if self.last_run else None,
+            "hot": [{"name": e["name"], "score": round(e["score"], 2)} for e in self.last_hot],
+            **self.counters,
+        }
@@ -0,0 +1,80 @@
+# series_store.py
+from datetime import date, datetime
+from typing import Optional, Union
+
+import pandas as pd
+
+TimeLike = Union[str, date, datetime, pd.Timestamp]
+
+
+class SeriesStore:
+    """
+    Seri jam-an satu lokasi di atas DatetimeIndex terurut.
+
+    - Slicing rentang / per hari lewat binary search (searchsorted, O(log n))
+    - Hasil slicing adalah df.iloc[i:j] atas DataFrame asli: tidak ada salinan array
+      dan DataFrame sumber tidak pernah dimodifikasi
+    - Zona waktu: Open-Meteo (timezone=auto) mengembalikan jam lokal tanpa offset;
+      nama zonanya disimpan di df.attrs["timezone"]. Query tz-aware dikonversi ke
+      zona tersebut, query naive dianggap jam lokal lokasi.
+    """
+
+    def __init__(self, df: pd.DataFrame, tz: Optional[str] = None, time_col: str = "time"):
+        self.source = df  # DataFrame asal (untuk deteksi data yang sudah diganti)
+        if not pd.api.types.is_datetime64_any_dtype(df[time_col]):
+            df = df.assign(**{time_col: pd.to_datetime(df[time_col])})
+        index = pd.DatetimeIndex(df[time_col])
+        if not index.is_monotonic_increasing:
+            # Satu kali sort saat store dibuat (data Open-Meteo biasanya sudah urut)
+            df = df.sort_values(time_col, kind="stable")
+            index = pd.DatetimeIndex(df[time_col])
+
+        self.df = df
+        self.index = index
+        self.tz = tz or index.tz or df.attrs.get("timezone")
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.index) == 0
+
+    def _to_index_time(self, value: TimeLike) -> pd.Timestamp:
+        """Samakan timestamp query dengan representasi index (naive lokal atau tz-aware)."""
+        ts = pd.Timestamp(value)
+        if self.index.tz is not None:
+            return ts.tz_convert(self.index.tz) if ts.tzinfo else ts.tz_localize(self.index.tz)
+        if ts.tzinfo is not None:
+            # Index naive = jam lokal lokasi; tanpa info zona, buang offset apa adanya
+            ts = ts.tz_convert(self.tz) if self.tz else ts
+            return ts.tz_localize(None)
+        return ts
+
+    def between(self, start: Optional[TimeLike] = None, end: Optional[TimeLike] = None) -> pd.DataFrame:
+        """Baris dengan start <= time < end (None = tanpa batas)."""
+        i = 0 if start is None else self.index.searchsorted(self._to_index_time(start), side="left")
+        j = len(self.index) if end is None else self.index.searchsorted(self._to_index_time(end), side="left")
+        return self.df.iloc[i:max(i, j)]
+
+    def day(self, target: TimeLike) -> pd.DataFrame:
+        """Semua jam pada tanggal kalender target (zona waktu lokasi)."""
+        start = pd.Timestamp(target).normalize()
+        if start.tzinfo is not None:
+            start = self._to_index_time(start).normalize()
+        return self.between(start, start + pd.Timedelta(days=1))
+
+    def tail(self, hours: int = 24) -> pd.DataFrame:
+        return self.df.iloc[max(0, len(self.index) - hours):]
+
+    def day_or_tail(self, target: Optional[TimeLike], hours: int = 24) -> pd.DataFrame:
+        """Data tanggal target; jika kosong/tidak valid, fallback ke `hours` jam terakhir."""
+        if target:
+            try:
+                sliced = self.day(target)
+                if not sliced.empty:
+                    return sliced
+            except (ValueError, TypeError):
+                pass
+        return self.tail(hours)
+
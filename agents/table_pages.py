@@ -0,0 +1,82 @@
+# table_pages.py
+import os
+import hashlib
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from agents.cache import CACHE_DIR
+
+# Di atas jumlah baris ini salinan terurut disimpan ke Parquet dan halaman dibaca dari disk
+TABLE_SPILL_ROWS = int(os.getenv("TABLE_SPILL_ROWS", "50000"))
+PAGES_PER_ROW_GROUP = 100  # satu row group Parquet = 100 halaman tabel
+PAGE_CACHE_DIR = CACHE_DIR / "pages"
+
+
+def fingerprint(df: pd.DataFrame) -> str:
+    """Hash isi DataFrame (nilai + nama kolom). O(n) — hitung sekali per dataset lalu simpan."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update("|".join(map(str, df.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class TablePager:
+    """
+    Tabel berhalaman di atas satu salinan terurut yang dibuat SEKALI per dataset:
+    - default: halaman = df.iloc[a:b] (view, tanpa salinan data)
+    - dataset besar (> spill_rows): salinan terurut ditulis ke Parquet dengan row group
+      selebar PAGES_PER_ROW_GROUP halaman; satu halaman hanya membaca satu row group
+    """
+
+    def __init__(self, df: pd.DataFrame, page_size: int = 10, sort_col: Optional[str] = "time",
+                 key: Optional[str] = None, spill_rows: int = TABLE_SPILL_ROWS):
+        self.page_size = page_size
+        self.key = key or fingerprint(df)
+        if sort_col in df.columns and not df[sort_col].is_monotonic_increasing:
+            df = df.sort_values(sort_col, kind="stable")
+        self.n_rows = len(df)
+
+        self._df: Optional[pd.DataFrame] = df
+        self._file: Optional[pq.ParquetFile] = None
+        self._row_group_rows = page_size * PAGES_PER_ROW_GROUP
+        self._cached_group = (None, None)  # (indeks row group, DataFrame) terakhir yang dibaca
+        if self.n_rows > spill_rows:
+            self._spill(df)
+
+    @property
+    def n_pages(self) -> int:
+        return max(1, (self.n_rows - 1) // self.page_size + 1)
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    def _spill(self, df: pd.DataFrame):
+        PAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = PAGE_CACHE_DIR / f"{self.key}_{self.page_size}.parquet"
+        if not path.exists():
+            tmp = path.with_suffix(".tmp")
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp,
+                           row_group_size=self._row_group_rows)
+            tmp.replace(path)
+        self._file = pq.ParquetFile(path)
+        self._df = None  # data cukup di disk
+
+    def page(self, number: int) -> pd.DataFrame:
+        """Halaman ke-number (mulai 1, dipotong ke rentang valid); index = nomor baris global."""
+        number = min(max(1, number), self.n_pages)
+        start = (number - 1) * self.page_size
+        end = min(start + self.page_size, self.n_rows)
+
+        if self._file is None:
+            page = self._df.iloc[start:end]
+        else:
+            group = start // self._row_group_rows
+            if self._cached_group[0] != group:
+                self._cached_group = (group, self._file.read_row_group(group).to_pandas())
+            offset = group * self._row_group_rows
+            page = self._cached_group[1].iloc[start - offset:end - offset]
+        return page.set_axis(pd.RangeIndex(start, end), axis=0)
@@ -0,0 +1,196 @@
+# tracing.py
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Jika diisi, setiap trace yang selesai di-append ke file JSON lines ini
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "200"))  # jumlah trace terakhir di memori
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """Satu tahap dalam request: nama, waktu mulai/selesai, parent, atribut bebas."""
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.span_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+
+    def set(self, **attributes):
+        """Tambah atribut saat span berjalan (cache_hit, bytes, tokens, ...)."""
+        self.attributes.update(attributes)
+        return self
+
+    def end(self):
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """Kumpulan span untuk satu request (satu chat turn / satu klik peta)."""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.root = Span(name, None, attributes)
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans]
+        return {"trace_id": self.trace_id, **self.root.to_dict(), "spans": spans}
+
+
+_finished: deque = deque(maxlen=TRACE_HISTORY)
+_finished_lock = threading.Lock()
+
+
+# ----------------------------
+# API
+# ----------------------------
+def start_trace(name: str, **attributes) -> Trace:
+    """
+    Mulai trace untuk request baru dan jadikan trace aktif di context ini.
+    Pasangkan dengan finish_trace(); untuk blok pendek pakai `with trace(...)`.
+    """
+    tr = Trace(name, attributes)
+    tr._tokens = (_current_trace.set(tr), _current_span.set(tr.root))
+    return tr
+
+
+def finish_trace(tr: Trace, status: str = "ok") -> Dict[str, Any]:
+    """Tutup trace, simpan ke riwayat in-memory dan (opsional) export ke JSONL."""
+    tr.root.end()
+    tr.root.status = status
+    tokens = getattr(tr, "_tokens", None)
+    if tokens:
+        try:
+            _current_span.reset(tokens[1])
+            _current_trace.reset(tokens[0])
+        except ValueError:
+            # Di-finish dari context lain: cukup kosongkan
+            _current_span.set(None)
+            _current_trace.set(None)
+        tr._tokens = None
+
+    record = tr.to_dict()
+    with _finished_lock:
+        _finished.append(record)
+    if TRACE_EXPORT_PATH:
+        export_jsonl(TRACE_EXPORT_PATH, [record], append=True)
+    return record
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    tr = start_trace(name, **attributes)
+    status = "ok"
+    try:
+        yield tr
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        finish_trace(tr, status)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Span untuk satu tahap. Tanpa trace aktif, span tetap mengukur waktu
+    tetapi tidak disimpan ke mana pun (aman dipakai dari script/CLI).
+    """
+    tr = _current_trace.get()
+    parent = _current_span.get()
+    sp = Span(name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.status = "error"
+        sp.attributes.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        sp.end()
+        _current_span.reset(token)
+        if tr is not None:
+            tr.add(sp)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def recent_traces(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    with _finished_lock:
+        records = list(_finished)
+    return records[-limit:] if limit else records
+
+
+def stage_stats(records: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """Jumlah, p50 dan p95 durasi (ms) per nama span, dari trace-trace terakhir."""
+    records = recent_traces() if records is None else records
+    durations: Dict[str, List[float]] = {}
+    for record in records:
+        durations.setdefault(record["name"], []).append(record["duration_ms"])
+        for sp in record["spans"]:
+            if sp["duration_ms"] is not None:
+                durations.setdefault(sp["name"], []).append(sp["duration_ms"])
+
+    stats = []
+    for name, values in durations.items():
+        values.sort()
+        stats.append({
+            "stage": name,
+            "count": len(values),
+            "p50_ms": _percentile(values, 50),
+            "p95_ms": _percentile(values, 95),
+            "max_ms": values[-1],
+        })
+    return sorted(stats, key=lambda s: s["p95_ms"], reverse=True)
+
+
+def export_jsonl(path, records: Optional[List[Dict[str, Any]]] = None, append: bool = False) -> int:
+    """Tulis trace sebagai JSON lines (satu trace per baris). Return jumlah baris."""
+    records = recent_traces() if records is None else records
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a" if append else "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    return len(records)
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[idx], 2)
@@ -0,0 +1,183 @@
+# benchmark.py
+"""
+Benchmark end-to-end offline: semua layanan upstream diganti stub lokal
+(utils/stub_servers.py) dan Gemini diganti fake server deterministik
+(utils/fake_gemini_server.py), sehingga angka bisa dibandingkan antar commit.
+
+    python benchmark.py                                   # semua skenario, 5x
+    python benchmark.py --scenarios multi --repeat 20 --upstream-latency 0.1 --llm-latency 0.5
+    python benchmark.py --pdf WHO_Global_Air_Quality_Guidelines.pdf --out data/benchmark/report.json
+
+Skenario: single (1 kota), multi (5 kota eksplisit), subareas (provinsi dipecah oleh LLM),
+masing-masing satu chat turn lewat AirQualityPipeline (alur yang sama dengan app.py).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from datetime import date
+from pathlib import Path
+
+from utils.fake_gemini_server import FakeGeminiServer
+from utils.stub_servers import start_all, endpoint_env
+
+SCENARIOS = {
+    "single": {
+        "query": "Bagaimana kualitas udara di Jakarta hari ini?",
+        "intent": {"intent": "single", "level": "city", "areas": ["Jakarta"], "parent_area": "Jakarta"},
+    },
+    "multi": {
+        "query": "Bandingkan kualitas udara Jakarta, Bandung, Surabaya, Semarang dan Medan",
+        "intent": {"intent": "multi", "level": "city", "parent_area": None,
+                   "areas": ["Jakarta", "Bandung", "Surabaya", "Semarang", "Medan"]},
+    },
+    "subareas": {
+        "query": "Bagaimana kualitas udara di kota-kota Jawa Timur?",
+        "intent": {"intent": "subareas", "level": "city", "areas": ["Jawa Timur"], "parent_area": "Jawa Timur"},
+        "sub_areas": ["Surabaya", "Malang", "Sidoarjo", "Gresik", "Kediri"],
+    },
+}
+
+
+def scenario_responder(prompt, generation_config):
+    """Jawaban fake Gemini per jenis prompt: intent, dekomposisi, atau analisis teks."""
+    if generation_config.get("responseMimeType") != "application/json":
+        return "Analisis uji: kualitas udara dibandingkan terhadap pedoman WHO. Rekomendasi: kurangi aktivitas luar ruang."
+    if "NAMA SUB-AREA" in prompt:
+        for spec in SCENARIOS.values():
+            if spec.get("sub_areas") and spec["intent"]["parent_area"] in prompt:
+                return json.dumps({"sub_areas": spec["sub_areas"]})
+        return json.dumps({"sub_areas": []})
+    today = str(date.today())
+    for spec in SCENARIOS.values():
+        if spec["query"] in prompt:
+            return json.dumps({**spec["intent"], "date_range": {"start": today, "end": today}, "sub_areas": []})
+    return json.dumps({"intent": "none", "areas": [], "date_range": {"start": today, "end": today}})
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline EnvironPolicy Insight")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--upstream-latency", type=float, default=0.05, help="detik per request stub upstream")
+    parser.add_argument("--upstream-jitter", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="detik per request fake Gemini")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--pdf", default=None, help="PDF WHO untuk RAG (tanpa ini analisis berjalan tanpa referensi dokumen)")
+    parser.add_argument("--out", default="data/benchmark/report.json")
+    args = parser.parse_args()
+
+    # 1. Stub upstream + fake Gemini, lalu arahkan semua modul ke sana SEBELUM agents di-import
+    stubs = start_all(latency=args.upstream_latency, jitter=args.upstream_jitter)
+    gemini = FakeGeminiServer(latency=args.llm_latency, jitter=args.llm_jitter, responder=scenario_responder).start()
+    os.environ.update(endpoint_env(stubs))
+    os.environ["GEMINI_API_ENDPOINT"] = gemini.url
+    os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_cache_")
+    os.environ.pop("TRACE_EXPORT_PATH", None)
+    # Ukur jalur upstream tiap run: jangan pakai ulang data "hari ini" dari run sebelumnya
+    os.environ.setdefault("RECENT_CACHE_TTL_MIN", "0")
+
+    from agents import tracing
+    from agents.geocoder import GeocoderAgent
+    from agents.evaluator import AirQualityAgent
+    from agents.guidelines import default_guideline_table
+    from agents.pipeline import AirQualityPipeline
+    from agents.llm_scheduler import get_scheduler
+
+    geo_agent = GeocoderAgent("benchmark-key")
+    aq_agent = AirQualityAgent("benchmark-key", args.pdf or "")
+    setup = {}
+    if args.pdf:
+        start = time.perf_counter()
+        success, msg = aq_agent.initialize_knowledge_base()
+        setup["kb_init_s"] = round(time.perf_counter() - start, 3)
+        if not success:
+            print(f"⚠️ Knowledge base gagal dimuat ({msg}), analisis dijalankan tanpa retrieval.")
+    if aq_agent.guidelines is None:
+        aq_agent.guidelines = default_guideline_table()
+    pipeline = AirQualityPipeline(aq_agent, geo_agent)
+
+    def run_scenario(spec):
+        # Satu chat turn headless dari state kosong (pipeline membuat trace "chat_turn")
+        result = pipeline.run_turn_sync(spec["query"])
+        if not result.fetched or not result.state.locations:
+            raise RuntimeError(result.response_text)
+        return result
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "setup": setup,
+        "rag": aq_agent.knowledge_base is not None,
+        "scenarios": {},
+    }
+    for name in args.scenarios:
+        spec = SCENARIOS[name]
+        for _ in range(args.warmup):
+            run_scenario(spec)
+
+        before = {key: stub.stats()["requests"] for key, stub in stubs.items()}
+        gemini_before = gemini.requests
+        walls, peaks, traces, errors = [], [], [], 0
+        for _ in range(args.repeat):
+            tracemalloc.start()
+            start = time.perf_counter()
+            try:
+                run_scenario(spec)
+            except Exception as e:
+                errors += 1
+                print(f"[benchmark] {name} gagal: {e}")
+            walls.append((time.perf_counter() - start) * 1000)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+            tracemalloc.stop()
+            traces.append(tracing.recent_traces(1)[0])
+
+        report["scenarios"][name] = {
+            "runs": args.repeat,
+            "errors": errors,
+            "wall_p50_ms": _percentile(walls, 50),
+            "wall_p95_ms": _percentile(walls, 95),
+            "py_alloc_peak_mb": round(max(peaks), 2),
+            "upstream_requests_per_run": {
+                key: round((stub.stats()["requests"] - before[key]) / args.repeat, 2) for key, stub in stubs.items()
+            },
+            "llm_requests_per_run": round((gemini.requests - gemini_before) / args.repeat, 2),
+            "stages": tracing.stage_stats(traces),
+        }
+
+    # ru_maxrss dalam KB di Linux
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    report["llm_client"] = {"geocoder": geo_agent.llm.stats, "evaluator": aq_agent.llm.stats}
+    report["llm_scheduler"] = get_scheduler().metrics()
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"\n{'skenario':<10} {'p50 ms':>9} {'p95 ms':>9} {'alloc MB':>9} {'err':>4}")
+    for name, result in report["scenarios"].items():
+        print(f"{name:<10} {result['wall_p50_ms']:>9.1f} {result['wall_p95_ms']:>9.1f} "
+              f"{result['py_alloc_peak_mb']:>9.2f} {result['errors']:>4}")
+        for stage in result["stages"][:6]:
+            print(f"    {stage['stage']:<28} p50 {stage['p50_ms']:>8.1f}  p95 {stage['p95_ms']:>8.1f}  n={stage['count']}")
+    print(f"\nPeak RSS: {report['peak_rss_mb']} MB — laporan lengkap: {out}")
+
+    geo_agent.llm.close()
+    aq_agent.llm.close()
+    for stub in stubs.values():
+        stub.stop()
+    gemini.stop()
+    return 0 if all(r["errors"] == 0 for r in report["scenarios"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,307 @@
-from agents.data_fetcher import get_locations, get_latest_by_city, fetch_and_summarize_by_coords
+# main.py
+"""
+Job batch laporan harian kualitas udara untuk banyak lokasi (misal ratusan kabupaten/kota).
 
-# daftar lokasi di Indonesia
-df_loc = get_locations(country="ID", limit=20)
-print(df_loc.head())
+    python main.py lokasi.csv                                  # default: data kemarin
+    python main.py lokasi.jsonl --start 2026-10-01 --end 2026-10-07 --concurrency 16 --rps 8
+    python main.py lokasi.csv --out data/reports               # hasil: data/reports/daily/date=YYYY-MM-DD/*.parquet
 
-# latest for Jakarta (agg)
-df_latest = get_latest_by_city("Jakarta")
-print(df_latest)
+Input CSV/JSONL berisi kolom name, latitude (lat), longitude (lon), dan opsional id.
+Fetch Open-Meteo berjalan paralel (dibatasi --concurrency dan --rps) dengan cache JSON
+data_fetcher. Ringkasan harian ditulis per chunk lokasi ke Parquet terpartisi tanggal,
+dan setiap chunk dicatat di _manifest.jsonl: menjalankan ulang perintah yang sama setelah
+terputus hanya memproses lokasi yang belum selesai.
+"""
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Set
 
-# summary by coords (contoh koordinat Monas Jakarta: lat -6.1754, lon 106.8272)
-res = fetch_and_summarize_by_coords(lat=-6.1754, lon=106.8272, days=7)
-print(res["summary"].tail())
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from agents import data_fetcher, area_summary  # noqa: E402  (setelah load_dotenv: config dibaca saat import)
+from agents.guidelines import default_guideline_table  # noqa: E402
+from agents.circuit_breaker import CircuitOpenError  # noqa: E402
+
+MANIFEST_FILE = "_manifest.jsonl"
+DATASET_DIR = "daily"
+# Status HTTP yang layak dicoba ulang (rate limit / gangguan server)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+# ----------------------------
+# Input & manifest
+# ----------------------------
+def load_locations(path: Path) -> pd.DataFrame:
+    """Baca daftar lokasi CSV/JSONL -> kolom location_id, name, latitude, longitude."""
+    if path.suffix.lower() in (".jsonl", ".ndjson"):
+        df = pd.read_json(path, lines=True)
+    else:
+        df = pd.read_csv(path)
+    df = df.rename(columns={"lat": "latitude", "lon": "longitude", "lng": "longitude"})
+    missing = {"name", "latitude", "longitude"} - set(df.columns)
+    if missing:
+        raise ValueError(f"Kolom wajib tidak ada di {path}: {', '.join(sorted(missing))}")
+
+    df = df.dropna(subset=["latitude", "longitude"])
+    df["location_id"] = (df["id"] if "id" in df.columns else df["name"]).astype(str)
+    duplicated = df["location_id"][df["location_id"].duplicated()].unique()
+    if len(duplicated):
+        raise ValueError(f"location id/nama duplikat: {', '.join(duplicated[:5])} (tambahkan kolom id)")
+    return df[["location_id", "name", "latitude", "longitude"]].reset_index(drop=True)
+
+
+def read_manifest(out_dir: Path) -> List[Dict[str, Any]]:
+    path = out_dir / MANIFEST_FILE
+    if not path.exists():
+        return []
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+def remove_orphan_parts(out_dir: Path, manifest: List[Dict[str, Any]]) -> int:
+    """Hapus file Parquet yang tidak tercatat di manifest (job terhenti di tengah flush)."""
+    committed = {entry["part"] for entry in manifest}
+    removed = 0
+    for path in (out_dir / DATASET_DIR).glob("date=*/part-*.parquet"):
+        if path.name.split("-")[1] not in committed:
+            path.unlink()
+            removed += 1
+    return removed
+
+
+# ----------------------------
+# Statistik throughput
+# ----------------------------
+@dataclass
+class BatchStats:
+    total: int
+    started: float = field(default_factory=time.perf_counter)
+    done: int = 0
+    failed: int = 0
+    cache_hits: int = 0
+    retries: int = 0
+    rows: int = 0
+    parts: int = 0
+    fetch_ms: List[float] = field(default_factory=list)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def line(self) -> str:
+        rate = self.done / max(self.elapsed(), 1e-9)
+        return (f"[batch] {self.done + self.failed}/{self.total} lokasi | {rate:.1f} lokasi/s | "
+                f"cache {self.cache_hits} | retry {self.retries} | gagal {self.failed}")
+
+    def report(self) -> Dict[str, Any]:
+        ordered = sorted(self.fetch_ms) or [0.0]
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 1)
+
+        elapsed = self.elapsed()
+        network = self.done - self.cache_hits
+        return {
+            "locations_done": self.done,
+            "locations_failed": self.failed,
+            "cache_hits": self.cache_hits,
+            "retries": self.retries,
+            "rows_written": self.rows,
+            "parts_written": self.parts,
+            "wall_s": round(elapsed, 2),
+            "locations_per_s": round(self.done / max(elapsed, 1e-9), 2),
+            "requests_per_s": round(network / max(elapsed, 1e-9), 2),
+            "fetch_p50_ms": pct(50),
+            "fetch_p95_ms": pct(95),
+        }
+
+
+# ----------------------------
+# Batch job
+# ----------------------------
+class BatchWriter:
+    """Kumpulkan ringkasan per lokasi lalu tulis per chunk ke Parquet + manifest."""
+
+    def __init__(self, out_dir: Path, run_key: str, guidelines: Dict[str, Any], stats: BatchStats):
+        self.out_dir = out_dir
+        self.run_key = run_key
+        self.guidelines = guidelines
+        self.stats = stats
+        self.pending: List[Dict[str, Any]] = []
+
+    def flush(self):
+        if not self.pending:
+            return
+        chunk, self.pending = self.pending, []
+        ids = [item["location_id"] for item in chunk]
+
+        frames = {item["location_id"]: item["data"] for item in chunk}
+        daily = area_summary.summarize_daily(area_summary.stack_area_frames(frames), self.guidelines)
+        meta = pd.DataFrame([{k: item[k] for k in ("location_id", "name", "latitude", "longitude", "timezone")}
+                             for item in chunk])
+        daily = daily.rename(columns={"area": "location_id"})
+        daily["location_id"] = daily["location_id"].astype(str)
+        daily["pollutant"] = daily["pollutant"].astype(str)
+        daily["date"] = daily["date"].dt.strftime("%Y-%m-%d")
+        daily = daily.merge(meta, on="location_id", how="left")
+
+        # Nama part deterministik dari isi chunk; dicatat di manifest SETELAH file selesai ditulis
+        part = hashlib.sha1(f"{self.run_key}|{'|'.join(ids)}".encode()).hexdigest()[:12]
+        if not daily.empty:
+            pq.write_to_dataset(
+                pa.Table.from_pandas(daily, preserve_index=False),
+                root_path=str(self.out_dir / DATASET_DIR),
+                partition_cols=["date"],
+                basename_template=f"part-{part}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+        entry = {"part": part, "run": self.run_key, "ids": ids, "rows": len(daily), "ts": time.time()}
+        with open(self.out_dir / MANIFEST_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.stats.rows += len(daily)
+        self.stats.parts += 1
+
+
+def fetch_with_retry(lat: float, lon: float, start_date: str, end_date: str, retries: int, stats: BatchStats):
+    """Fetch satu lokasi (blocking) dengan backoff eksponensial untuk 429/5xx/koneksi."""
+    for attempt in range(retries + 1):
+        try:
+            # Tanpa fallback data lama: kegagalan harus sampai ke backoff di bawah dan lokasi
+            # tidak boleh tercatat selesai di manifest dengan data basi/rentang lain
+            return data_fetcher.fetch_open_meteo_hourly(lat, lon, start_date, end_date, use_cache=True,
+                                                        stale_fallback=False)
+        except CircuitOpenError:
+            raise  # host sedang down: gagal cepat, retry hanya menunda
+        except requests.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            if attempt == retries or (status is not None and status not in RETRY_STATUS):
+                raise
+            stats.retries += 1
+            time.sleep(min(30.0, 1.0 * 2 ** attempt))
+
+
+async def run_batch(locations: pd.DataFrame, start_date: str, end_date: str, out_dir: Path,
+                    concurrency: int, retries: int, flush_every: int, progress_every: float) -> BatchStats:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    run_key = f"{start_date}_{end_date}"
+    manifest = read_manifest(out_dir)
+    removed = remove_orphan_parts(out_dir, manifest)
+    if removed:
+        print(f"[batch] {removed} file part tanpa manifest dihapus (sisa job yang terputus)")
+    done_ids: Set[str] = {i for entry in manifest if entry["run"] == run_key for i in entry["ids"]}
+    todo = locations[~locations["location_id"].isin(done_ids)]
+    if done_ids:
+        print(f"[batch] Melanjutkan: {len(locations) - len(todo)} lokasi sudah selesai untuk {run_key}")
+
+    stats = BatchStats(total=len(todo))
+    writer = BatchWriter(out_dir, run_key, default_guideline_table(), stats)
+    if todo.empty:
+        return stats
+
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    last_progress = time.perf_counter()
+
+    async def process(row):
+        nonlocal last_progress
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                df = await asyncio.to_thread(fetch_with_retry, row.latitude, row.longitude,
+                                             start_date, end_date, retries, stats)
+            except Exception as e:
+                stats.failed += 1
+                print(f"[batch] Gagal {row.name} ({row.location_id}): {e}")
+                return
+            stats.fetch_ms.append((time.perf_counter() - t0) * 1000)
+
+        if df is None or df.empty or df.attrs.get("stale"):
+            stats.failed += 1
+            print(f"[batch] Tidak ada data untuk {row.name} ({row.location_id})")
+            return
+        stats.done += 1
+        stats.cache_hits += bool(df.attrs.get("cache_hit"))
+        writer.pending.append({
+            "location_id": row.location_id, "name": row.name, "latitude": row.latitude,
+            "longitude": row.longitude, "timezone": df.attrs.get("timezone"), "data": df,
+        })
+        if len(writer.pending) >= flush_every:
+            writer.flush()
+        if time.perf_counter() - last_progress >= progress_every:
+            last_progress = time.perf_counter()
+            print(stats.line())
+
+    try:
+        await asyncio.gather(*(process(row) for row in todo.itertuples(index=False)))
+    finally:
+        # Juga saat Ctrl+C: lokasi yang sudah di-fetch tetap tersimpan & tercatat
+        writer.flush()
+    return stats
+
+
+def main():
+    yesterday = str(date.today() - timedelta(days=1))
+    parser = argparse.ArgumentParser(description="Laporan harian kualitas udara (batch) ke Parquet")
+    parser.add_argument("locations", type=Path, help="file CSV/JSONL: name, latitude, longitude[, id]")
+    parser.add_argument("--start", default=yesterday, help="tanggal awal (YYYY-MM-DD), default kemarin")
+    parser.add_argument("--end", default=None, help="tanggal akhir (default = --start)")
+    parser.add_argument("--out", type=Path, default=Path("data/reports"))
+    parser.add_argument("--concurrency", type=int, default=8, help="fetch paralel maksimal")
+    parser.add_argument("--rps", type=float, default=data_fetcher.OPEN_METEO_MAX_RPS or 5.0,
+                        help="batas request/detik ke Open-Meteo (0 = tanpa batas)")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--flush-every", type=int, default=50, help="jumlah lokasi per file part")
+    parser.add_argument("--progress-every", type=float, default=5.0, help="interval log progres (detik)")
+    parser.add_argument("--stats-json", type=Path, default=None, help="simpan statistik throughput ke file JSON")
+    args = parser.parse_args()
+
+    try:
+        locations = load_locations(args.locations)
+    except (OSError, ValueError) as e:
+        print(f"[batch] {e}")
+        return 2
+
+    end_date = args.end or args.start
+    data_fetcher.open_meteo_limiter = data_fetcher.RateLimiter(args.rps, burst=max(1, int(args.rps)))
+    print(f"[batch] {len(locations)} lokasi, {args.start} s.d {end_date}, "
+          f"concurrency {args.concurrency}, {args.rps:g} req/s -> {args.out / DATASET_DIR}")
+
+    try:
+        stats = asyncio.run(run_batch(locations, args.start, end_date, args.out, args.concurrency,
+                                      args.retries, args.flush_every, args.progress_every))
+    except KeyboardInterrupt:
+        print("[batch] Dihentikan. Jalankan ulang perintah yang sama untuk melanjutkan.")
+        return 130
+
+    report = stats.report()
+    print(stats.line())
+    print(f"[batch] Selesai dalam {report['wall_s']} s: {report['locations_per_s']} lokasi/s, "
+          f"{report['requests_per_s']} request/s, fetch p50 {report['fetch_p50_ms']} ms / "
+          f"p95 {report['fetch_p95_ms']} ms, {report['rows_written']} baris di {report['parts_written']} part")
+    if args.stats_json:
+        args.stats_json.parent.mkdir(parents=True, exist_ok=True)
+        args.stats_json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# test_air_index.py
+import numpy as np
+import pytest
+
+from agents import air_index
+from agents.air_index import ISPU, US_AQI, NO_DATA
+
+
+def _index_at(scale, pollutant, concentration):
+    """Sub-indeks jam terakhir untuk konsentrasi konstan sepanjang jendela rata-rata polutan."""
+    hours = scale.averaging_hours[pollutant]
+    values = np.full((hours, 1), concentration, dtype="float64")
+    return air_index.sub_indices(values, [pollutant], scale)[-1, 0]
+
+
+@pytest.mark.parametrize("scale, pollutant, concentration, expected", [
+    (US_AQI, "pm2_5", 0.0, 0),
+    (US_AQI, "pm2_5", 9.0, 50),
+    (US_AQI, "pm2_5", 35.4, 100),
+    (US_AQI, "pm2_5", 55.4, 150),
+    (ISPU, "pm2_5", 15.5, 50),
+    (ISPU, "pm2_5", 55.4, 100),
+    (ISPU, "pm10", 150, 100),
+])
+def test_breakpoint_boundaries(scale, pollutant, concentration, expected):
+    assert _index_at(scale, pollutant, concentration) == pytest.approx(expected)
+
+
+def test_gap_between_bands_is_interpolated():
+    # Celah 9.0 -> 9.1 pada PM2.5 EPA tidak boleh menghasilkan lompatan/NaN
+    assert 50 < _index_at(US_AQI, "pm2_5", 9.05) < 51
+
+
+def test_above_top_band_is_clipped_to_scale_max():
+    assert _index_at(US_AQI, "pm2_5", 1000) == 500
+    assert _index_at(ISPU, "pm2_5", 1000) == 500
+
+
+def test_insufficient_coverage_gives_nan():
+    hours = US_AQI.averaging_hours["pm2_5"]
+    values = np.full((hours, 1), np.nan)
+    values[-3:] = 20.0  # 3 dari 24 jam < INDEX_MIN_COVERAGE
+    assert np.isnan(air_index.sub_indices(values, ["pm2_5"], US_AQI)[-1, 0])
+
+
+@pytest.mark.parametrize("scale, value, category", [
+    (US_AQI, 50, "Baik"),
+    (US_AQI, 51, "Sedang"),
+    (US_AQI, 50.4, "Baik"),
+    (ISPU, 50, "Baik"),
+    (ISPU, 51, "Sedang"),
+    (ISPU, 301, "Berbahaya"),
+])
+def test_categorize_bounds(scale, value, category):
+    assert air_index.categorize([value], scale)["category"].iloc[0] == category
+
+
+def test_categorize_missing_value():
+    result = air_index.categorize([None, float("nan")], US_AQI)
+    assert list(result["category"]) == [NO_DATA, NO_DATA]
+    assert list(result["color"]) == [air_index.NO_DATA_COLOR] * 2
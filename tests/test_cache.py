@@ -0,0 +1,58 @@
+# test_cache.py
+import threading
+
+import pytest
+
+from agents import cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path)
+    return tmp_path
+
+
+def test_write_then_read(cache_dir):
+    cache.cache_write("entry", {"a": [1, 2]})
+    assert cache.cache_read("entry") == {"a": [1, 2]}
+    data, age = cache.cache_read_stale("entry")
+    assert data == {"a": [1, 2]} and age >= 0
+    assert [p.name for p in cache_dir.iterdir()] == ["entry.json"]  # tanpa sisa file sementara
+
+
+def test_corrupt_file_is_a_miss(cache_dir):
+    (cache_dir / "broken.json").write_text('{"ts": 1, "data": {"a"', encoding="utf-8")
+    assert cache.cache_read("broken") is None
+    assert cache.cache_read_stale("broken") == (None, None)
+
+
+def test_concurrent_writes_never_expose_partial_files(cache_dir):
+    payload = {"values": list(range(20000))}
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        while not stop.is_set():
+            cache.cache_write("hot", payload)
+
+    def reader():
+        for _ in range(300):
+            try:
+                data = cache.cache_read("hot")
+            except Exception as e:  # sebelum tulis atomik: JSONDecodeError
+                errors.append(e)
+                continue
+            if data is not None and data != payload:
+                errors.append(AssertionError("data parsial"))
+
+    cache.cache_write("hot", payload)
+    threads = [threading.Thread(target=writer) for _ in range(2)]
+    for t in threads:
+        t.start()
+    try:
+        reader()
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert errors == []
@@ -0,0 +1,98 @@
+# test_data_fetcher.py
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+import requests
+
+from agents import data_fetcher
+from agents.data_fetcher import calendar_chunks
+
+
+def test_weekly_chunks_align_to_monday_sunday():
+    # 2026-01-07 = Rabu, 2026-01-20 = Selasa
+    assert calendar_chunks("2026-01-07", "2026-01-20", days=7) == [
+        ("2026-01-05", "2026-01-11"),
+        ("2026-01-12", "2026-01-18"),
+        ("2026-01-19", "2026-01-25"),
+    ]
+
+
+def test_overlapping_ranges_share_chunk_boundaries():
+    a = set(calendar_chunks("2026-03-02", "2026-03-31", days=7))
+    b = set(calendar_chunks("2026-03-10", "2026-04-15", days=7))
+    assert ("2026-03-09", "2026-03-15") in a & b
+    assert ("2026-03-30", "2026-04-05") in a & b
+
+
+def test_non_weekly_blocks_align_to_epoch():
+    chunks = calendar_chunks("2026-02-01", "2026-02-28", days=10)
+    epoch = date(1970, 1, 5)
+    for start, end in chunks:
+        assert (date.fromisoformat(start) - epoch).days % 10 == 0
+        assert (date.fromisoformat(end) - date.fromisoformat(start)).days == 9
+    assert chunks[0][0] <= "2026-02-01" <= chunks[0][1]
+    assert chunks[-1][0] <= "2026-02-28" <= chunks[-1][1]
+
+
+def test_single_day_is_one_chunk():
+    assert calendar_chunks("2026-01-08", "2026-01-08", days=7) == [("2026-01-05", "2026-01-11")]
+
+
+def test_chunks_are_clipped_to_forecast_horizon():
+    horizon = date.today() + timedelta(days=data_fetcher.FORECAST_DAYS)
+    chunks = calendar_chunks(str(date.today() - timedelta(days=20)), str(horizon + timedelta(days=30)), days=7)
+    assert chunks[-1][1] == str(horizon)
+    assert all(start <= str(horizon) for start, _ in chunks)
+    # Chunk berurutan tanpa celah/tumpang tindih
+    for (_, prev_end), (start, _) in zip(chunks, chunks[1:]):
+        assert date.fromisoformat(start) == date.fromisoformat(prev_end) + timedelta(days=1)
+
+
+def _fake_upstream(failures):
+    """fetch_open_meteo_hourly palsu: chunk dengan awal `start` gagal failures[start] kali pertama."""
+    calls = {}
+
+    def fetch(lat, lon, start_date, end_date, use_cache=False, ttl_hours=None, stale_fallback=True):
+        assert not stale_fallback  # chunk me-retry sendiri, fallback baru setelah retry habis
+        calls[start_date] = calls.get(start_date, 0) + 1
+        if calls[start_date] <= failures.get(start_date, 0):
+            raise requests.exceptions.ConnectionError("upstream down")
+        times = pd.date_range(start_date, pd.Timestamp(end_date) + pd.Timedelta(hours=23), freq="h")
+        df = pd.DataFrame({"time": times, "pm2_5": 10.0})
+        df.attrs.update(timezone="UTC", cache_hit=False, stale=False, stale_age_s=None, missing_ranges=[])
+        return df
+
+    return fetch, calls
+
+
+@pytest.fixture
+def offline_chunks(monkeypatch):
+    monkeypatch.setattr(data_fetcher, "observations", None)
+    monkeypatch.setattr(data_fetcher, "_stale_frame", lambda *args: None)
+    monkeypatch.setattr(data_fetcher, "FETCH_CHUNK_RETRIES", 2)
+    monkeypatch.setattr(data_fetcher.time, "sleep", lambda s: None)
+
+    def install(failures):
+        fetch, calls = _fake_upstream(failures)
+        monkeypatch.setattr(data_fetcher, "fetch_open_meteo_hourly", fetch)
+        return calls
+
+    return install
+
+
+def test_failed_chunk_is_retried(offline_chunks):
+    calls = offline_chunks({"2026-01-12": 2})
+    df = data_fetcher.fetch_open_meteo_range(1.0, 2.0, "2026-01-05", "2026-01-25")
+    assert calls == {"2026-01-05": 1, "2026-01-12": 3, "2026-01-19": 1}
+    assert len(df) == 21 * 24
+    assert df.attrs["missing_ranges"] == []
+
+
+def test_chunk_failing_after_retries_is_reported_missing(offline_chunks):
+    calls = offline_chunks({"2026-01-12": 99})
+    df = data_fetcher.fetch_open_meteo_range(1.0, 2.0, "2026-01-07", "2026-01-25")
+    assert calls["2026-01-12"] == 3
+    assert df.attrs["missing_ranges"] == [("2026-01-12", "2026-01-18")]
+    assert len(df) == (5 + 7) * 24  # 7-11 Jan + 19-25 Jan
+    assert df["time"].min() == pd.Timestamp("2026-01-07")
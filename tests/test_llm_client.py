@@ -0,0 +1,72 @@
+# test_llm_client.py
+import pytest
+
+from agents.llm_client import AsyncLLMClient, LLMError, RestTransport
+from agents.llm_scheduler import LLMScheduler
+from utils.fake_gemini_server import FakeGeminiServer
+
+
+class FlakyGeminiServer(FakeGeminiServer):
+    """Fake server yang menjawab 503 untuk `failures` request pertama, lalu normal."""
+
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def _draw(self):
+        with self._lock:
+            self.requests += 1
+            return self.requests <= self.failures, 0.0
+
+
+@pytest.fixture
+def make_client():
+    servers, clients = [], []
+
+    def factory(server, **kwargs):
+        servers.append(server.start())
+        client = AsyncLLMClient(RestTransport(server.url, "test-key", "gemini-test"),
+                                backoff_base=0.01, scheduler=LLMScheduler(max_in_flight=2), **kwargs)
+        clients.append(client)
+        return client
+
+    yield factory
+    for client in clients:
+        client.close()
+    for server in servers:
+        server.stop()
+
+
+def test_success_without_retry(make_client):
+    server = FakeGeminiServer()
+    client = make_client(server)
+    assert client.generate_sync("halo", label="test").startswith("Jawaban uji")
+    assert server.requests == 1
+    assert client.stats["retries"] == 0
+
+
+def test_transient_errors_are_retried(make_client):
+    server = FlakyGeminiServer(failures=2)
+    client = make_client(server, max_retries=2)
+    assert client.generate_sync("halo", label="test").startswith("Jawaban uji")
+    assert server.requests == 3
+    assert client.stats["retries"] == 2
+    assert client.stats["errors"] == 0
+
+
+def test_retries_exhausted_raises(make_client):
+    server = FakeGeminiServer(fail_rate=1.0)
+    client = make_client(server, max_retries=1)
+    with pytest.raises(LLMError, match="gagal setelah 2 percobaan"):
+        client.generate_sync("halo", label="test")
+    assert server.requests == 2
+    assert client.stats["errors"] == 1
+
+
+def test_attempt_timeout_is_retried(make_client):
+    server = FakeGeminiServer(latency=0.5)
+    client = make_client(server, timeout=0.1, max_retries=1)
+    with pytest.raises(LLMError, match="timeout"):
+        client.generate_sync("halo", label="test")
+    assert client.stats["attempts"] == 2
+    assert client.stats["retries"] == 1
@@ -0,0 +1,32 @@
+# test_pipeline.py
+import numpy as np
+import pandas as pd
+
+from agents.pipeline import ConversationState, LocationResult
+
+
+def _location(name, lat, lon, pm2_5):
+    times = pd.date_range("2026-10-18", periods=48, freq="h")
+    data = pd.DataFrame({"time": times, "pm2_5": np.full(48, pm2_5), "pm10": np.full(48, pm2_5 * 1.5)})
+    return LocationResult(name=name, latitude=lat, longitude=lon, data=data)
+
+
+def test_duplicate_names_are_kept_apart():
+    state = ConversationState.from_locations([
+        _location("Sukamaju", -6.5, 106.8, 10.0),
+        _location("Sukamaju", -7.1, 107.6, 80.0),
+        _location("Bandung", -6.9, 107.6, 30.0),
+    ])
+    names = [loc.name for loc in state.locations]
+    assert names == ["Sukamaju (-6.50, 106.80)", "Sukamaju (-7.10, 107.60)", "Bandung"]
+    assert set(state.indices["area"]) == set(names)
+
+    records = {r["city"]: r for r in state.summary_records()}
+    assert set(records) == set(names)
+    # Tiap area memakai indeksnya sendiri (bukan DataFrame hasil .loc pada nama kembar)
+    assert records["Sukamaju (-6.50, 106.80)"]["ispu"] < records["Sukamaju (-7.10, 107.60)"]["ispu"]
+
+
+def test_identical_name_and_coordinates_get_numbered():
+    state = ConversationState.from_locations([_location("Pos A", -6.2, 106.8, 10.0)] * 2)
+    assert [loc.name for loc in state.locations] == ["Pos A (-6.20, 106.80)", "Pos A (-6.20, 106.80) #2"]
@@ -0,0 +1,123 @@
+# fake_gemini_server.py
+"""
+Fake model server lokal yang meniru REST API Gemini (generateContent).
+
+Pakai untuk menguji AsyncLLMClient (timeout, retry, hedging) tanpa kuota/biaya:
+    python -m utils.fake_gemini_server --port 8765 --latency 0.3 --jitter 0.5 --fail-rate 0.1
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8765 streamlit run app.py
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Any, Optional
+
+
+def default_responder(prompt: str, generation_config: Dict[str, Any]) -> str:
+    """Jawaban deterministik: sama untuk prompt yang sama."""
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+    if generation_config.get("responseMimeType") == "application/json":
+        return json.dumps({"intent": "none", "level": None, "areas": [], "parent_area": None,
+                           "date_range": {"start": None, "end": None}, "sub_areas": []})
+    return f"Jawaban uji #{digest}: kualitas udara dianalisis berdasarkan data yang diberikan."
+
+
+class FakeGeminiServer:
+    """
+    latency   : latensi dasar per request (detik)
+    jitter    : tambahan latensi acak 0..jitter (untuk memicu hedging)
+    fail_rate : peluang request dijawab HTTP 503 (untuk memicu retry)
+    responder : fungsi (prompt, generation_config) -> teks jawaban
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, fail_rate: float = 0.0, seed: int = 0,
+                 responder: Optional[Callable[[str, Dict[str, Any]], str]] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.responder = responder or default_responder
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _draw(self):
+        with self._lock:
+            self.requests += 1
+            return self._rng.random() < self.fail_rate, self._rng.random() * self.jitter
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not self.path.split("?")[0].endswith(":generateContent"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                fail, extra = server._draw()
+                time.sleep(server.latency + extra)
+                if fail:
+                    try:
+                        self.send_error(503, "fake overload")
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    return
+
+                prompt = "".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+                text = server.responder(prompt, body.get("generationConfig", {}))
+                payload = json.dumps({
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                    "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4},
+                }).encode("utf-8")
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client membatalkan request (misal request hedging yang kalah)
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini REST server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeGeminiServer(port=args.port, latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate)
+    print(f"Fake Gemini berjalan di {fake.url} (Ctrl+C untuk berhenti)")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -1,4 +1,24 @@
+import os
+import html
+
+import numpy as np
+import pandas as pd
 import folium
+from folium.plugins import FastMarkerCluster
+
+from agents import tracing, air_index
+from agents.guidelines import WHO_AQG_2021
+
+# Di atas jumlah titik ini layer stasiun otomatis memakai FastMarkerCluster
+MAP_CLUSTER_THRESHOLD = int(os.getenv("MAP_CLUSTER_THRESHOLD", "150"))
+
+# Kategori PM2.5 harian berdasarkan WHO AQG 2021 (AQG lalu interim target IT-4..IT-1)
+_PM25_24H = WHO_AQG_2021["pm2_5"]["24h"]
+PM25_BINS = [_PM25_24H["aqg"]] + sorted(v for v in _PM25_24H["interim"] if v is not None)
+PM25_CATEGORIES = ["≤ AQG", "≤ IT-4", "≤ IT-3", "≤ IT-2", "≤ IT-1", "> IT-1"]
+PM25_COLORS = ["#2e7d32", "#9ccc65", "#fdd835", "#fb8c00", "#e53935", "#6a1b9a"]
+NO_DATA_COLOR = "#9e9e9e"
+
 
 def make_map(center_coords, zoom=9):
     return folium.Map(location=center_coords, zoom_start=zoom)
@@ -34,3 +54,185 @@ def add_markers(m, coords, result):
             icon=folium.Icon(color="green", icon="cloud")
         ).add_to(m)
     return m
+
+
+def marker_state(conversation):
+    """
+    Kunci hashable isi peta (mode, pusat, marker). Dipakai sebagai key cache peta:
+    state yang sama -> objek folium yang sama -> HTML st_folium identik (peta tidak dibangun ulang).
+    """
+    pm25, ispu = {}, {}
+    summary = conversation.summary
+    if summary is not None and not summary.empty:
+        latest = summary[summary["pollutant"] == "pm2_5"]
+        pm25 = dict(zip(latest["area"].astype(str), latest["latest"].round(1)))
+    if conversation.indices is not None and not conversation.indices.empty:
+        ispu = dict(zip(conversation.indices["area"].astype(str), conversation.indices["ispu"]))
+    markers = tuple(
+        (loc.name, round(loc.latitude, 5), round(loc.longitude, 5), loc.source,
+         tuple(round(c, 5) for c in loc.requested) if loc.requested else None,
+         pm25.get(loc.name), ispu.get(loc.name))
+        for loc in conversation.locations
+    )
+    mode = "multi" if conversation.is_multi else "single"
+    return mode, tuple(round(c, 5) for c in conversation.center), markers
+
+
+def build_map(state):
+    """Bangun peta folium dari marker_state()."""
+    mode, center, markers = state
+    m = make_map(list(center))
+
+    if mode == "multi":
+        # Satu layer berwarna kategori ISPU terkini (otomatis cluster jika titik sangat banyak)
+        stations = pd.DataFrame(list(markers), columns=["name", "latitude", "longitude", "source", "requested",
+                                                        "pm2_5", "ispu"])
+        add_station_layer(m, stations, value_col="ispu", categorize=ispu_categories, value_label="ISPU", name="Area")
+        add_category_legend(m, air_index.ISPU.categories, air_index.ISPU.colors, "ISPU")
+        # Fit bounds: [SouthWest, NorthEast] agar semua titik terlihat
+        m.fit_bounds([[stations["latitude"].min(), stations["longitude"].min()],
+                      [stations["latitude"].max(), stations["longitude"].max()]])
+    elif markers:
+        name, lat, lon, source, requested = markers[0][:5]
+        add_markers(m, requested or center, {"data": None, "location_name": name, "latitude": lat,
+                                             "longitude": lon, "source": source})
+    return m
+
+
+# ----------------------------
+# Layer stasiun dalam jumlah besar
+# ----------------------------
+def pm25_categories(values) -> pd.DataFrame:
+    """Kategori & warna PM2.5 (vektor, satu kali untuk semua titik). NaN -> 'Tidak ada data'."""
+    values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype="float64")
+    idx = np.searchsorted(PM25_BINS, values, side="left")  # nilai == batas masuk kategori bawah
+    missing = np.isnan(values)
+    idx = np.where(missing, 0, idx)
+    return pd.DataFrame({
+        "category": np.where(missing, "Tidak ada data", np.asarray(PM25_CATEGORIES, dtype=object)[idx]),
+        "color": np.where(missing, NO_DATA_COLOR, np.asarray(PM25_COLORS, dtype=object)[idx]),
+    })
+
+
+def ispu_categories(values) -> pd.DataFrame:
+    """Kategori & warna ISPU resmi (sama dengan kolom ispu_category di tabel & prompt)."""
+    return air_index.categorize(values, air_index.ISPU)
+
+
+_CLUSTER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+        {radius: 7, color: row[2], fillColor: row[2], fillOpacity: 0.85, weight: 1});
+    marker.bindTooltip(row[3]);
+    return marker;
+}
+"""
+
+
+def add_station_layer(m, stations: pd.DataFrame, value_col: str = "pm2_5",
+                      cluster_threshold: int = MAP_CLUSTER_THRESHOLD, name: str = "Stasiun",
+                      categorize=pm25_categories, value_label: str = "PM2.5 (µg/m³)"):
+    """
+    Semua stasiun sebagai SATU layer (bukan satu folium.Marker + ikon per titik):
+    - <= cluster_threshold titik: satu GeoJson berisi CircleMarker berwarna kategori
+    - di atasnya: FastMarkerCluster (data array ringkas + satu callback JS)
+
+    stations: DataFrame kolom name, latitude, longitude, dan value_col (boleh NaN).
+    categorize: nilai -> DataFrame category/color (default kategori PM2.5 WHO; ispu_categories untuk ISPU).
+    Return mode yang dipakai ("geojson" / "cluster").
+    """
+    stations = stations.dropna(subset=["latitude", "longitude"]).reset_index(drop=True)
+    values = stations[value_col] if value_col in stations.columns else pd.Series(np.nan, index=stations.index)
+    cats = categorize(values)
+    lat = stations["latitude"].astype("float64").round(5)
+    lon = stations["longitude"].astype("float64").round(5)
+    value = pd.to_numeric(values, errors="coerce").round(1)
+    label = stations["name"].astype(str).map(html.escape)
+
+    if len(stations) > cluster_threshold:
+        tooltip = (label + f" — {value_label}: " + value.map(lambda v: "-" if pd.isna(v) else f"{v:g}")
+                   + " (" + cats["category"] + ")")
+        rows = list(zip(lat.tolist(), lon.tolist(), cats["color"].tolist(), tooltip.tolist()))
+        FastMarkerCluster(rows, callback=_CLUSTER_CALLBACK, name=name).add_to(m)
+        return "cluster"
+
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [x, y]},
+            "properties": {"name": n, "value": None if pd.isna(v) else v, "category": c, "color": col},
+        }
+        for x, y, n, v, c, col in zip(lon.tolist(), lat.tolist(), label.tolist(), value.tolist(),
+                                      cats["category"].tolist(), cats["color"].tolist())
+    ]
+    folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name=name,
+        marker=folium.CircleMarker(radius=7, weight=1, fill=True, fill_opacity=0.85),
+        style_function=lambda feature: {"color": feature["properties"]["color"],
+                                        "fillColor": feature["properties"]["color"]},
+        tooltip=folium.GeoJsonTooltip(fields=["name", "value", "category"],
+                                      aliases=["Lokasi", value_label, "Kategori"]),
+    ).add_to(m)
+    return "geojson"
+
+
+def add_category_legend(m, labels=PM25_CATEGORIES, colors=PM25_COLORS, title="PM2.5 24 jam"):
+    """Legenda kecil warna kategori (pojok kanan bawah); default kategori PM2.5 WHO."""
+    items = "".join(
+        f"<div><span style='background:{color};width:10px;height:10px;display:inline-block;"
+        f"border-radius:50%;margin-right:4px'></span>{label}</div>"
+        for label, color in zip(labels, colors)
+    )
+    legend = (
+        "<div style='position:fixed;bottom:20px;right:10px;z-index:9999;background:white;"
+        f"padding:6px 8px;font-size:12px;border-radius:4px;box-shadow:0 0 4px #888'><b>{title}</b>{items}</div>"
+    )
+    m.get_root().html.add_child(folium.Element(legend))
+    return m
+
+
+def payload_bytes(m) -> int:
+    """Ukuran HTML peta yang dikirim ke browser (bytes), dicatat juga sebagai span 'map.render'."""
+    with tracing.span("map.render") as sp:
+        size = len(m.get_root().render().encode("utf-8"))
+        sp.set(bytes=size)
+    return size
+
+
+# ----------------------------
+# Heatmap grid (raster IDW)
+# ----------------------------
+def colorize_pm25(raster: np.ndarray, opacity: float = 0.55) -> np.ndarray:
+    """
+    Raster nilai PM2.5 -> RGBA uint8. Warna diinterpolasi linear antar batas kategori
+    (warna yang sama dengan marker stasiun); NaN transparan.
+    """
+    anchors = np.array([0.0] + PM25_BINS + [PM25_BINS[-1] * 1.5])
+    rgb = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in PM25_COLORS], dtype="float64")
+    # Titik jangkar: tengah tiap kategori
+    mids = (anchors[:-1] + anchors[1:]) / 2
+    flat = np.nan_to_num(raster.ravel(), nan=0.0)
+    image = np.empty((flat.size, 4), dtype="uint8")
+    for channel in range(3):
+        image[:, channel] = np.interp(flat, mids, rgb[:, channel]).round().astype("uint8")
+    image[:, 3] = np.where(np.isnan(raster.ravel()), 0, int(opacity * 255))
+    return image.reshape(raster.shape + (4,))
+
+
+def heatmap_layer(sample, size: int = 256, opacity: float = 0.55, name: str = "Heatmap PM2.5"):
+    """FeatureGroup berisi ImageOverlay hasil IDW dari pollution_grid.GridSample."""
+    from agents.pollution_grid import idw_raster
+
+    south, west, north, east = sample.bounds
+    with tracing.span("grid.raster", points=len(sample.points), size=size):
+        image = colorize_pm25(idw_raster(sample.points, sample.bounds, size=size), opacity)
+    group = folium.FeatureGroup(name=name)
+    folium.raster_layers.ImageOverlay(
+        image=image,
+        bounds=[[south, west], [north, east]],
+        mercator_project=True,
+        interactive=False,
+        zindex=1,
+    ).add_to(group)
+    return group
@@ -0,0 +1,315 @@
+# stub_servers.py
+"""
+Stub lokal untuk layanan upstream (Open-Meteo Air Quality, OpenAQ v3, Nominatim).
+Respons deterministik (diturunkan dari hash nama/koordinat) dengan latensi yang bisa
+diatur, untuk benchmark & pengujian offline. Pasangan untuk utils/fake_gemini_server.py.
+
+    python -m utils.stub_servers --latency 0.05
+    OPEN_METEO_AQ_BASE=http://127.0.0.1:8766/v1 OPENAQ_API_BASE=http://127.0.0.1:8767/v3 \\
+    NOMINATIM_DOMAIN=127.0.0.1:8768 NOMINATIM_SCHEME=http streamlit run app.py
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+HOURLY_PARAMS = ["pm10", "pm2_5", "carbon_monoxide", "nitrogen_dioxide", "sulphur_dioxide", "ozone"]
+# Level dasar (µg/m³) per polutan untuk seri sintetis
+BASE_LEVELS = {"pm10": 45, "pm2_5": 28, "carbon_monoxide": 400, "nitrogen_dioxide": 22,
+               "sulphur_dioxide": 12, "ozone": 55}
+# Kotak batas Indonesia untuk koordinat hasil geocoding palsu
+ID_BBOX = (-10.5, 5.5, 95.0, 141.0)  # lat_min, lat_max, lon_min, lon_max
+
+
+def _seed(*parts) -> int:
+    return int(hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:8], 16)
+
+
+class StubServer:
+    """
+    Server HTTP kecil di thread daemon. Subclass mengisi `routes`: {path: fn(server, query) -> (status, body)}.
+    latency/jitter dalam detik, fail_rate = peluang HTTP 503.
+    """
+
+    name = "stub"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, fail_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    routes: Dict[str, Callable[..., Tuple[int, Any]]] = {}
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.address}"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "bytes_sent": self.bytes_sent}
+
+    def _draw(self):
+        with self._lock:
+            self.requests += 1
+            return self._rng.random() < self.fail_rate, self._rng.random() * self.jitter
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                route = server.routes.get(parsed.path)
+                if route is None:
+                    self._reply(404, {"error": f"unknown path {parsed.path}"})
+                    return
+                fail, extra = server._draw()
+                time.sleep(server.latency + extra)
+                if fail:
+                    self._reply(503, {"error": "stub overload"})
+                    return
+                query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                status, body = route(server, query)
+                self._reply(status, body)
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                with server._lock:
+                    server.bytes_sent += len(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+# ----------------------------
+# Open-Meteo Air Quality (/v1/air-quality, /v1/locations)
+# ----------------------------
+def _hourly_series(lat: float, lon: float, start: date, end: date) -> Dict[str, list]:
+    hours = ((end - start).days + 1) * 24
+    start_dt = datetime(start.year, start.month, start.day)
+    rng = np.random.default_rng(_seed(round(lat, 3), round(lon, 3)))
+    diurnal = 1 + 0.35 * np.sin((np.arange(hours) % 24 - 8) / 24 * 2 * np.pi)
+    hourly = {"time": [(start_dt + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)]}
+    for param in HOURLY_PARAMS:
+        level = BASE_LEVELS[param] * rng.uniform(0.5, 1.8)
+        values = level * diurnal * rng.gamma(8, 1 / 8, hours)
+        hourly[param] = [round(float(v), 1) for v in values]
+    return hourly
+
+
+def _air_quality(server, query):
+    try:
+        # Seperti Open-Meteo: banyak koordinat dipisah koma -> respons berupa list
+        lats = [float(v) for v in query["latitude"].split(",")]
+        lons = [float(v) for v in query["longitude"].split(",")]
+    except (KeyError, ValueError):
+        return 400, {"error": True, "reason": "latitude/longitude wajib"}
+    if len(lats) != len(lons):
+        return 400, {"error": True, "reason": "jumlah latitude dan longitude harus sama"}
+
+    hour = None
+    if "start_hour" in query:
+        hour = query["start_hour"][:13] + ":00"
+        start = end = date.fromisoformat(hour[:10])
+    elif "start_date" in query and "end_date" in query:
+        start = date.fromisoformat(query["start_date"])
+        end = date.fromisoformat(query["end_date"])
+    else:
+        # Default Open-Meteo: hari ini + 4 hari prakiraan
+        start = date.today()
+        end = start + timedelta(days=4)
+    params = [p for p in query.get("hourly", ",".join(HOURLY_PARAMS)).split(",") if p in HOURLY_PARAMS]
+
+    results = []
+    for lat, lon in zip(lats, lons):
+        series = _hourly_series(lat, lon, start, end)
+        rows = [series["time"].index(hour)] if hour else range(len(series["time"]))
+        results.append({
+            "latitude": lat, "longitude": lon, "timezone": "Asia/Jakarta", "timezone_abbreviation": "WIB",
+            "utc_offset_seconds": 25200,
+            "hourly_units": {"time": "iso8601", **{p: "μg/m³" for p in params}},
+            "hourly": {"time": [series["time"][i] for i in rows], **{p: [series[p][i] for i in rows] for p in params}},
+        })
+    return 200, results if len(results) > 1 else results[0]
+
+
+def _om_locations(server, query):
+    lat, lon = float(query.get("latitude", 0)), float(query.get("longitude", 0))
+    return 200, {"results": [{"name": f"Stub {lat:.2f},{lon:.2f}", "latitude": lat, "longitude": lon}]}
+
+
+class OpenMeteoStub(StubServer):
+    name = "open_meteo"
+    routes = {"/v1/air-quality": _air_quality, "/v1/locations": _om_locations}
+
+    @property
+    def base(self) -> str:
+        return f"{self.url}/v1"
+
+
+# ----------------------------
+# OpenAQ v3 (/v3/locations, /v3/latest, /v3/measurements)
+# ----------------------------
+def _openaq_location(i: int) -> Dict[str, Any]:
+    rng = random.Random(_seed("openaq", i))
+    return {
+        "id": 1000 + i, "name": f"Stasiun Stub {i}", "locality": f"Kota {i}",
+        "country": {"code": "ID", "name": "Indonesia"},
+        "coordinates": {"latitude": round(rng.uniform(-8, -6), 4), "longitude": round(rng.uniform(105, 113), 4)},
+        "lastUpdated": datetime.utcnow().strftime("%Y-%m-%dT%H:00:00Z"),
+    }
+
+
+def _openaq_locations(server, query):
+    limit = int(query.get("limit", 100))
+    return 200, {"meta": {"found": limit}, "results": [_openaq_location(i) for i in range(limit)]}
+
+
+def _openaq_latest(server, query):
+    loc = _openaq_location(int(query.get("locations_id", 1000)) - 1000)
+    rng = random.Random(_seed("latest", loc["id"]))
+    measurements = [
+        {"parameter": p, "value": round(BASE_LEVELS[p] * rng.uniform(0.5, 1.8), 1), "unit": "µg/m³",
+         "lastUpdated": loc["lastUpdated"]}
+        for p in HOURLY_PARAMS
+    ]
+    return 200, {"results": [{"location": loc["name"], "coordinates": loc["coordinates"], "measurements": measurements}]}
+
+
+def _openaq_measurements(server, query):
+    loc_id = int(query.get("location_id", 1000))
+    loc = _openaq_location(loc_id - 1000)
+    lat, lon = loc["coordinates"]["latitude"], loc["coordinates"]["longitude"]
+    start = date.today() - timedelta(days=7)
+    series = _hourly_series(lat, lon, start, date.today())
+    params = [query["parameter"]] if query.get("parameter") in HOURLY_PARAMS else HOURLY_PARAMS
+    results = [
+        {"parameter": p, "value": series[p][h], "unit": "µg/m³", "date": {"utc": series["time"][h] + ":00Z"}}
+        for p in params for h in range(len(series["time"]))
+    ]
+    return 200, {"meta": {"found": len(results)}, "results": results}
+
+
+class OpenAQStub(StubServer):
+    name = "openaq"
+    routes = {"/v3/locations": _openaq_locations, "/v3/latest": _openaq_latest,
+              "/v3/measurements": _openaq_measurements}
+
+    @property
+    def base(self) -> str:
+        return f"{self.url}/v3"
+
+
+# ----------------------------
+# Nominatim (/search, /reverse) — format jsonv2/json seperti dipakai geopy
+# ----------------------------
+def _fake_coords(name: str) -> Tuple[float, float]:
+    rng = random.Random(_seed("geo", name.lower().strip()))
+    lat_min, lat_max, lon_min, lon_max = ID_BBOX
+    return round(rng.uniform(lat_min, lat_max), 5), round(rng.uniform(lon_min, lon_max), 5)
+
+
+def _nominatim_search(server, query):
+    q = query.get("q", "")
+    if not q:
+        return 200, []
+    lat, lon = _fake_coords(q)
+    head = q.split(",")[0].strip().title()
+    return 200, [{
+        "place_id": _seed("place", q) % 10 ** 8, "lat": str(lat), "lon": str(lon),
+        "display_name": f"{head}, Indonesia", "type": "administrative", "importance": 0.6,
+        "boundingbox": [str(lat - 0.1), str(lat + 0.1), str(lon - 0.1), str(lon + 0.1)],
+    }]
+
+
+def _nominatim_reverse(server, query):
+    lat, lon = float(query.get("lat", 0)), float(query.get("lon", 0))
+    city = f"Kota Stub {_seed(round(lat, 2), round(lon, 2)) % 1000}"
+    return 200, {
+        "place_id": _seed("rev", lat, lon) % 10 ** 8, "lat": str(lat), "lon": str(lon),
+        "display_name": f"{city}, Indonesia",
+        "address": {"city": city, "state": "Provinsi Stub", "country": "Indonesia", "country_code": "id"},
+    }
+
+
+class NominatimStub(StubServer):
+    name = "nominatim"
+    routes = {"/search": _nominatim_search, "/reverse": _nominatim_reverse}
+
+
+def start_all(latency: float = 0.0, jitter: float = 0.0, fail_rate: float = 0.0) -> Dict[str, StubServer]:
+    """Jalankan ketiga stub upstream pada port acak."""
+    return {
+        cls.name: cls(latency=latency, jitter=jitter, fail_rate=fail_rate, seed=i).start()
+        for i, cls in enumerate([OpenMeteoStub, OpenAQStub, NominatimStub])
+    }
+
+
+def endpoint_env(stubs: Dict[str, StubServer]) -> Dict[str, str]:
+    """Variabel lingkungan untuk mengarahkan data_fetcher & geocoder ke stub."""
+    return {
+        "OPEN_METEO_AQ_BASE": stubs["open_meteo"].base,
+        "OPENAQ_API_BASE": stubs["openaq"].base,
+        "NOMINATIM_DOMAIN": stubs["nominatim"].address,
+        "NOMINATIM_SCHEME": "http",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Open-Meteo / OpenAQ / Nominatim")
+    parser.add_argument("--port", type=int, default=8766, help="port Open-Meteo; OpenAQ +1, Nominatim +2")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stubs = {
+        cls.name: cls(port=args.port + i, latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate).start()
+        for i, cls in enumerate([OpenMeteoStub, OpenAQStub, NominatimStub])
+    }
+    for key, value in endpoint_env(stubs).items():
+        print(f"{key}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for stub in stubs.values():
+            stub.stop()
@@ -1,5 +1,83 @@
+import os
 import streamlit as st
+import numpy as np
 import pandas as pd
+import json
+
+from agents import air_index
+
+# Maksimum titik per grafik yang dikirim ke browser (per seri untuk grafik tunggal,
+# total untuk grafik multi-area); seri lebih panjang di-downsample dengan LTTB
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "500"))
+
+CHART_TITLES = {
+    "pm2_5": "📊 PM2.5 (µg/m³)",
+    "pm10": "📊 PM10 (µg/m³)",
+    "nitrogen_dioxide": "📊 NO₂ (µg/m³)",
+    "sulphur_dioxide": "📊 SO₂ (µg/m³)",
+    "ozone": "📊 Ozone (µg/m³)",
+    "carbon_monoxide": "📊 CO (µg/m³)",
+}
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: pilih n_out indeks yang mempertahankan bentuk kurva
+    (puncak & lembah tetap ada). Titik pertama/terakhir selalu ikut. NaN diabaikan.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if n_out >= n or n_out < 3:
+        return valid
+    x, y = x[valid], y[valid]
+
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype="int64")
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        # Rata-rata bucket berikutnya sebagai titik ketiga segitiga
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return valid[selected]
+
+
+def downsample_frame(df, max_points=CHART_MAX_POINTS):
+    """
+    Downsample DataFrame ber-index waktu (satu kolom per seri) untuk grafik.
+    LTTB dijalankan per kolom dengan jatah max_points / jumlah kolom, lalu baris yang
+    terpilih digabung (union) sehingga semua seri tetap berbagi sumbu waktu yang sama.
+    """
+    if len(df) <= max_points or df.empty:
+        return df
+    x = df.index.asi8 if isinstance(df.index, pd.DatetimeIndex) else np.arange(len(df))
+    columns = [df[col].to_numpy() for col in df.columns]
+
+    def select(per_series):
+        return np.unique(np.concatenate([lttb_indices(x, y, per_series) for y in columns]))
+
+    per_series = max(3, max_points // len(columns))
+    rows = select(per_series)
+    # Seri yang mirip memilih jam yang sama -> union jauh di bawah jatah; naikkan sekali
+    if len(columns) > 1 and len(rows) < max_points // 2:
+        rows = select(min(len(df), per_series * max_points // max(1, len(rows))))
+    return df.iloc[rows]
+
+
+def _chart_title(title, shown, total):
+    if shown < total:
+        return f"{title} — {shown} dari {total} titik (downsampled)"
+    return title
+
 
 def display_air_quality_charts(df):
     chart_cols = [col for col in ["pm2_5", "pm10"] if col in df.columns]
@@ -7,83 +85,189 @@ def display_air_quality_charts(df):
         st.info("Tidak ada kolom PM2.5 atau PM10 untuk divisualisasikan.")
         return
     st.subheader("📈 Tren PM2.5 dan PM10")
-    st.line_chart(df.set_index("time")[chart_cols])
+    series = df.set_index("time")[chart_cols]
+    chart = downsample_frame(series, CHART_MAX_POINTS * len(chart_cols))
+    if len(chart) < len(series):
+        st.caption(f"{len(chart)} dari {len(series)} jam ditampilkan (downsampled, bentuk kurva dipertahankan)")
+    st.line_chart(chart)
 
 def display_multi_area_comparison(multi_area_results):
     """
     Menampilkan grafik perbandingan semua parameter kualitas udara untuk multi-area.
-    Menggunakan line chart seperti single point untuk menampilkan tren waktu.
+    Menggunakan line chart seperti single point untuk menampilkan tren waktu
+    (seluruh periode yang diambil, di-downsample jika panjang).
     
     Args:
-        multi_area_results: List of dict dengan keys: name, lat, lon, data, summary
+        multi_area_results: List of dict dengan keys: name, lat, lon, data
     """
     if not multi_area_results:
         return
     
     st.subheader("📈 Perbandingan Kualitas Udara")
     
-    # Siapkan data time series untuk setiap parameter
-    # Ambil data terakhir 24 jam dari setiap area
-    all_data = []
+    # Satu frame lebar untuk semua grafik: index time, kolom (polutan, kota)
+    frames = {}
     for item in multi_area_results:
         city_name = item.get("name", "Unknown")
         df = item.get("data", pd.DataFrame())
         
         if not df.empty and "time" in df.columns:
-            # Ambil data terakhir 24 jam dan pastikan time adalah datetime
-            df_24h = df.tail(24).copy()
-            if not pd.api.types.is_datetime64_any_dtype(df_24h["time"]):
-                df_24h["time"] = pd.to_datetime(df_24h["time"])
-            df_24h["city"] = city_name
-            all_data.append(df_24h)
+            cols = [c for c in CHART_TITLES if c in df.columns]
+            series = df.set_index(pd.to_datetime(df["time"]))[cols]
+            frames[city_name] = series[~series.index.duplicated()]
     
-    if not all_data:
+    if not frames:
         st.info("Tidak ada data time series untuk perbandingan.")
         return
     
-    # Gabungkan semua data
-    df_combined = pd.concat(all_data, ignore_index=True)
+    wide = pd.concat(frames, axis=1, names=["city", "pollutant"]).swaplevel(axis=1).sort_index(axis=1)
+    pollutants = wide.columns.get_level_values("pollutant").unique()
     
-    # Helper function untuk membuat line chart
-    def make_line_chart(df, param_col, title):
+    # Helper function untuk membuat line chart (view dari frame bersama, tanpa pivot ulang)
+    def make_line_chart(param_col):
         """Membuat line chart untuk parameter tertentu dengan multiple cities"""
-        if param_col not in df.columns:
+        if param_col not in pollutants:
             return False
         
-        try:
-            df_chart = df[["time", "city", param_col]].copy()
-            # Pivot: time sebagai index, city sebagai columns
-            df_pivot = df_chart.pivot(index="time", columns="city", values=param_col)
-            
-            if not df_pivot.empty:
-                st.caption(title)
-                st.line_chart(df_pivot, use_container_width=True)
-                return True
-        except Exception as e:
-            st.warning(f"Error membuat chart untuk {param_col}: {e}")
-        
-        return False
+        df_param = wide[param_col].dropna(how="all")
+        if df_param.empty:
+            return False
+        chart = downsample_frame(df_param)
+        st.caption(_chart_title(CHART_TITLES[param_col], len(chart), len(df_param)))
+        st.line_chart(chart, use_container_width=True)
+        return True
     
     # PM2.5 dan PM10
-    if "pm2_5" in df_combined.columns:
-        make_line_chart(df_combined, "pm2_5", "📊 PM2.5 (µg/m³)")
-    
-    if "pm10" in df_combined.columns:
-        make_line_chart(df_combined, "pm10", "📊 PM10 (µg/m³)")
+    make_line_chart("pm2_5")
+    make_line_chart("pm10")
     
     # NO2, SO2, Ozone, CO dalam 2 kolom
     col1, col2 = st.columns(2)
     
     with col1:
-        if "nitrogen_dioxide" in df_combined.columns:
-            make_line_chart(df_combined, "nitrogen_dioxide", "📊 NO₂ (µg/m³)")
-        
-        if "sulphur_dioxide" in df_combined.columns:
-            make_line_chart(df_combined, "sulphur_dioxide", "📊 SO₂ (µg/m³)")
+        make_line_chart("nitrogen_dioxide")
+        make_line_chart("sulphur_dioxide")
     
     with col2:
-        if "ozone" in df_combined.columns:
-            make_line_chart(df_combined, "ozone", "📊 Ozone (µg/m³)")
-        
-        if "carbon_monoxide" in df_combined.columns:
-            make_line_chart(df_combined, "carbon_monoxide", "📊 CO (µg/m³)")
+        make_line_chart("ozone")
+        make_line_chart("carbon_monoxide")
+
+def _category_style(color):
+    """CSS sel kategori: latar warna resmi skala, teks gelap/terang sesuai kecerahan."""
+    r, g, b = (int(color[i:i + 2], 16) for i in (1, 3, 5))
+    text = "#000000" if 0.299 * r + 0.587 * g + 0.114 * b > 150 else "#ffffff"
+    return f"background-color: {color}; color: {text}"
+
+
+def display_index_summary(indices):
+    """
+    Tabel ISPU & US AQI terkini per lokasi; kolom kategori diwarnai sesuai skala resmi
+    (warna yang sama dengan marker peta).
+
+    Args:
+        indices: ConversationState.indices (air_index.latest_indices)
+    """
+    if indices is None or indices.empty:
+        return
+    table = indices.set_index("area")
+    table.index.name = "Lokasi"
+    styles = {}
+    for scale in air_index.SCALES:
+        lookup = dict(zip(scale.categories, scale.colors))
+        styles[f"{scale.column}_category"] = lambda v, lookup=lookup: _category_style(lookup.get(v, air_index.NO_DATA_COLOR))
+    display = table[[col for scale in air_index.SCALES
+                     for col in (scale.column, f"{scale.column}_category", f"{scale.column}_dominant")]]
+    styler = display.style.format(precision=0, na_rep="-")
+    for col, fn in styles.items():
+        styler = styler.map(fn, subset=[col])
+    st.dataframe(styler, use_container_width=True)
+    st.caption("ISPU: Permen LHK P.14/2020 · US AQI: EPA (PM2.5 revisi 2024) · sub-indeks memakai jam rata-rata resmi tiap polutan")
+
+
+def display_trace_panel(stage_stats, traces):
+    """
+    Panel debug di sidebar: tabel p50/p95 per tahap dan rincian span trace terakhir.
+
+    Args:
+        stage_stats: output tracing.stage_stats()
+        traces: list trace (dict) terbaru, output tracing.recent_traces()
+    """
+    st.subheader("⏱️ Latency per Tahap")
+    if not traces:
+        st.caption("Belum ada trace. Kirim pertanyaan di chat terlebih dahulu.")
+        return
+
+    st.caption(f"Dari {len(traces)} request terakhir")
+    st.dataframe(pd.DataFrame(stage_stats).set_index("stage"), use_container_width=True)
+
+    last = traces[-1]
+    st.caption(f"Request terakhir: {last['name']} — {last['duration_ms']:.0f} ms")
+    spans = pd.DataFrame([
+        {"tahap": sp["name"], "ms": sp["duration_ms"], "status": sp["status"],
+         **{k: v for k, v in sp["attributes"].items() if k in ("cache_hit", "bytes", "prompt_tokens", "response_tokens")}}
+        for sp in sorted(last["spans"], key=lambda sp: sp["start"])
+    ])
+    if not spans.empty:
+        st.dataframe(spans, use_container_width=True, hide_index=True)
+
+    jsonl = "\n".join(json.dumps(t, ensure_ascii=False, default=str) for t in traces)
+    st.download_button("⬇️ Export JSONL", jsonl, file_name="traces.jsonl", mime="application/json")
+
+
+def display_breaker_panel(breakers):
+    """
+    Status circuit breaker per host upstream (open = request gagal cepat / pakai cache).
+
+    Args:
+        breakers: output circuit_breaker.metrics()
+    """
+    st.subheader("🔌 Upstream")
+    if not breakers:
+        st.caption("Belum ada request ke upstream.")
+        return
+    df = pd.DataFrame(breakers).set_index("host")
+    df["state"] = df["state"].map({"closed": "🟢 closed", "open": "🔴 open"}).fillna(df["state"])
+    st.dataframe(df[["state", "error_rate", "calls", "failures", "rejected", "opened", "open_for_s", "last_error"]],
+                 use_container_width=True)
+
+
+def display_llm_panel(metrics):
+    """
+    Status scheduler LLM: slot yang terpakai, antrean per prioritas & waktu tunggu.
+
+    Args:
+        metrics: output LLMScheduler.metrics()
+    """
+    st.subheader("🧠 LLM")
+    fmt = lambda v: "-" if v is None else f"{v:.2f}s"
+    st.caption(
+        f"in-flight {metrics['in_flight']}/{metrics['max_in_flight']} · antre {metrics['queue_depth']} · "
+        f"tunggu p50 {fmt(metrics['wait_p50_s'])} / p95 {fmt(metrics['wait_p95_s'])} · "
+        f"ok {metrics['completed']} / gagal {metrics['failed']} / deadline {metrics['deadline_exceeded']}"
+    )
+    names = {0: "intent", 1: "dekomposisi", 2: "analisis"}
+    priorities = sorted(set(metrics["queue_depth_by_priority"]) | set(metrics["wait_p95_by_priority_s"]))
+    if priorities:
+        st.dataframe(pd.DataFrame([{
+            "prioritas": names.get(p, p),
+            "antre": metrics["queue_depth_by_priority"].get(p, 0),
+            "tunggu_p95_s": metrics["wait_p95_by_priority_s"].get(p),
+        } for p in priorities]), use_container_width=True, hide_index=True)
+
+
+def display_prefetch_panel(status):
+    """
+    Status scheduler prefetch: siklus terakhir & hot list saat ini.
+
+    Args:
+        status: output PrefetchScheduler.status()
+    """
+    st.subheader("🔥 Prefetch")
+    age = status["last_run_age_s"]
+    st.caption(
+        f"{'aktif' if status['running'] else 'berhenti'} · siklus {status['cycles']} · "
+        f"terakhir {'-' if age is None else f'{age // 60} menit lalu'} · "
+        f"ok {status['fetched']} / gagal {status['failed']} / dilewati {status['skipped']}"
+    )
+    if status["hot"]:
+        st.dataframe(pd.DataFrame(status["hot"]), use_container_width=True, hide_index=True)